@@ -0,0 +1,113 @@
+"""Measure bytes sent to clients per chat message, with and without
+coalesced COUNT_UPDATE frames.
+
+N clients join and chat at a steady rate while a few of them keep leaving
+and rejoining. Every byte the clients receive during the chat phase is
+counted and divided by the number of chat messages sent.
+
+    python bench_count_updates.py --clients 50 --messages 500
+"""
+import argparse
+import asyncio
+
+from protocol import encode_frame
+from server import ENGINES
+
+class Client:
+    def __init__(self, username):
+        self.username = username
+        self.writer = None
+        self.task = None
+
+    async def connect(self, host, port, counter):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        await reader.read(1024)  # SERVER_INFO
+        self.writer.write(encode_frame(self.username))
+        await self.writer.drain()
+        self.task = asyncio.create_task(self.pump(reader, counter))
+
+    async def pump(self, reader, counter):
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            counter[0] += len(data)
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+async def drive(server, args):
+    counter = [0]
+    clients = [Client(f"user{i}") for i in range(args.clients)]
+    for client in clients:
+        await client.connect(server.host, server.port, counter)
+    while len(server.clients) < args.clients:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(args.interval + 0.5)
+
+    # Chat phase: round-robin senders, with one client churning every few messages
+    counter[0] = 0
+    delay = 1 / args.rate
+    churners = clients[-args.churners:] if args.churners else []
+    for n in range(args.messages):
+        sender = clients[n % (args.clients - len(churners))]
+        sender.writer.write(encode_frame(f"message {n}"))
+        await sender.writer.drain()
+        if churners and n % args.churn_every == 0:
+            churner = churners[(n // args.churn_every) % len(churners)]
+            await churner.close()
+            await churner.connect(server.host, server.port, counter)
+        await asyncio.sleep(delay)
+
+    # Include the trailing coalesced update
+    await asyncio.sleep(args.interval + 0.5)
+    total = counter[0]
+
+    for client in clients:
+        await client.close()
+    return total
+
+def run(interval, args):
+    server = ENGINES[args.engine](
+        host="127.0.0.1",
+        port=0,
+        server_name="bench-count-updates",
+        max_users=args.clients + 1,
+        count_update_interval=interval,
+        history_size=0,  # replay on rejoin would swamp the count update bytes
+        message_rate=0
+    )
+    server.start_server()
+    if not server.is_running:
+        raise SystemExit("Server failed to start")
+    try:
+        return asyncio.run(drive(server, args))
+    finally:
+        server.stop_server()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=list(ENGINES), default="Threaded")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=200.0, help="chat messages per second")
+    parser.add_argument("--churners", type=int, default=2,
+                        help="clients that keep leaving and rejoining")
+    parser.add_argument("--churn-every", type=int, default=25,
+                        help="reconnect a churner every N messages")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="count update interval for the coalesced run (seconds)")
+    args = parser.parse_args()
+
+    before = run(0, args)
+    after = run(args.interval, args)
+    print(f"{'mode':<22} {'bytes':>12} {'bytes/msg':>12}")
+    print(f"{'every broadcast':<22} {before:>12} {before / args.messages:>12.1f}")
+    print(f"{f'coalesced ({args.interval}s)':<22} {after:>12} {after / args.messages:>12.1f}")
+    if after:
+        print(f"reduction: {before / after:.1f}x")
+
+if __name__ == "__main__":
+    main()
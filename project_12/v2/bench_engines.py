@@ -0,0 +1,139 @@
+"""Load generator comparing the threaded and asyncio ChatServer engines.
+
+Connects N simulated clients to each engine and reports how fast they are
+admitted (connections/sec), then has one client send marker messages and
+measures how long each broadcast takes to reach every other client.
+
+    python bench_engines.py --clients 500 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+from protocol import encode_frame
+from server import ENGINES
+
+MARKER = re.compile(rb"<bench:(\d+)>")
+
+async def pump(reader, arrivals):
+    """Read everything a client receives, recording when each marker shows up"""
+    buffer = b""
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        buffer += data
+        now = time.perf_counter()
+        end = 0
+        for match in MARKER.finditer(buffer):
+            arrivals[int(match.group(1))].append(now)
+            end = match.end()
+        # Keep a short tail in case a marker is split across reads
+        buffer = buffer[max(end, len(buffer) - 32):]
+
+async def connect_client(host, port, username, arrivals):
+    reader, writer = await asyncio.open_connection(host, port)
+    await reader.read(1024)  # SERVER_INFO
+    writer.write(encode_frame(username))
+    await writer.drain()
+    task = asyncio.create_task(pump(reader, arrivals))
+    return writer, task
+
+async def wait_for(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+async def drive(server, args):
+    arrivals = defaultdict(list)
+
+    started = time.perf_counter()
+    clients = await asyncio.gather(*(
+        connect_client(server.host, server.port, f"bench{i}", arrivals)
+        for i in range(args.clients)
+    ))
+    await wait_for(lambda: len(server.clients) >= args.clients, args.timeout)
+    connect_elapsed = time.perf_counter() - started
+    joined = len(server.clients)
+
+    # Let the join/COUNT_UPDATE storm settle before timing broadcasts
+    await asyncio.sleep(args.settle)
+
+    sender = clients[0][0]
+    receivers = args.clients - 1
+    latencies = []
+    for round_no in range(args.rounds):
+        sent = time.perf_counter()
+        sender.write(encode_frame(f"<bench:{round_no}>"))
+        await sender.drain()
+        await wait_for(lambda: len(arrivals[round_no]) >= receivers, args.timeout)
+        latencies.extend(t - sent for t in arrivals[round_no])
+        await asyncio.sleep(args.interval)
+
+    for writer, task in clients:
+        writer.close()
+        task.cancel()
+    await asyncio.gather(*(task for _, task in clients), return_exceptions=True)
+
+    return {
+        "joined": joined,
+        "connections_per_sec": joined / connect_elapsed if connect_elapsed else 0,
+        "deliveries": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=float('nan')) * 1000
+    }
+
+def run_engine(name, args):
+    server = ENGINES[name](
+        host=args.host,
+        port=0,
+        server_name=f"bench-{name.lower()}",
+        max_users=args.clients + 1,
+        history_path=os.path.join(tempfile.mkdtemp(), "history.db"),
+        message_rate=0  # The sender's pace is set by --interval
+    )
+    server.start_server()
+    if not server.is_running:
+        raise SystemExit(f"{name} engine failed to start")
+    try:
+        return asyncio.run(drive(server, args))
+    finally:
+        server.stop_server()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=list(ENGINES), action="append",
+                        help="engine to benchmark (default: all)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05,
+                        help="pause between broadcast rounds (seconds)")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="pause after all clients joined (seconds)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    print(f"{'engine':<10} {'joined':>7} {'conn/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in args.engine or list(ENGINES):
+        result = run_engine(name, args)
+        print(f"{name:<10} {result['joined']:>7} {result['connections_per_sec']:>9.1f} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['max_ms']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Compare the monitor relays: throughput and round-trip latency.
+
+An echo server stands in for the chat server. Like the chat server, it
+greets every connection with a SERVER_INFO frame, which the upstream pool
+checks for. For each relay (and a direct connection as the baseline),
+clients stream framed messages through it and read the echo back, then a
+single client measures the round trip of small messages one at a time. The
+monitor logs every message to a file, the same way ChatMonitor does.
+
+    python bench_relay.py --clients 8 --mb 16 --pings 2000
+"""
+import argparse
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from protocol import encode_frame
+from relay import RELAYS
+from upstreams import UpstreamPool, GREETING
+
+GREETING_FRAME = encode_frame(GREETING + "{}")
+
+class EchoServer:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(socket.SOMAXCONN)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.echo, args=(conn,), daemon=True).start()
+
+    def echo(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn:
+            try:
+                conn.sendall(GREETING_FRAME)
+            except OSError:
+                return
+            while True:
+                try:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    conn.sendall(data)
+                except OSError:
+                    break
+
+    def close(self):
+        self.sock.close()
+
+class LoggingMonitor:
+    """Does per message what ChatMonitor.log_message does, minus the Tk insert"""
+    def __init__(self, path):
+        self.path = path
+        self.messages = 0
+
+    def on_open(self, conn_id, peer):
+        pass
+
+    def on_message(self, conn_id, direction, message):
+        self.messages += 1
+        with open(self.path, "a") as f:
+            json.dump({"timestamp": time.strftime("%H:%M:%S"), "type": direction,
+                       "message": f"{conn_id} {direction} {message}"}, f)
+            f.write("\n")
+
+    def on_overflow(self, conn_id, direction):
+        pass
+
+    def on_close(self, conn_id, error):
+        pass
+
+def connect(port):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Skip the greeting; everything after it is echoed data
+    received = 0
+    while received < len(GREETING_FRAME):
+        data = sock.recv(len(GREETING_FRAME) - received)
+        if not data:
+            raise ConnectionError("no greeting from the server")
+        received += len(data)
+    return sock
+
+def stream(port, total, frame):
+    """Send total bytes of frames and read all of them back"""
+    sock = connect(port)
+    count = total // len(frame)
+    burst = frame * 16
+
+    def send():
+        sent = 0
+        while sent < count:
+            n = min(16, count - sent)
+            sock.sendall(burst if n == 16 else frame * n)
+            sent += n
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    expected = count * len(frame)
+    received = 0
+    buffer = bytearray(65536)
+    while received < expected:
+        n = sock.recv_into(buffer)
+        if not n:
+            raise ConnectionError("relay closed the connection")
+        received += n
+    sender.join()
+    sock.close()
+
+def throughput(port, args):
+    frame = encode_frame("x" * args.size)
+    per_client = args.mb * 1024 * 1024 // args.clients
+    threads = [threading.Thread(target=stream, args=(port, per_client, frame))
+               for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    moved = 2 * args.clients * (per_client // len(frame)) * len(frame)  # both directions
+    return moved / elapsed / (1024 * 1024)
+
+def latency(port, args):
+    sock = connect(port)
+    frame = encode_frame("ping")
+    times = []
+    for _ in range(args.pings):
+        start = time.perf_counter()
+        sock.sendall(frame)
+        received = 0
+        while received < len(frame):
+            received += len(sock.recv(4096))
+        times.append(time.perf_counter() - start)
+    sock.close()
+    times.sort()
+    return times[len(times) // 2] * 1e6, times[int(len(times) * 0.99)] * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--relay", choices=list(RELAYS), help="only benchmark this relay")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--mb", type=int, default=16, help="MB sent through the relay per run")
+    parser.add_argument("--size", type=int, default=200, help="message size in bytes")
+    parser.add_argument("--pings", type=int, default=2000)
+    parser.add_argument("--no-monitor", action="store_true", help="relay without logging")
+    args = parser.parse_args()
+
+    echo = EchoServer()
+    log_dir = tempfile.mkdtemp()
+    print(f"{'relay':<10} {'MB/s':>9} {'p50 us':>9} {'p99 us':>9} {'logged':>9}")
+    rows = [("direct", None)] + [(name, cls) for name, cls in RELAYS.items()
+                                 if not args.relay or name == args.relay]
+    for name, relay_class in rows:
+        monitor = None
+        port = echo.port
+        relay = None
+        if relay_class:
+            monitor = None if args.no_monitor else LoggingMonitor(os.path.join(log_dir, f"{name}.log"))
+            relay = relay_class("127.0.0.1", 0, UpstreamPool([("127.0.0.1", echo.port)]),
+                                monitor=monitor)
+            port = relay.start()
+        try:
+            # Latency first, so it isn't measured while the tap drains the stream's backlog
+            p50, p99 = latency(port, args)
+            mb_per_s = throughput(port, args)
+        finally:
+            if relay:
+                relay.stop()
+        logged = monitor.messages if monitor else 0
+        print(f"{name:<10} {mb_per_s:>9.1f} {p50:>9.0f} {p99:>9.0f} {logged:>9}")
+    echo.close()
+
+if __name__ == "__main__":
+    main()
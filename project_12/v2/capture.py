@@ -0,0 +1,269 @@
+"""Binary traffic captures for the ChatMonitor proxy.
+
+CaptureWriter.write() only encodes the record and appends it to an
+in-memory batch. A background thread writes the batch when it reaches
+flush_bytes or every flush_interval seconds, and starts a new file once
+the current one reaches max_bytes.
+
+A capture file starts with MAGIC and then holds records back to back:
+
+    uint32 length | float64 time | uint8 direction | uint32 conn_id
+                  | uint16 user length | user | message      (UTF-8)
+
+Next to each file, <name>.idx holds a (record number, time, offset) entry
+for every index_every-th record, so a reader can jump close to a point in
+time or to a record number without scanning the file from the start.
+
+Reader tool:
+
+    python capture.py data/captures                    # every capture file, in order
+    python capture.py capture_x.cap --user alice --direction client
+    python capture.py capture_x.cap --since "2024-05-01 12:00:00" --replay --speed 10
+"""
+import argparse
+import glob
+import os
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+MAGIC = b"CHATCAP1"
+LENGTH = struct.Struct("!I")
+RECORD = struct.Struct("!dBIH")  # time, direction, conn_id, user length
+INDEX_ENTRY = struct.Struct("!QdQ")  # record number, time, offset
+
+# Direction marks used by ChatMonitor.log_message, stored as one byte
+DIRECTIONS = ["", "→", "←", "!", "X"]
+DIRECTION_NAMES = {"client": "→", "server": "←", "system": "!", "error": "X"}
+
+Record = namedtuple("Record", "time direction conn_id user message")
+
+def encode_record(timestamp, direction, conn_id, user, message):
+    user = user.encode()
+    message = message.encode()
+    body_length = RECORD.size + len(user) + len(message)
+    return b"".join((
+        LENGTH.pack(body_length),
+        RECORD.pack(timestamp, DIRECTIONS.index(direction) if direction in DIRECTIONS else 0,
+                    conn_id, len(user)),
+        user,
+        message
+    ))
+
+class CaptureWriter:
+    def __init__(self, directory, prefix="capture", max_bytes=16 * 1024 * 1024,
+                 flush_bytes=64 * 1024, flush_interval=1.0, index_every=64):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.index_every = index_every
+        self.condition = threading.Condition()
+        self.batch = []          # (timestamp, encoded record)
+        self.batch_bytes = 0
+        self.closing = False
+        self.file = None
+        self.index = None
+        self.file_bytes = 0
+        self.file_records = 0
+        self.file_number = 0
+        self.path = None
+        self.thread = threading.Thread(target=self.write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, direction, message, user="", conn_id=0, timestamp=None):
+        """Queue one record; never touches the disk"""
+        timestamp = time.time() if timestamp is None else timestamp
+        record = encode_record(timestamp, direction, conn_id, user, message)
+        with self.condition:
+            if self.closing:
+                return
+            self.batch.append((timestamp, record))
+            self.batch_bytes += len(record)
+            if self.batch_bytes >= self.flush_bytes:
+                self.condition.notify()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                if not self.batch and not self.closing:
+                    self.condition.wait(self.flush_interval)
+                batch, self.batch, self.batch_bytes = self.batch, [], 0
+                closing = self.closing
+            if batch:
+                try:
+                    self.write_batch(batch)
+                except OSError:
+                    pass  # Capturing is best effort; keep relaying
+            if closing and not self.batch:
+                break
+        self.close_file()
+
+    def write_batch(self, batch):
+        chunk = []
+        index_entries = []
+        for timestamp, record in batch:
+            if self.file is None or (self.file_bytes + len(record) > self.max_bytes and self.file_records):
+                self.write_out(chunk, index_entries)
+                chunk, index_entries = [], []
+                self.open_file()
+            if self.file_records % self.index_every == 0:
+                index_entries.append(INDEX_ENTRY.pack(self.file_records, timestamp, self.file_bytes))
+            chunk.append(record)
+            self.file_bytes += len(record)
+            self.file_records += 1
+        self.write_out(chunk, index_entries)
+
+    def write_out(self, chunk, index_entries):
+        # One write per file per batch
+        if chunk:
+            self.file.write(b"".join(chunk))
+            self.file.flush()
+        if index_entries:
+            self.index.write(b"".join(index_entries))
+            self.index.flush()
+
+    def open_file(self):
+        self.close_file()
+        self.file_number += 1
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{self.file_number:03d}.cap")
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC)
+        self.index = open(self.path + ".idx", "wb")
+        self.file_bytes = len(MAGIC)
+        self.file_records = 0
+
+    def close_file(self):
+        if self.file:
+            self.file.close()
+            self.index.close()
+            self.file = self.index = None
+
+    def close(self):
+        """Write everything still batched and close the current file"""
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join(timeout=5)
+
+class CaptureReader:
+    def __init__(self, path):
+        self.path = path
+        self.index = []  # (record number, time, offset), in file order
+        try:
+            with open(path + ".idx", "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            self.index = list(INDEX_ENTRY.iter_unpack(data[:usable]))
+        except FileNotFoundError:
+            pass  # Still readable, just without seeking
+
+    def seek_offset(self, since=None, start_record=None):
+        """(record number, offset) of the last indexed record at or before the target"""
+        if since is not None:
+            keys = [entry[1] for entry in self.index]
+            target = since
+        elif start_record is not None:
+            keys = [entry[0] for entry in self.index]
+            target = start_record
+        else:
+            return 0, len(MAGIC)
+        position = bisect_right(keys, target) - 1
+        if position < 0:
+            return 0, len(MAGIC)
+        record_number, _, offset = self.index[position]
+        return record_number, offset
+
+    def records(self, since=None, until=None, user=None, direction=None, start_record=None):
+        """Yield Records matching the filters, using the index to skip ahead"""
+        record_number, offset = self.seek_offset(since, start_record)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a capture file")
+            f.seek(offset)
+            while True:
+                header = f.read(LENGTH.size)
+                if len(header) < LENGTH.size:
+                    return
+                (length,) = LENGTH.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    return  # Partly written record at the end of a live capture
+                number = record_number
+                record_number += 1
+                if start_record is not None and number < start_record:
+                    continue
+                timestamp, direction_code, conn_id, user_length = RECORD.unpack_from(body)
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp > until:
+                    return
+                mark = DIRECTIONS[direction_code] if direction_code < len(DIRECTIONS) else ""
+                if direction is not None and mark != direction:
+                    continue
+                record_user = body[RECORD.size:RECORD.size + user_length].decode()
+                if user is not None and record_user != user:
+                    continue
+                message = body[RECORD.size + user_length:].decode()
+                yield Record(timestamp, mark, conn_id, record_user, message)
+
+def capture_files(paths):
+    """Expand directories into their .cap files, oldest first"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.cap"))))
+        else:
+            files.append(path)
+    return files
+
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def format_record(record):
+    timestamp = datetime.fromtimestamp(record.time).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    user = f" {record.user}" if record.user else ""
+    return f"[{timestamp}] #{record.conn_id}{user} {record.direction} {record.message}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or replay ChatMonitor capture files")
+    parser.add_argument("paths", nargs="+", help="capture files or directories of them")
+    parser.add_argument("--user", help="only records of this user")
+    parser.add_argument("--direction", choices=list(DIRECTION_NAMES),
+                        help="client (→ server), server (→ client), system or error")
+    parser.add_argument("--since", type=parse_time, help="start time (epoch or ISO date/time)")
+    parser.add_argument("--until", type=parse_time, help="end time (epoch or ISO date/time)")
+    parser.add_argument("--start-record", type=int, help="start at this record number (single file)")
+    parser.add_argument("--replay", action="store_true", help="print with the original timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor")
+    args = parser.parse_args()
+
+    direction = DIRECTION_NAMES.get(args.direction)
+    previous = None
+    for path in capture_files(args.paths):
+        reader = CaptureReader(path)
+        for record in reader.records(args.since, args.until, args.user, direction, args.start_record):
+            if args.replay and previous is not None:
+                delay = (record.time - previous) / args.speed
+                if delay > 0:
+                    time.sleep(delay)
+            previous = record.time
+            try:
+                print(format_record(record))
+            except BrokenPipeError:
+                return
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Thread-safe registry of connected clients.
+
+Keeps a connection -> username map and a username -> connections index
+side by side under one lock, so kicking or blocking by name is O(1)
+instead of a scan over every client. Readers never hold the lock while
+they iterate: broadcast walks an immutable snapshot that is rebuilt only
+after the membership has changed (copy-on-write), so a client leaving in
+another thread can't raise "dictionary changed size during iteration".
+"""
+import threading
+
+class ClientRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_client = {}
+        self.by_name = {}
+        self._snapshot = ()
+
+    def add(self, client, username):
+        with self.lock:
+            self.by_client[client] = username
+            self.by_name.setdefault(username, set()).add(client)
+            self._snapshot = None
+
+    def remove(self, client):
+        """Remove one connection; returns its username, or None if it wasn't registered"""
+        with self.lock:
+            username = self.by_client.pop(client, None)
+            if username is not None:
+                self._discard_name(username, client)
+                self._snapshot = None
+            return username
+
+    def remove_user(self, username):
+        """Remove every connection using this name and return them"""
+        with self.lock:
+            clients = self.by_name.pop(username, set())
+            for client in clients:
+                del self.by_client[client]
+            if clients:
+                self._snapshot = None
+            return list(clients)
+
+    def _discard_name(self, username, client):
+        clients = self.by_name.get(username)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self.by_name[username]
+
+    def clear(self):
+        with self.lock:
+            self.by_client.clear()
+            self.by_name.clear()
+            self._snapshot = ()
+
+    def snapshot(self):
+        """Immutable tuple of (client, username) pairs, safe to iterate from any thread"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.lock:
+                if self._snapshot is None:
+                    self._snapshot = tuple(self.by_client.items())
+                snapshot = self._snapshot
+        return snapshot
+
+    def has_user(self, username):
+        return username in self.by_name
+
+    def clients_for(self, username):
+        with self.lock:
+            return list(self.by_name.get(username, ()))
+
+    def usernames(self):
+        """Distinct usernames currently connected"""
+        with self.lock:
+            return list(self.by_name)
+
+    # Dict-like read access used by the GUI and the engines
+    def items(self):
+        return self.snapshot()
+
+    def values(self):
+        return [username for _, username in self.snapshot()]
+
+    def __iter__(self):
+        return iter([client for client, _ in self.snapshot()])
+
+    def __contains__(self, client):
+        return client in self.by_client
+
+    def __len__(self):
+        return len(self.by_client)
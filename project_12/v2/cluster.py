@@ -0,0 +1,275 @@
+"""Run ChatServer as several shard processes that act as one server.
+
+One ChatServer process is held to a single core by the GIL. A cluster
+starts --shards server processes instead:
+- where the platform has SO_REUSEPORT (Linux, BSD, macOS) they all listen
+  on the same port and the kernel spreads new connections over them;
+- with --separate-ports (or without SO_REUSEPORT) shard i listens on
+  port + i, and the monitor proxy (hack.py) balances over them; paste the
+  printed "Forward to:" list into it.
+
+Shards are tied together by a bus of multiprocessing queues, one inbox per
+shard. A shard publishes every broadcast it makes (chat messages, join and
+leave notices) and every block, unblock and saved resume session; the
+others apply them to their own clients. Message ids stay global: all shards
+write to one history database and take ids from one shared counter.
+
+Each shard enforces --max-users on its own, and COUNT_UPDATE and /rooms
+report that shard's clients.
+
+    python cluster.py --shards 4 --port 9999
+    python cluster.py --shards 4 --port 9999 --engine Asyncio --metrics-port 9100
+
+The console takes: say <text>, kick <user>, block <user>, unblock <user>,
+stats and quit.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import re
+import socket
+import threading
+
+from server import ENGINES, DATA_DIR
+
+class ShardBus:
+    """One shard's end of the bus: its own inbox, and every shard's to publish to.
+    control(event) sees incoming events first and returns True for those it handled"""
+    def __init__(self, shard, inboxes, control=None):
+        self.shard = shard
+        self.inboxes = inboxes
+        self.control = control
+        self.thread = None
+
+    def publish(self, *event):
+        """Send an event to every other shard; never blocks"""
+        for index, inbox in enumerate(self.inboxes):
+            if index != self.shard:
+                inbox.put(event)
+
+    def start(self, handler):
+        """Call handler(event) for each incoming event, on a thread of its own"""
+        self.thread = threading.Thread(target=self.receive_loop, args=(handler,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def receive_loop(self, handler):
+        inbox = self.inboxes[self.shard]
+        while True:
+            event = inbox.get()
+            if event is None:
+                break
+            try:
+                if not (self.control and self.control(event)):
+                    handler(event)
+            except:
+                pass
+
+    def stop(self):
+        if self.thread and self.thread is not threading.current_thread():
+            self.inboxes[self.shard].put(None)
+            self.thread.join(timeout=5)
+        self.thread = None
+
+def run_shard(shard, options, inboxes, replies, history_ids):
+    """Shard process: serve until the console says stop"""
+    stopped = threading.Event()
+    server = None
+
+    def control(event):
+        # Cluster control stays here; everything else goes to the server
+        if event[0] == "stop":
+            stopped.set()
+        elif event[0] == "stats":
+            replies.put((shard, {
+                "port": server.port,
+                "clients": len(server.clients),
+                "rooms": server.rooms.room_counts(),
+                "blocked": sorted(server.blocked_users),
+                "queues": server.queue_status()
+            }))
+        else:
+            return False
+        return True
+
+    # The server starts the bus once it is listening
+    bus = ShardBus(shard, inboxes, control)
+    port = options["port"]
+    if port and not options["reuse_port"]:
+        port += shard
+    metrics_port = options["metrics_port"]
+    server = ENGINES[options["engine"]](
+        host=options["host"],
+        port=port,
+        server_name=options["name"] if options["reuse_port"] else f"{options['name']} [{shard + 1}]",
+        max_users=options["max_users"],
+        history_size=options["history"],
+        history_path=options["history_path"],
+        history_ids=history_ids,
+        metrics_port=metrics_port + shard if metrics_port is not None else None,
+        bus=bus,
+        reuse_port=options["reuse_port"],
+        # Sharing a port, the shards are one entry in the server list
+        register=shard == 0 or not options["reuse_port"]
+    )
+    server.start_server()
+    if not server.is_running:
+        replies.put((shard, {"error": f"shard {shard + 1} failed to start on port {server.port}"}))
+        return
+    replies.put((shard, {"port": server.port}))
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass  # The console stops everyone
+    server.stop_server()
+    replies.put((shard, "stopped"))
+
+class Cluster:
+    """The shard processes and the console's end of their bus"""
+    def __init__(self, options, shards):
+        self.shards = shards
+        self.inboxes = [multiprocessing.Queue() for _ in range(shards)]
+        self.replies = multiprocessing.Queue()
+        # Next history id, shared by all shards
+        self.history_ids = multiprocessing.Value("q", 0)
+        self.processes = [
+            multiprocessing.Process(
+                target=run_shard,
+                args=(shard, options, self.inboxes, self.replies, self.history_ids)
+            )
+            for shard in range(shards)
+        ]
+
+    def start(self, timeout=30):
+        """Start every shard; returns their ports"""
+        for process in self.processes:
+            process.daemon = True
+            process.start()
+        ports = {}
+        errors = []
+        for _ in self.processes:
+            try:
+                shard, ready = self.replies.get(timeout=timeout)
+            except queue.Empty:
+                errors.append("a shard did not start in time")
+                break
+            if "error" in ready:
+                errors.append(ready["error"])
+            else:
+                ports[shard] = ready["port"]
+        if errors:
+            self.stop()
+            raise RuntimeError("; ".join(errors))
+        return [ports[shard] for shard in range(self.shards)]
+
+    def publish(self, *event):
+        """Send an event to every shard"""
+        for inbox in self.inboxes:
+            inbox.put(event)
+
+    def stats(self, timeout=5):
+        self.publish("stats")
+        results = {}
+        try:
+            while len(results) < self.shards:
+                shard, stats = self.replies.get(timeout=timeout)
+                if isinstance(stats, dict):
+                    results[shard] = stats
+        except queue.Empty:
+            pass
+        return [results.get(shard) for shard in range(self.shards)]
+
+    def stop(self, timeout=10):
+        self.publish("stop")
+        for process in self.processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+def console(cluster):
+    """Cluster-wide moderation and stats from stdin"""
+    while True:
+        try:
+            line = input("cluster> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            break
+        command, _, argument = line.partition(" ")
+        argument = argument.strip()
+        if command == "quit":
+            break
+        elif command == "say" and argument:
+            cluster.publish("broadcast", f"[Server Info: {argument}]", None, None)
+        elif command == "kick" and argument:
+            cluster.publish("kick", argument)
+        elif command == "block" and argument:
+            cluster.publish("block", argument)
+        elif command == "unblock" and argument:
+            cluster.publish("unblock", argument)
+            cluster.publish("broadcast", f"[System: {argument} has been unblocked]", None, None)
+        elif command == "stats":
+            total = 0
+            for shard, stats in enumerate(cluster.stats()):
+                if stats is None:
+                    print(f"  shard {shard + 1}: no answer")
+                    continue
+                total += stats["clients"]
+                print(f"  shard {shard + 1} (port {stats['port']}): {stats['clients']} clients, "
+                      f"queued {stats['queues']['total_depth']}, dropped {stats['queues']['frames_dropped']}")
+            print(f"  total: {total} clients")
+        elif command:
+            print("Commands: say <text>, kick <user>, block <user>, unblock <user>, stats, quit")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999, help="0 picks a free port")
+    parser.add_argument("--name", default="Main Server")
+    parser.add_argument("--engine", choices=list(ENGINES), default="Threaded")
+    parser.add_argument("--max-users", type=int, default=1000, help="per shard")
+    parser.add_argument("--history", type=int, default=50, help="history size (0 disables it)")
+    parser.add_argument("--metrics-port", type=int, help="shard i serves /metrics on this port + i")
+    parser.add_argument("--separate-ports", action="store_true",
+                        help="shard i listens on port + i, for the monitor proxy to balance")
+    args = parser.parse_args()
+
+    reuse_port = hasattr(socket, "SO_REUSEPORT") and not args.separate_ports
+    port = args.port
+    if port == 0 and reuse_port:
+        # Every shard has to bind the same port
+        port = free_port(args.host)
+    safe_name = re.sub(r"[^A-Za-z0-9_-]+", "_", args.name)
+    cluster = Cluster({
+        "host": args.host,
+        "port": port,
+        "name": args.name,
+        "engine": args.engine,
+        "max_users": args.max_users,
+        "history": args.history,
+        "history_path": os.path.join(DATA_DIR, f"history_{safe_name}.db"),
+        "metrics_port": args.metrics_port,
+        "reuse_port": reuse_port
+    }, args.shards)
+    try:
+        ports = cluster.start()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+    if reuse_port:
+        print(f"{args.shards} shards sharing {args.host}:{ports[0]}")
+    else:
+        print(f"{args.shards} shards on ports {', '.join(map(str, ports))}")
+        print("Forward to: " + ", ".join(f"{args.host}:{port}" for port in ports))
+    try:
+        console(cluster)
+    finally:
+        cluster.stop()
+
+if __name__ == "__main__":
+    main()
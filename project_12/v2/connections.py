@@ -0,0 +1,198 @@
+"""Client connections with bounded outbound queues.
+
+Broadcasting never writes to a socket directly: it pushes an already
+encoded frame onto each client's queue and moves on, and a per-client
+writer drains the queue in batches. A slow client can therefore only
+back up its own queue; when that queue is full the server either drops
+the frame or disconnects the client, depending on the configured policy.
+"""
+import asyncio
+import socket
+import threading
+from collections import deque
+
+SLOW_CONSUMER_POLICIES = ("drop", "disconnect")
+
+class QueueStats:
+    """Server-wide counters shared by all connections"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_queued = 0
+        self.bytes_queued = 0
+        self.frames_dropped = 0
+        self.slow_disconnects = 0
+
+    def record_queued(self, size):
+        with self.lock:
+            self.frames_queued += 1
+            self.bytes_queued += size
+
+    def record_dropped(self, disconnected):
+        with self.lock:
+            self.frames_dropped += 1
+            if disconnected:
+                self.slow_disconnects += 1
+
+class BaseConnection:
+    """Queueing and slow-consumer policy shared by both engines"""
+    def __init__(self, stats, max_queue=256, policy="drop"):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.stats = stats
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()
+        self.closing = False
+        self.dropped_frames = 0
+        self.max_depth = 0
+        self.sequenced = False  # Sent HELLO: gets MSG/ACK frames with message ids
+        self.limiter = None     # TokenBucket for frames from this client
+        self.decoder = None     # Its FrameDecoder, for the bytes received metric
+
+    @property
+    def queue_depth(self):
+        return len(self.queue)
+
+    def enqueue(self, data):
+        """Queue an encoded frame for the writer; returns False if it was dropped"""
+        if self.closing:
+            return False
+        if len(self.queue) >= self.max_queue:
+            self.dropped_frames += 1
+            disconnect = self.policy == "disconnect"
+            self.stats.record_dropped(disconnect)
+            if disconnect:
+                self.abort()
+            return False
+        self.queue.append(data)
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.stats.record_queued(len(data))
+        self.wake_writer()
+        return True
+
+    def take_batch(self):
+        """Pop everything queued so far as one buffer for a single write"""
+        batch = b"".join(self.queue)
+        self.queue.clear()
+        return batch
+
+    def wake_writer(self):
+        raise NotImplementedError
+
+    def close(self):
+        """Close once everything already queued has been written"""
+        raise NotImplementedError
+
+    def abort(self):
+        """Close immediately, discarding anything still queued"""
+        raise NotImplementedError
+
+class ClientConnection(BaseConnection):
+    """Threaded-engine connection: blocking reads by the handler thread,
+    writes by a dedicated writer thread"""
+    def __init__(self, sock, stats, max_queue=256, policy="drop"):
+        super().__init__(stats, max_queue, policy)
+        self.sock = sock
+        self.condition = threading.Condition()
+        self.writer_thread = threading.Thread(target=self.write_loop)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def recv(self, bufsize):
+        return self.sock.recv(bufsize)
+
+    def enqueue(self, data):
+        with self.condition:
+            return super().enqueue(data)
+
+    def wake_writer(self):
+        # Called with the condition held
+        self.condition.notify()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closing:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                batch = self.take_batch()
+            try:
+                self.sock.sendall(batch)
+            except OSError:
+                break
+        self.shutdown_socket()
+
+    def shutdown_socket(self):
+        # shutdown() also wakes the handler thread blocked in recv()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+
+    def abort(self):
+        with self.condition:
+            self.closing = True
+            self.queue.clear()
+            self.condition.notify()
+        self.shutdown_socket()
+
+class AsyncClientConnection(BaseConnection):
+    """Asyncio-engine connection drained by a writer task.
+
+    Only used from the event loop thread.
+    """
+    def __init__(self, writer, stats, max_queue=256, policy="drop"):
+        super().__init__(stats, max_queue, policy)
+        self.writer = writer
+        self.ready = asyncio.Event()
+        self.writer_task = asyncio.get_running_loop().create_task(self.write_loop())
+
+    def enqueue(self, data):
+        # Write straight into the transport while it is below its high-water
+        # mark; only queue (and apply the policy) once the client is backed up
+        if self.writer.is_closing():
+            return False  # Lost connection; the handler will clean up on EOF
+        if not self.closing and not self.queue and self.transport_has_room():
+            self.writer.write(data)
+            self.stats.record_queued(len(data))
+            return True
+        return super().enqueue(data)
+
+    def transport_has_room(self):
+        transport = self.writer.transport
+        return transport.get_write_buffer_size() < transport.get_write_buffer_limits()[1]
+
+    def wake_writer(self):
+        self.ready.set()
+
+    async def write_loop(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                if self.queue:
+                    self.writer.write(self.take_batch())
+                    await self.writer.drain()
+                if self.closing and not self.queue:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.writer.close()
+
+    def close(self):
+        self.closing = True
+        self.ready.set()
+
+    def abort(self):
+        self.closing = True
+        self.queue.clear()
+        self.writer.transport.abort()
+        self.ready.set()
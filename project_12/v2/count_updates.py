@@ -0,0 +1,55 @@
+"""Coalesced COUNT_UPDATE scheduling.
+
+Every join and leave used to push a COUNT_UPDATE to every client right
+away, and so did every chat message. With N users chatting that is O(N^2)
+extra frames per second. The scheduler below sends at most one update per
+interval and only when the user count has actually changed since the last
+one it sent: the first change goes out immediately, later changes within
+the interval are folded into a single trailing update.
+"""
+import threading
+import time
+
+class CountUpdateScheduler:
+    def __init__(self, get_count, send_update, call_later, interval=1.0):
+        """
+        get_count: returns the current user count
+        send_update: called with the count when an update is due
+        call_later: call_later(delay, callback) -> handle with cancel(),
+                    so each engine can run the trailing update on its own thread
+        """
+        self.get_count = get_count
+        self.send_update = send_update
+        self.call_later = call_later
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = None
+        self.last_sent = float('-inf')
+        self.last_count = 0
+
+    def request_update(self):
+        """Note that membership may have changed; cheap to call on every broadcast"""
+        with self.lock:
+            if self.pending or self.get_count() == self.last_count:
+                return
+            delay = self.last_sent + self.interval - time.monotonic()
+            if delay > 0:
+                self.pending = self.call_later(delay, self.flush)
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.pending = None
+            self.last_sent = time.monotonic()
+            count = self.get_count()
+            if count == self.last_count:
+                return
+            self.last_count = count
+        self.send_update(count)
+
+    def cancel(self):
+        with self.lock:
+            if self.pending:
+                self.pending.cancel()
+                self.pending = None
@@ -1,12 +1,19 @@
-import socket
-import threading
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, colorchooser, font
 from datetime import datetime
+import queue
 from ttkthemes import ThemedTk
-import json
+from relay import RELAYS, CLIENT_TO_SERVER
+from capture import CaptureWriter
+from upstreams import UpstreamPool, parse_upstreams
+from sessions import parse_hello
 import os
 
+UPSTREAM_REFRESH_MS = 2000
+LOG_MAX_LINES = 2000      # Lines kept in the log window; every message is in the capture
+LOG_FLUSH_MS = 100        # How often the GUI drains queued log lines
+LOG_BATCH_SIZE = 500      # Most lines inserted per drain, so the GUI stays responsive
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -34,13 +41,21 @@ class ChatMonitor:
         
         # Monitor settings
         self.proxy_port = 9998
-        self.server_port = 9999
+        self.upstreams = [('127.0.0.1', 9999)]
         self.is_running = False
-        self.connections = {}
-        self.usernames = {}
+        self.relay = None
+        self.upstreams_job = None  # Pending update_upstreams timer
+        self.usernames = {}      # conn_id -> username, once the first frame arrives (tap thread)
+        self.seen_server = set() # conn_ids whose SERVER_INFO frame has passed
+        self.users_shown = {}    # conn_id -> username in the users list (Tk thread)
+        # Traffic is captured to data/captures; read it back with capture.py
+        self.capture = CaptureWriter(os.path.join(DATA_DIR, 'captures'))
+        # Relay threads queue log lines and joins/leaves; flush_log applies them on the Tk thread
+        self.log_queue = queue.SimpleQueue()
         
         self.create_gui()
         self.create_menu()
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
         
     def create_menu(self):
         menubar = tk.Menu(self.root)
@@ -156,10 +171,23 @@ class ChatMonitor:
         self.proxy_port_entry.insert(0, "9998")
         self.proxy_port_entry.pack(side=tk.LEFT, padx=5)
         
-        ttk.Label(port_frame, text="Forward to port:").pack(side=tk.LEFT, padx=10)
-        self.server_port_entry = ttk.Entry(port_frame, width=6)
-        self.server_port_entry.insert(0, "9999")
-        self.server_port_entry.pack(side=tk.LEFT, padx=5)
+        # Comma separated; a bare port means this machine
+        ttk.Label(port_frame, text="Forward to:").pack(side=tk.LEFT, padx=10)
+        self.upstreams_entry = ttk.Entry(port_frame, width=24)
+        self.upstreams_entry.insert(0, "9999")
+        self.upstreams_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Selector: one loop, logging off the forwarding path. Threaded: the old relay
+        ttk.Label(port_frame, text="Relay:").pack(side=tk.LEFT, padx=10)
+        self.relay_var = tk.StringVar(value="Selector")
+        self.relay_combo = ttk.Combobox(
+            port_frame,
+            textvariable=self.relay_var,
+            values=list(RELAYS),
+            state='readonly',
+            width=10
+        )
+        self.relay_combo.pack(side=tk.LEFT, padx=5)
         
         # Control buttons
         btn_frame = ttk.Frame(controls)
@@ -185,171 +213,171 @@ class ChatMonitor:
         self.users_list = tk.Listbox(users_frame, height=5)
         self.users_list.pack(fill=tk.X)
         
-    def log_message(self, message, direction=""):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        prefix = ""
+        # Upstream servers: health, load and connect latency
+        upstreams_frame = ttk.LabelFrame(container, text="Upstream Servers", padding=5)
+        upstreams_frame.pack(fill=tk.X, pady=(10, 0))
         
-        if self.show_timestamps.get():
-            prefix += f"[{timestamp}] "
-        if self.show_directions.get() and direction:
-            prefix += f"{direction} "
-            
-        tag = {
-            "→": "client",
-            "←": "server",
-            "!": "system",
-            "X": "error"
-        }.get(direction, "")
+        self.upstreams_list = tk.Listbox(upstreams_frame, height=3, font=self.fonts['log'])
+        self.upstreams_list.pack(fill=tk.X)
         
-        self.log.insert(tk.END, prefix + message + "\n", tag)
-        self.log.see(tk.END)
+    def log_message(self, message, direction="", user="", conn_id=0, payload=None):
+        """Queue a line for the log and capture it (payload: the raw chat message, if any).
+        Safe to call from relay threads"""
+        self.log_queue.put(("log", datetime.now().strftime("%H:%M:%S"), message, direction))
         
-        # Save to log file
-        try:
-            log_file = os.path.join(DATA_DIR, 'proxy_log.txt')
-            with open(log_file, "a") as f:
-                json.dump({
-                    "timestamp": timestamp,
-                    "type": direction,
-                    "message": message
-                }, f)
-                f.write("\n")
-        except:
-            pass
+        # Batched and written by the capture thread
+        self.capture.write(direction, message if payload is None else payload, user, conn_id)
         
-    def update_users(self):
-        self.users_list.delete(0, tk.END)
-        for username in self.usernames.values():
-            self.users_list.insert(tk.END, username)
-            
-    def handle_client_traffic(self, client_socket, server_socket):
-        while self.is_running:
-            try:
-                data = client_socket.recv(4096)
-                if not data:
-                    break
-                    
-                message = data.decode()
-                username = self.usernames.get(client_socket, "Unknown")
-                self.log_message(f"{username} → Server: {message}", "→")
-                
-                server_socket.send(data)
-            except:
-                break
-                
-        self.close_connection(client_socket)
+    def queue_user(self, conn_id, username=None):
+        """Queue a join (or a leave, without username) for the users list"""
+        self.log_queue.put(("user", conn_id, username))
         
-    def handle_server_traffic(self, client_socket, server_socket):
-        while self.is_running:
+    def flush_log(self):
+        """Insert queued log lines in one batch, trim the window to LOG_MAX_LINES
+        and apply queued joins and leaves to the users list"""
+        records = []
+        while len(records) < LOG_BATCH_SIZE:
             try:
-                data = server_socket.recv(4096)
-                if not data:
-                    break
-                    
-                message = data.decode()
-                username = self.usernames.get(client_socket, "Unknown")
-                self.log_message(f"Server → {username}: {message}", "←")
-                
-                client_socket.send(data)
-            except:
+                records.append(self.log_queue.get_nowait())
+            except queue.Empty:
                 break
-                
-        self.close_connection(client_socket)
-        
-    def handle_connection(self, client_socket):
-        try:
-            # Connect to real server
-            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_socket.connect(('127.0.0.1', self.server_port))
-            
-            self.connections[client_socket] = server_socket
-            
-            # Forward initial server info
-            server_info = server_socket.recv(4096)
-            client_socket.send(server_info)
-            
-            # Get username
-            username = client_socket.recv(4096).decode()
-            self.usernames[client_socket] = username
-            self.log_message(f"New connection: {username}", "!")
-            self.root.after(0, self.update_users)
+        users_changed = False
+        show_timestamps = self.show_timestamps.get()
+        show_directions = self.show_directions.get()
+        # One insert call for the whole batch: text, tag, text, tag, ...
+        chunks = []
+        for record in records:
+            if record[0] == "user":
+                _, conn_id, username = record
+                if username is None:
+                    self.users_shown.pop(conn_id, None)
+                else:
+                    self.users_shown[conn_id] = username
+                users_changed = True
+                continue
+            _, timestamp, message, direction = record
+            prefix = ""
+            if show_timestamps:
+                prefix += f"[{timestamp}] "
+            if show_directions and direction:
+                prefix += f"{direction} "
+            tag = {
+                "→": "client",
+                "←": "server",
+                "!": "system",
+                "X": "error"
+            }.get(direction, "")
+            chunks += [prefix + message + "\n", tag]
+        if chunks:
+            self.log.insert(tk.END, *chunks)
             
-            # Forward username to server
-            server_socket.send(username.encode())
-            
-            # Start traffic monitors
-            threading.Thread(target=self.handle_client_traffic, 
-                           args=(client_socket, server_socket),
-                           daemon=True).start()
-            threading.Thread(target=self.handle_server_traffic,
-                           args=(client_socket, server_socket),
-                           daemon=True).start()
-            
-        except Exception as e:
-            self.log_message(f"Connection error: {e}", "X")
-            self.close_connection(client_socket)
-            
-    def close_connection(self, client_socket):
-        if client_socket in self.connections:
-            server_socket = self.connections[client_socket]
-            username = self.usernames.get(client_socket, "Unknown")
-            
-            self.log_message(f"Disconnected: {username}", "X")
+            excess = int(self.log.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0:
+                self.log.delete('1.0', f'{excess + 1}.0')
+            self.log.see(tk.END)
+        if users_changed:
+            self.update_users()
+        # Come back sooner while there is a backlog
+        self.root.after(1 if len(records) == LOG_BATCH_SIZE else LOG_FLUSH_MS, self.flush_log)
+        
+    def update_users(self):
+        self.users_list.delete(0, tk.END)
+        for username in self.users_shown.values():
+            self.users_list.insert(tk.END, username)
             
-            server_socket.close()
-            client_socket.close()
+    def cancel_upstreams_refresh(self):
+        if self.upstreams_job is not None:
+            self.root.after_cancel(self.upstreams_job)
+            self.upstreams_job = None
             
-            del self.connections[client_socket]
-            if client_socket in self.usernames:
-                del self.usernames[client_socket]
+    def update_upstreams(self):
+        self.upstreams_job = None
+        if not self.relay:
+            return
+        self.upstreams_list.delete(0, tk.END)
+        for row in self.relay.upstreams.stats():
+            state = "up" if row['healthy'] else "DOWN"
+            latency = (f"connect p50 {row['p50_ms']:.1f} ms, p99 {row['p99_ms']:.1f} ms"
+                       if row['p50_ms'] is not None else "no connects yet")
+            self.upstreams_list.insert(
+                tk.END,
+                f"{row['upstream']:<22} {state:<5} {row['active']} active, {row['warm']} warm, "
+                f"{row['connects']} connects, {row['errors']} errors, {latency}"
+            )
+        # Only one refresh timer at a time, however often the monitor is restarted
+        self.cancel_upstreams_refresh()
+        self.upstreams_job = self.root.after(UPSTREAM_REFRESH_MS, self.update_upstreams)
             
-            self.root.after(0, self.update_users)
+    # Relay monitor callbacks, called from the relay's tap thread
+    def on_open(self, conn_id, peer):
+        pass  # Logged once the username frame shows up
+
+    def on_message(self, conn_id, direction, message):
+        if direction == CLIENT_TO_SERVER:
+            if conn_id not in self.usernames:
+                # First client frame is the username (or a HELLO carrying it)
+                username, last_seen, _ = parse_hello(message)
+                self.usernames[conn_id] = username
+                resumed = f" (resuming after #{last_seen})" if last_seen is not None else ""
+                self.log_message(f"New connection: {username}{resumed}", "!", username, conn_id, message)
+                self.queue_user(conn_id, username)
+                return
+            username = self.usernames[conn_id]
+            self.log_message(f"{username} → Server: {message}", "→", username, conn_id, message)
+        else:
+            if conn_id not in self.seen_server:
+                self.seen_server.add(conn_id)  # SERVER_INFO, not logged
+                return
+            username = self.usernames.get(conn_id, "Unknown")
+            self.log_message(f"Server → {username}: {message}", "←", username, conn_id, message)
+
+    def on_overflow(self, conn_id, direction):
+        username = self.usernames.get(conn_id, "Unknown")
+        self.log_message(f"Monitor fell behind, no longer decoding {username} {direction}", "X")
+
+    def on_close(self, conn_id, error):
+        if error:
+            self.log_message(f"Connection error: {error}", "X")
+        username = self.usernames.pop(conn_id, "Unknown")
+        self.seen_server.discard(conn_id)
+        self.log_message(f"Disconnected: {username}", "X", username, conn_id)
+        self.queue_user(conn_id)
             
     def start_monitor(self):
         try:
             self.proxy_port = int(self.proxy_port_entry.get())
-            self.server_port = int(self.server_port_entry.get())
+            self.upstreams = parse_upstreams(self.upstreams_entry.get())
             
-            self.proxy_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.proxy_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.proxy_socket.bind(('127.0.0.1', self.proxy_port))
-            self.proxy_socket.listen(5)
+            relay_class = RELAYS[self.relay_var.get()]
+            self.relay = relay_class('127.0.0.1', self.proxy_port, UpstreamPool(self.upstreams), monitor=self)
+            self.relay.start()
+            self.update_upstreams()
             
             self.is_running = True
-            self.log_message(f"Monitoring started on port {self.proxy_port}", "!")
+            self.log_message(f"Monitoring started on port {self.proxy_port} ({self.relay_var.get()} relay)", "!")
             
             self.start_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
-            
-            threading.Thread(target=self.accept_connections, daemon=True).start()
+            self.relay_combo.config(state='disabled')
+            self.upstreams_entry.config(state='disabled')
             
         except Exception as e:
+            self.relay = None
             messagebox.showerror("Error", f"Failed to start monitor: {e}")
             
     def stop_monitor(self):
         self.is_running = False
+        self.cancel_upstreams_refresh()
         
-        for client_socket in list(self.connections.keys()):
-            self.close_connection(client_socket)
-            
-        if hasattr(self, 'proxy_socket'):
-            self.proxy_socket.close()
+        if self.relay:
+            self.relay.stop()
+            self.relay = None
             
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
+        self.relay_combo.config(state='readonly')
+        self.upstreams_entry.config(state='normal')
         self.log_message("Monitoring stopped", "!")
-        
-    def accept_connections(self):
-        while self.is_running:
-            try:
-                client_socket, _ = self.proxy_socket.accept()
-                threading.Thread(target=self.handle_connection,
-                              args=(client_socket,),
-                              daemon=True).start()
-            except:
-                if self.is_running:
-                    continue
-                break
                 
     def run(self):
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -358,6 +386,7 @@ class ChatMonitor:
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Stop monitoring and exit?"):
             self.stop_monitor()
+            self.capture.close()
             self.root.destroy()
 
 class FontDialog:
@@ -0,0 +1,195 @@
+"""Persistent chat history for ChatServer.
+
+Messages are appended to a SQLite database in WAL mode. Broadcast never
+touches the database: append() only assigns an id and puts the message on
+a queue, and a background writer thread drains that queue and commits
+everything waiting in one transaction. The last few messages of every room
+are also kept in memory, so replaying them to a joining client needs no
+disk access; older pages are read from the database on demand (/history).
+
+Cluster shards (cluster.py) share one database. Their ids then come from
+a counter shared by all shard processes, and messages recorded by another
+shard are added to the in-memory tails with remember().
+"""
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    ts REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_room_id ON messages (room, id);
+"""
+
+class MessageHistory:
+    def __init__(self, path, replay_size=50, batch_size=500, id_counter=None):
+        """
+        path: SQLite database file, created if missing
+        replay_size: messages per room kept in memory for replay on join
+        batch_size: most rows the writer commits in one transaction
+        id_counter: multiprocessing.Value handing out ids to every process
+                    writing to the same database (None: this process only)
+        """
+        self.path = path
+        self.replay_size = replay_size
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = queue.SimpleQueue()
+        self.recent_messages = {}  # room -> deque of (id, ts, text)
+
+        self.db = self.connect()
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        last_id = self.db.execute("SELECT MAX(id) FROM messages").fetchone()[0]
+        self.next_id = (last_id or 0) + 1
+        self.id_counter = id_counter
+        if id_counter is not None:
+            with id_counter.get_lock():
+                id_counter.value = max(id_counter.value, self.next_id)
+        # Separate connection for reads; WAL lets it run alongside the writer
+        self.reader = self.connect()
+        self.reader_lock = threading.Lock()
+
+        self.writer_thread = threading.Thread(target=self.write_loop)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def append(self, room, text):
+        """Record a message; never blocks on disk. Returns its id"""
+        with self.lock:
+            if self.id_counter is None:
+                message_id = self.next_id
+            else:
+                with self.id_counter.get_lock():
+                    message_id = self.id_counter.value
+                    self.id_counter.value += 1
+            self.next_id = message_id + 1
+            row = (message_id, room, time.time(), text)
+            self.tail(room).append(row[:1] + row[2:])
+        self.pending.put(row)
+        return message_id
+
+    def remember(self, message_id, room, text):
+        """A message another shard appended to the shared database; only the
+        in-memory tail needs it, since that shard commits it"""
+        with self.lock:
+            self.next_id = max(self.next_id, message_id + 1)
+            recent = self.tail(room)
+            # Loading the tail may have read it from the database already
+            if any(row[0] == message_id for row in recent):
+                return
+            recent.append((message_id, time.time(), text))
+            if len(recent) > 1 and recent[-2][0] > message_id:
+                # Shards' messages can arrive a little out of id order
+                rows = sorted(recent)
+                recent.clear()
+                recent.extend(rows)
+
+    def tail(self, room):
+        # Called with the lock held. The first time a room is touched this
+        # session nothing of it can still be queued, so the database is up to date
+        recent = self.recent_messages.get(room)
+        if recent is None:
+            rows = self.query(room, None, self.replay_size)
+            recent = self.recent_messages[room] = deque(rows, self.replay_size)
+        return recent
+
+    def recent(self, room):
+        """Last replay_size messages of a room, oldest first, as (id, ts, text)"""
+        with self.lock:
+            return list(self.tail(room))
+
+    def page(self, room, before_id=None, limit=50):
+        """Up to limit messages older than before_id, oldest first"""
+        self.flush()
+        return self.query(room, before_id, limit)
+
+    def since(self, rooms, after_id, limit):
+        """Up to limit messages of the given rooms newer than after_id, oldest first,
+        as (id, room, ts, text)"""
+        self.flush()
+        rooms = list(rooms)
+        if not rooms:
+            return []
+        placeholders = ", ".join("?" * len(rooms))
+        with self.reader_lock:
+            return self.reader.execute(
+                f"SELECT id, room, ts, text FROM messages WHERE id > ? AND room IN ({placeholders}) "
+                "ORDER BY id LIMIT ?",
+                [after_id] + rooms + [limit]
+            ).fetchall()
+
+    def query(self, room, before_id, limit):
+        query = "SELECT id, ts, text FROM messages WHERE room = ?"
+        params = [room]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self.reader_lock:
+            rows = self.reader.execute(query, params).fetchall()
+        rows.reverse()
+        return rows
+
+    def write_loop(self):
+        running = True
+        while running:
+            # Group commit: everything already waiting goes in one transaction
+            items = [self.pending.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            batch = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    # flush() marker: commit what came before it, then wake the caller
+                    self.write_batch(batch)
+                    batch = []
+                    item.set()
+                else:
+                    batch.append(item)
+            self.write_batch(batch)
+        self.db.close()
+
+    def write_batch(self, batch):
+        if not batch:
+            return
+        try:
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO messages (id, room, ts, text) VALUES (?, ?, ?, ?)",
+                    batch
+                )
+        except sqlite3.Error:
+            pass  # History is best effort; chat keeps working without it
+
+    def flush(self, timeout=5):
+        """Wait until everything appended so far has been committed"""
+        if threading.current_thread() is self.writer_thread or not self.writer_thread.is_alive():
+            return
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        self.pending.put(None)
+        self.writer_thread.join(timeout=5)
+        with self.reader_lock:
+            self.reader.close()
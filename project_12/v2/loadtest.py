@@ -0,0 +1,332 @@
+"""Headless load test of the chat stack, with a JSON report.
+
+Starts a ChatServer without its GUI (and optionally the monitor's relay in
+front of it) in a child process, so its memory can be measured on its own.
+N simulated clients then connect over the normal protocol (SERVER_INFO,
+username, COUNT_UPDATE), some of them send chat messages at a fixed total
+rate for a while, and every client timestamps what it receives.
+
+Each chat message carries its send time, so the report has end-to-end
+latency percentiles over every delivery, plus throughput, join rate,
+dropped frames and server memory per connection:
+
+    python loadtest.py --clients 200 --rate 500 --duration 10
+    python loadtest.py --engine Asyncio --proxy Selector --output run.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from protocol import FrameDecoder, encode_frame
+from relay import RELAYS
+from server import ENGINES
+from upstreams import UpstreamPool
+
+MARKER = "<lt:"
+
+def rss_bytes():
+    """Resident memory of this process, or None where /proc isn't available"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class CountingMonitor:
+    """Relay monitor that only counts decoded messages"""
+    def __init__(self):
+        self.messages = 0
+
+    def on_open(self, conn_id, peer):
+        pass
+
+    def on_message(self, conn_id, direction, message):
+        self.messages += 1
+
+    def on_overflow(self, conn_id, direction):
+        pass
+
+    def on_close(self, conn_id, error):
+        pass
+
+def serve(options, pipe):
+    """Child process: run the server (and relay) until told to stop"""
+    server = ENGINES[options["engine"]](
+        host="127.0.0.1",
+        port=0,
+        server_name="loadtest",
+        max_users=options["clients"] + 1,
+        history_size=options["history"],
+        history_path=os.path.join(tempfile.mkdtemp(), "history.db"),
+        message_rate=options["message_rate"],
+        message_burst=options["message_rate"] * 2
+    )
+    server.start_server()
+    if not server.is_running:
+        pipe.send({"error": "server failed to start"})
+        return
+    port = server.port
+    relay = monitor = None
+    if options["proxy"]:
+        monitor = CountingMonitor() if options["monitor"] else None
+        relay = RELAYS[options["proxy"]]("127.0.0.1", 0, UpstreamPool([("127.0.0.1", port)]),
+                                         monitor=monitor)
+        port = relay.start()
+    pipe.send({"port": port, "rss": rss_bytes()})
+    while True:
+        command = pipe.recv()
+        if command == "stats":
+            stats = {"rss": rss_bytes(), "clients": len(server.clients),
+                     "queues": server.queue_status()}
+            if monitor:
+                stats["monitor_messages"] = monitor.messages
+            pipe.send(stats)
+        elif command == "stop":
+            break
+    if relay:
+        relay.stop()
+    server.stop_server()
+    pipe.send("stopped")
+
+class SimClient:
+    def __init__(self, username, results):
+        self.username = username
+        self.results = results
+        self.reader = None
+        self.writer = None
+        self.task = None
+
+    async def connect(self, port):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        decoder = FrameDecoder()
+        frames = []
+        while not frames:
+            data = await self.reader.read(4096)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            frames = decoder.feed(data)
+        if not frames[0].startswith("SERVER_INFO:"):
+            raise ConnectionError(f"unexpected first frame: {frames[0][:60]}")
+        self.writer.write(encode_frame(self.username))
+        await self.writer.drain()
+        self.task = asyncio.create_task(self.pump(decoder, frames[1:]))
+
+    async def pump(self, decoder, frames):
+        results = self.results
+        while True:
+            now = time.perf_counter_ns()
+            for frame in frames:
+                if frame.startswith("COUNT_UPDATE:"):
+                    results["count_updates"] += 1
+                    continue
+                start = frame.find(MARKER)
+                if start >= 0:
+                    sent = int(frame[start + len(MARKER):frame.index(">", start)])
+                    results["latencies"].append(now - sent)
+            data = await self.reader.read(65536)
+            if not data:
+                break
+            results["bytes_received"] += len(data)
+            frames = decoder.feed(data)
+
+    async def send_at_rate(self, rate, duration, padding):
+        """Open loop: message k goes out at start + k/rate, however late the last one was"""
+        interval = 1 / rate
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            due = start + sent * interval
+            if due - start >= duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.writer.write(encode_frame(f"{MARKER}{time.perf_counter_ns()}>{padding}"))
+            sent += 1
+            if sent % 16 == 0:
+                await self.writer.drain()
+        await self.writer.drain()
+        return sent
+
+    async def close(self):
+        self.writer.close()
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+async def drive(port, args, child):
+    results = {"latencies": [], "bytes_received": 0, "count_updates": 0}
+    clients = [SimClient(f"load{i}", results) for i in range(args.clients)]
+
+    # Join in waves so the listen backlog isn't the thing being measured
+    started = time.perf_counter()
+    failed = 0
+    for first in range(0, len(clients), args.connect_batch):
+        outcomes = await asyncio.gather(
+            *(client.connect(port) for client in clients[first:first + args.connect_batch]),
+            return_exceptions=True
+        )
+        failed += sum(isinstance(outcome, Exception) for outcome in outcomes)
+    connected = [client for client in clients if client.task]
+    deadline = time.perf_counter() + args.timeout
+    while child_stats(child)["clients"] < len(connected) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(args.settle)
+    joined_stats = child_stats(child)
+
+    # Steady chat load from the first few clients
+    results["latencies"].clear()
+    results["bytes_received"] = 0
+    results["count_updates"] = 0
+    senders = connected[:max(1, min(args.senders, len(connected)))]
+    padding = "x" * max(0, args.size - len(MARKER) - 20)
+    run_started = time.perf_counter()
+    sent = sum(await asyncio.gather(
+        *(sender.send_at_rate(args.rate / len(senders), args.duration, padding) for sender in senders)
+    ))
+    send_seconds = time.perf_counter() - run_started
+
+    # Wait for in-flight deliveries
+    expected = sent * (len(connected) - 1)
+    deadline = time.perf_counter() + args.timeout
+    while len(results["latencies"]) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    run_seconds = time.perf_counter() - run_started
+    final_stats = child_stats(child)
+
+    for client in connected:
+        await client.close()
+
+    latencies = sorted(ns / 1e6 for ns in results["latencies"])
+    delivered = len(latencies)
+    idle_rss, joined_rss = child.idle_rss, joined_stats["rss"]
+    return {
+        "connect": {
+            "clients": args.clients,
+            "connected": len(connected),
+            "failed": failed,
+            "joined": joined_stats["clients"],
+            "seconds": round(connect_seconds, 3),
+            "per_sec": round(len(connected) / connect_seconds, 1) if connect_seconds else None
+        },
+        "memory": {
+            "server_rss_idle_bytes": idle_rss,
+            "server_rss_joined_bytes": joined_rss,
+            "per_connection_bytes": (round((joined_rss - idle_rss) / len(connected))
+                                     if idle_rss and joined_rss and connected else None),
+            "server_rss_end_bytes": final_stats["rss"]
+        },
+        "throughput": {
+            "senders": len(senders),
+            "sent": sent,
+            "send_seconds": round(send_seconds, 3),
+            "sent_per_sec": round(sent / send_seconds, 1) if send_seconds else None,
+            "expected_deliveries": expected,
+            "delivered": delivered,
+            "delivered_per_sec": round(delivered / run_seconds, 1) if run_seconds else None,
+            "received_mb_per_sec": round(results["bytes_received"] / run_seconds / 1e6, 3) if run_seconds else None,
+            "count_updates": results["count_updates"]
+        },
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "p999": percentile(latencies, 99.9),
+            "max": latencies[-1] if latencies else None,
+            "mean": sum(latencies) / delivered if delivered else None
+        },
+        "server": final_stats["queues"],
+        "monitor_messages": final_stats.get("monitor_messages")
+    }
+
+class Child:
+    """The server process and the pipe to it"""
+    def __init__(self, options):
+        self.pipe, child_pipe = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(options, child_pipe))
+        self.process.daemon = True
+        self.process.start()
+        ready = self.pipe.recv()
+        if "error" in ready:
+            raise SystemExit(ready["error"])
+        self.port = ready["port"]
+        self.idle_rss = ready["rss"]
+
+    def stop(self):
+        try:
+            self.pipe.send("stop")
+            self.pipe.recv()
+        except (EOFError, OSError):
+            pass
+        self.process.join(timeout=10)
+
+def child_stats(child):
+    child.pipe.send("stats")
+    return child.pipe.recv()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=list(ENGINES), default="Threaded")
+    parser.add_argument("--proxy", choices=list(RELAYS), help="put the monitor relay in front")
+    parser.add_argument("--monitor", action="store_true", help="decode traffic in the relay (with --proxy)")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--senders", type=int, default=10, help="clients that send messages")
+    parser.add_argument("--rate", type=float, default=200.0, help="messages per second, all senders together")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of steady load")
+    parser.add_argument("--size", type=int, default=100, help="message size in bytes")
+    parser.add_argument("--message-rate", type=float, default=0.0,
+                        help="server's per-client message rate limit (0: none)")
+    parser.add_argument("--history", type=int, default=50, help="server history size (0 disables it)")
+    parser.add_argument("--connect-batch", type=int, default=100, help="clients connecting at once")
+    parser.add_argument("--settle", type=float, default=1.0, help="pause after joining (seconds)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    child = Child({
+        "engine": args.engine,
+        "clients": args.clients,
+        "history": args.history,
+        "message_rate": args.message_rate,
+        "proxy": args.proxy,
+        "monitor": args.monitor
+    })
+    try:
+        results = asyncio.run(drive(child.port, args, child))
+    finally:
+        child.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    # Non-zero exit if messages went missing, so CI notices
+    sys.exit(0 if results["throughput"]["delivered"] >= results["throughput"]["expected_deliveries"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Low-overhead metrics for ChatServer.
+
+Hot paths only bump a Counter or drop a value into a Histogram bucket (a
+bisect and a few adds under one lock). Anything that can be read off
+existing state, such as connected clients, queue depths or the thread
+count, is a callback that only runs when the metrics are read.
+
+MetricsRegistry renders everything in the Prometheus text format;
+MetricsServer serves it on a local HTTP port:
+
+    curl http://127.0.0.1:9100/metrics        # Prometheus text format
+    curl http://127.0.0.1:9100/metrics.json   # the same as JSON
+
+ChatServerGUI shows a live panel built from snapshot().
+"""
+import json
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.value
+
+    def read(self):
+        return self.value
+
+class Callback:
+    """Counter or gauge whose value is computed when read"""
+    def __init__(self, name, help, kind, function):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.function = function
+
+    def samples(self):
+        yield self.name, self.function()
+
+    def read(self):
+        return self.function()
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.bounds = sorted(buckets)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.bounds) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + [float("inf")], counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f'{self.name}_bucket{{le="{le}"}}', cumulative
+        yield f"{self.name}_sum", total
+        yield f"{self.name}_count", count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)"""
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + [float("inf")], counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def read(self):
+        return {"count": self.count, "sum": self.sum,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, function=None):
+        """Counter to inc(), or one read from function() if given"""
+        if function:
+            return self.add(Callback(name, help, "counter", function))
+        return self.add(Counter(name, help))
+
+    def gauge(self, name, help, function):
+        return self.add(Callback(name, help, "gauge", function))
+
+    def histogram(self, name, help, buckets):
+        return self.add(Histogram(name, help, buckets))
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, value in metric.samples():
+                    lines.append(f"{name} {value}")
+            except Exception:
+                pass  # A callback on state that is going away; skip it this time
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """name -> current value (a dict for histograms)"""
+        values = {}
+        for metric in self.metrics:
+            try:
+                values[metric.name] = metric.read()
+            except Exception:
+                values[metric.name] = None
+        return values
+
+class MetricsServer:
+    """Serves a registry over HTTP from a background thread"""
+    def __init__(self, registry, host="127.0.0.1", port=9100):
+        self.registry = registry
+        self.address = (host, port)
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        """Start serving; returns the port (useful with port 0)"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.render().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would flood the server log
+
+        self.httpd = ThreadingHTTPServer(self.address, Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.httpd.server_address[1]
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
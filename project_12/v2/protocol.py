@@ -0,0 +1,152 @@
+"""Wire framing shared by the chat server, client and monitor proxy.
+
+Every message travels as a 4-byte big-endian length followed by that many
+bytes of UTF-8 text. TCP is a byte stream, so one recv() can hold half a
+message or several of them (a chat line and a COUNT_UPDATE, say); the
+FrameDecoder buffers incoming bytes and hands back only complete messages.
+It also means several frames can be joined and sent with a single sendall().
+
+The server gives its decoders a size limit: a frame whose length header is
+over the limit is rejected on the header alone and its payload skipped as
+it arrives, never buffered or decoded. A frame spread over several reads
+is UTF-8 decoded piece by piece as it arrives, so invalid bytes are caught
+(and the rest of that frame skipped) without waiting for all of it.
+"""
+import codecs
+import struct
+
+HEADER = struct.Struct("!I")
+
+# Reasons passed to FrameDecoder's on_reject
+TOO_LARGE = "too_large"
+INVALID_UTF8 = "invalid_utf8"
+
+class FrameError(ValueError):
+    """A frame broke the decoder's limits and no on_reject was given"""
+
+def encode_frame(message):
+    """Encode one text message as a length-prefixed frame"""
+    payload = message.encode()
+    return HEADER.pack(len(payload)) + payload
+
+def encode_frames(messages):
+    """Encode several messages into one buffer for a single sendall()"""
+    return b"".join(encode_frame(message) for message in messages)
+
+class FrameDecoder:
+    """Incremental decoder: feed it raw bytes, get back complete messages"""
+    def __init__(self, max_size=None, on_reject=None):
+        """
+        max_size: largest payload accepted, in bytes (None for no limit)
+        on_reject: on_reject(reason, length) is called for each frame that is
+            too large or not valid UTF-8, which is then dropped; without it
+            such a frame raises FrameError
+        """
+        self.buffer = bytearray()
+        self.max_size = max_size
+        self.on_reject = on_reject
+        self.skip = 0          # Payload bytes of a rejected frame still to discard
+        self.remaining = 0     # Payload bytes of a partly received frame still to come
+        self.length = 0        # Length of that frame
+        self.pieces = []       # Its text decoded so far
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.received = 0      # Bytes fed so far
+
+    def feed(self, data):
+        """Add received bytes and return every message completed by them"""
+        messages = []
+        self.received += len(data)
+        if self.skip or self.remaining:
+            data = self.continue_frame(data, messages)
+            if not data:
+                return messages
+        self.buffer += data
+        buffer = self.buffer
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(buffer, offset)
+            start = offset + HEADER.size
+            end = start + length
+            if self.max_size is not None and length > self.max_size:
+                # Decided on the header alone; the payload is dropped as it arrives
+                self.reject(TOO_LARGE, length)
+                offset = min(end, len(buffer))
+                self.skip = end - offset
+                continue
+            if len(buffer) < end:
+                # Decode what has arrived; the rest follows in later feeds
+                self.length = length
+                self.remaining = end - len(buffer)
+                self.utf8.reset()
+                self.pieces = []
+                self.decode_piece(memoryview(buffer)[start:], False, messages)
+                offset = len(buffer)
+                break
+            try:
+                messages.append(buffer[start:end].decode())
+            except UnicodeDecodeError:
+                self.reject(INVALID_UTF8, length)
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return messages
+
+    def continue_frame(self, data, messages):
+        """Skip or decode the tail of the current frame; returns the bytes after it"""
+        data = memoryview(data)
+        while data and (self.skip or self.remaining):
+            if self.skip:
+                count = min(self.skip, len(data))
+                self.skip -= count
+            else:
+                count = min(self.remaining, len(data))
+                self.remaining -= count
+                self.decode_piece(data[:count], not self.remaining, messages)
+            data = data[count:]
+        return data
+
+    def decode_piece(self, piece, final, messages):
+        try:
+            self.pieces.append(self.utf8.decode(piece, final))
+        except UnicodeDecodeError:
+            self.pieces = []
+            self.skip, self.remaining = self.remaining, 0
+            self.reject(INVALID_UTF8, self.length)
+            return
+        if final:
+            messages.append("".join(self.pieces))
+            self.pieces = []
+
+    def reject(self, reason, length):
+        if self.on_reject is None:
+            raise FrameError(f"Rejected frame of {length} bytes: {reason}")
+        self.on_reject(reason, length)
+
+def recv_frames(sock, decoder, bufsize=4096):
+    """Block until at least one message arrives; an empty list means the peer closed"""
+    while True:
+        data = sock.recv(bufsize)
+        if not data:
+            return []
+        messages = decoder.feed(data)
+        if messages:
+            return messages
+
+def iter_frames(sock, decoder=None, bufsize=4096):
+    """Yield messages from a blocking socket until the peer closes it"""
+    decoder = decoder or FrameDecoder()
+    while True:
+        messages = recv_frames(sock, decoder, bufsize)
+        if not messages:
+            return
+        yield from messages
+
+async def aiter_frames(reader, decoder=None, bufsize=65536):
+    """Yield messages from an asyncio StreamReader until EOF"""
+    decoder = decoder or FrameDecoder()
+    while True:
+        data = await reader.read(bufsize)
+        if not data:
+            return
+        for message in decoder.feed(data):
+            yield message
@@ -0,0 +1,28 @@
+"""Per-connection rate limiting for ChatServer.
+
+Each client connection gets a TokenBucket: it holds up to `burst` tokens,
+refills at `rate` tokens per second, and every frame the client sends
+costs one (rejected frames included). Frames that find the bucket empty
+are dropped before any further work is done on them.
+"""
+import time
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "limited")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.limited = False  # Dropping since the last frame that got through
+
+    def consume(self, cost=1.0):
+        """Take cost tokens if there are enough; returns False if rate limited"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
@@ -0,0 +1,463 @@
+"""TCP relays used by the ChatMonitor proxy (hack.py).
+
+Both relays accept client connections, open a connection to the real
+server for each one and forward bytes both ways untouched. What passes
+through is reported to a monitor object:
+
+    monitor.on_open(conn_id, peer)
+    monitor.on_message(conn_id, direction, message)   # one decoded frame
+    monitor.on_close(conn_id, error)                  # error is None or a string
+    monitor.on_overflow(conn_id, direction)           # tap fell behind (selector only)
+
+ThreadedRelay is the original design: two threads per connection, each
+recv() is decoded and reported before the bytes are forwarded, so a slow
+monitor (a busy GUI) slows the chat down.
+
+SelectorRelay serves every connection from one selector loop. Each
+direction has a preallocated buffer that is filled with recv_into() and
+drained with send() from a memoryview, without intermediate copies. The
+monitor is fed by an asynchronous FrameTap: the loop only hands it a copy
+of each chunk, and decoding and logging happen on the tap's own thread,
+in batches.
+If the tap falls too far behind it stops decoding that stream rather than
+holding back the relay.
+"""
+import errno
+import queue
+import selectors
+import socket
+import threading
+import time
+
+from protocol import FrameDecoder
+
+CLIENT_TO_SERVER = "→"
+SERVER_TO_CLIENT = "←"
+
+class FrameTap:
+    """Decodes relayed chunks into messages on a background thread"""
+    def __init__(self, monitor, max_pending=8 * 1024 * 1024, interval=0.05):
+        self.monitor = monitor
+        self.max_pending = max_pending
+        self.interval = interval
+        self.decoders = {}
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.events = queue.SimpleQueue()
+        self.lost = set()  # (conn_id, direction) streams no longer decoded
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # Called from the relay loop; must stay cheap and never block
+    def open(self, conn_id, peer):
+        self.events.put(("open", conn_id, peer))
+
+    def chunk(self, conn_id, direction, data):
+        stream = (conn_id, direction)
+        if stream in self.lost:
+            return
+        with self.lock:
+            over = self.pending + len(data) > self.max_pending
+            if not over:
+                self.pending += len(data)
+        if over:
+            # A length-prefixed stream can't be resumed midway, so give it up
+            self.lost.add(stream)
+            self.events.put(("overflow", conn_id, direction))
+        else:
+            self.events.put(("chunk", conn_id, direction, data))
+
+    def close(self, conn_id, error=None):
+        self.events.put(("close", conn_id, error))
+
+    def stop(self):
+        self.events.put(None)
+        self.thread.join(timeout=5)
+
+    def run(self):
+        while True:
+            # Wake at most every interval and take everything queued by then:
+            # waking per chunk would keep taking the GIL from the relay loop
+            events = [self.events.get()]
+            while True:
+                try:
+                    events.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+            for event in events:
+                if event is None:
+                    return
+                try:
+                    self.handle(event)
+                except:
+                    pass  # A failing monitor must not stop the tap
+            time.sleep(self.interval)
+
+    def handle(self, event):
+        kind, conn_id = event[0], event[1]
+        if kind == "chunk":
+            direction, data = event[2], event[3]
+            with self.lock:
+                self.pending -= len(data)
+            decoder = self.decoders.get((conn_id, direction))
+            if decoder is None:
+                decoder = self.decoders[(conn_id, direction)] = FrameDecoder()
+            for message in decoder.feed(data):
+                self.monitor.on_message(conn_id, direction, message)
+        elif kind == "open":
+            self.monitor.on_open(conn_id, event[2])
+        elif kind == "overflow":
+            self.decoders.pop((conn_id, event[2]), None)
+            self.monitor.on_overflow(conn_id, event[2])
+        elif kind == "close":
+            for direction in (CLIENT_TO_SERVER, SERVER_TO_CLIENT):
+                self.decoders.pop((conn_id, direction), None)
+                self.lost.discard((conn_id, direction))
+            self.monitor.on_close(conn_id, event[2])
+
+class Pipe:
+    """One direction of a relayed connection with its own reusable buffer"""
+    __slots__ = ("source", "dest", "direction", "buffer", "view", "start", "end", "eof")
+
+    def __init__(self, source, dest, direction, bufsize):
+        self.source = source
+        self.dest = dest
+        self.direction = direction
+        self.buffer = bytearray(bufsize)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte not yet sent
+        self.end = 0    # End of received data
+        self.eof = False
+
+    def has_room(self):
+        return not self.eof and self.end < len(self.buffer)
+
+    def has_data(self):
+        return self.end > self.start
+
+class RelayConnection:
+    __slots__ = ("conn_id", "client", "upstream", "target", "tried", "connect_started",
+                 "connected", "up", "down", "masks")
+
+    def __init__(self, conn_id, client, bufsize):
+        self.conn_id = conn_id
+        self.client = client
+        self.upstream = None         # Socket to the chat server, once chosen
+        self.target = None           # Its Upstream entry in the pool
+        self.tried = []              # Upstreams that failed for this client
+        self.connect_started = 0.0
+        self.connected = False
+        self.up = Pipe(client, None, CLIENT_TO_SERVER, bufsize)
+        self.down = Pipe(None, client, SERVER_TO_CLIENT, bufsize)
+        self.masks = {client: 0}
+
+    def attach(self, sock, target):
+        self.upstream = sock
+        self.target = target
+        self.up.dest = sock
+        self.down.source = sock
+        self.masks[sock] = 0
+
+class SelectorRelay:
+    def __init__(self, listen_host, listen_port, upstreams, monitor=None, bufsize=65536):
+        """upstreams: UpstreamPool of chat servers; started and stopped with the relay"""
+        self.listen_addr = (listen_host, listen_port)
+        self.upstreams = upstreams
+        self.monitor = monitor
+        self.bufsize = bufsize
+        self.tap = None
+        self.selector = None
+        self.listener = None
+        self.thread = None
+        self.running = False
+        self.connections = {}
+        self.next_id = 1
+        self.bytes_relayed = {CLIENT_TO_SERVER: 0, SERVER_TO_CLIENT: 0}
+
+    def start(self):
+        """Bind and start relaying; returns the port actually listened on"""
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.listen_addr)
+        self.listener.listen(socket.SOMAXCONN)
+        self.listener.setblocking(False)
+        self.upstreams.start()
+        if self.monitor:
+            self.tap = FrameTap(self.monitor)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.listener.getsockname()[1]
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.upstreams.stop()
+        if self.tap:
+            self.tap.stop()
+
+    def run(self):
+        try:
+            while self.running:
+                for key, mask in self.selector.select(timeout=0.2):
+                    if key.data is None:
+                        self.accept()
+                    else:
+                        self.service(key.data, key.fileobj, mask)
+        finally:
+            for conn in list(self.connections.values()):
+                self.close(conn)
+            self.selector.close()
+            self.listener.close()
+
+    def accept(self):
+        while True:
+            try:
+                client, peer = self.listener.accept()
+            except OSError:
+                return  # Nothing left to accept (or the listener was closed)
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = RelayConnection(self.next_id, client, self.bufsize)
+            self.next_id += 1
+            self.connections[conn.conn_id] = conn
+            if self.tap:
+                self.tap.open(conn.conn_id, peer)
+            self.connect_upstream(conn)
+
+    def connect_upstream(self, conn):
+        """Hand the client a warm connection, or start a non-blocking connect"""
+        while True:
+            target = self.upstreams.choose(conn.tried)
+            if target is None:
+                tried = ", ".join(map(str, conn.tried))
+                self.close(conn, f"Cannot reach server: {tried}")
+                return
+            sock = self.upstreams.take_warm(target)
+            if sock:
+                sock.setblocking(False)
+                conn.attach(sock, target)
+                conn.connected = True
+                self.flush(conn.up)
+                self.update_interest(conn)
+                return
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.connect_started = time.perf_counter()
+            err = sock.connect_ex(target.address)
+            if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                conn.attach(sock, target)
+                self.update_interest(conn)
+                return
+            sock.close()
+            self.upstreams.record_connect(target, None)
+            self.upstreams.release(target)
+            conn.tried.append(target)
+
+    def detach_upstream(self, conn):
+        sock = conn.upstream
+        if conn.masks.pop(sock, 0):
+            self.selector.unregister(sock)
+        sock.close()
+        self.upstreams.release(conn.target)
+        conn.upstream = conn.target = None
+
+    def service(self, conn, sock, mask):
+        if conn.conn_id not in self.connections:
+            return  # Closed earlier in this round of events
+        try:
+            if not conn.connected and sock is conn.upstream:
+                if not mask & selectors.EVENT_WRITE:
+                    return
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    # Fail over to the next upstream
+                    self.upstreams.record_connect(conn.target, None)
+                    conn.tried.append(conn.target)
+                    self.detach_upstream(conn)
+                    self.connect_upstream(conn)
+                    return
+                self.upstreams.record_connect(conn.target, time.perf_counter() - conn.connect_started)
+                conn.connected = True
+                self.flush(conn.up)
+            if mask & selectors.EVENT_READ:
+                pipe = conn.up if sock is conn.client else conn.down
+                self.receive(conn, pipe)
+            if mask & selectors.EVENT_WRITE and conn.connected:
+                self.flush(conn.down if sock is conn.client else conn.up)
+        except OSError as e:
+            self.close(conn, None if isinstance(e, ConnectionResetError) else str(e))
+            return
+
+        if (conn.up.eof and not conn.up.has_data()) or (conn.down.eof and not conn.down.has_data()):
+            self.close(conn)
+        else:
+            self.update_interest(conn)
+
+    def receive(self, conn, pipe):
+        try:
+            n = pipe.source.recv_into(pipe.view[pipe.end:])
+        except (BlockingIOError, InterruptedError):
+            return
+        if not n:
+            pipe.eof = True
+            return
+        # Copy for the tap now (the buffer is reused), but forward before waking it
+        chunk = bytes(pipe.view[pipe.end:pipe.end + n]) if self.tap else None
+        pipe.end += n
+        self.bytes_relayed[pipe.direction] += n
+        if conn.connected:
+            self.flush(pipe)
+        if chunk:
+            self.tap.chunk(conn.conn_id, pipe.direction, chunk)
+
+    def flush(self, pipe):
+        """Send as much buffered data as the destination accepts right now"""
+        while pipe.has_data():
+            try:
+                sent = pipe.dest.send(pipe.view[pipe.start:pipe.end])
+            except (BlockingIOError, InterruptedError):
+                break
+            pipe.start += sent
+        if pipe.start == pipe.end:
+            pipe.start = pipe.end = 0
+        elif pipe.end == len(pipe.buffer) and pipe.start:
+            # Buffer full but partly sent: move the rest to the front
+            remaining = pipe.end - pipe.start
+            pipe.buffer[:remaining] = bytes(pipe.view[pipe.start:pipe.end])
+            pipe.start, pipe.end = 0, remaining
+
+    def update_interest(self, conn):
+        # Read while there is buffer space, write while there is data queued
+        for sock, outgoing, incoming in ((conn.client, conn.up, conn.down),
+                                         (conn.upstream, conn.down, conn.up)):
+            if sock is None:
+                continue  # No upstream chosen yet
+            mask = 0
+            if outgoing.has_room():
+                mask |= selectors.EVENT_READ
+            if incoming.has_data() or (sock is conn.upstream and not conn.connected):
+                mask |= selectors.EVENT_WRITE
+            if sock is conn.upstream and not conn.connected:
+                mask = selectors.EVENT_WRITE
+            old = conn.masks[sock]
+            if mask == old:
+                continue
+            if not old:
+                self.selector.register(sock, mask, conn)
+            elif not mask:
+                self.selector.unregister(sock)
+            else:
+                self.selector.modify(sock, mask, conn)
+            conn.masks[sock] = mask
+
+    def close(self, conn, error=None):
+        if self.connections.pop(conn.conn_id, None) is None:
+            return
+        if conn.upstream:
+            self.detach_upstream(conn)
+        if conn.masks.pop(conn.client, 0):
+            self.selector.unregister(conn.client)
+        conn.client.close()
+        if self.tap:
+            self.tap.close(conn.conn_id, error)
+
+class ThreadedRelay:
+    """Two threads per connection; decodes and reports inline before forwarding"""
+    def __init__(self, listen_host, listen_port, upstreams, monitor=None, bufsize=4096):
+        self.listen_addr = (listen_host, listen_port)
+        self.upstreams = upstreams
+        self.monitor = monitor
+        self.bufsize = bufsize
+        self.listener = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.next_id = 1
+
+    def start(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.listen_addr)
+        self.listener.listen(socket.SOMAXCONN)
+        self.upstreams.start()
+        self.running = True
+        threading.Thread(target=self.accept_connections, daemon=True).start()
+        return self.listener.getsockname()[1]
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
+        for conn_id in list(self.connections):
+            self.close(conn_id)
+        self.upstreams.stop()
+
+    def accept_connections(self):
+        while self.running:
+            try:
+                client, peer = self.listener.accept()
+            except:
+                break
+            with self.lock:
+                conn_id = self.next_id
+                self.next_id += 1
+            threading.Thread(target=self.handle_connection,
+                             args=(conn_id, client, peer), daemon=True).start()
+
+    def handle_connection(self, conn_id, client, peer):
+        if self.monitor:
+            self.monitor.on_open(conn_id, peer)
+        try:
+            target, upstream = self.upstreams.acquire()
+        except OSError as e:
+            client.close()
+            if self.monitor:
+                self.monitor.on_close(conn_id, f"Cannot reach server: {e}")
+            return
+        self.connections[conn_id] = (client, upstream, target)
+        threading.Thread(target=self.pump, args=(conn_id, client, upstream, CLIENT_TO_SERVER),
+                         daemon=True).start()
+        self.pump(conn_id, upstream, client, SERVER_TO_CLIENT)
+
+    def pump(self, conn_id, source, dest, direction):
+        decoder = FrameDecoder()
+        while self.running:
+            try:
+                data = source.recv(self.bufsize)
+                if not data:
+                    break
+                if self.monitor:
+                    for message in decoder.feed(data):
+                        self.monitor.on_message(conn_id, direction, message)
+                dest.sendall(data)
+            except:
+                break
+        self.close(conn_id)
+
+    def close(self, conn_id):
+        with self.lock:
+            connection = self.connections.pop(conn_id, None)
+        if connection is None:
+            return
+        client, upstream, target = connection
+        self.upstreams.release(target)
+        for sock in (client, upstream):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self.monitor:
+            self.monitor.on_close(conn_id, None)
+
+# Relays selectable from the monitor GUI
+RELAYS = {
+    "Selector": SelectorRelay,
+    "Threaded": ThreadedRelay
+}
@@ -0,0 +1,113 @@
+"""Chat rooms: per-room member sets for ChatServer.
+
+Clients join rooms with protocol commands (/join, /leave, /rooms) and a
+chat message only fans out to the members of the sender's current room,
+so traffic scales with the audience rather than the whole server. Member
+sets are updated incrementally on join/leave; broadcast iterates a cached
+tuple snapshot of a room that is only rebuilt after its membership changed.
+"""
+import re
+import threading
+
+DEFAULT_ROOM = "lobby"
+ROOM_NAME = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+def normalize_room(name):
+    """Strip a leading '#' and validate; returns None for invalid names"""
+    name = name.strip().lstrip("#")
+    return name.lower() if ROOM_NAME.match(name) else None
+
+def room_prefix(room):
+    """Messages in the default room keep the old format; other rooms are tagged"""
+    return "" if room == DEFAULT_ROOM else f"[#{room}] "
+
+class RoomManager:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.members = {}       # room -> {client: username}
+        self.memberships = {}   # client -> set of rooms
+        self.active = {}        # client -> room plain messages go to
+        self.snapshots = {}     # room -> tuple of (client, username)
+
+    def join(self, client, username, room):
+        """Join a room (or switch to it if already a member) and make it active"""
+        with self.lock:
+            members = self.members.setdefault(room, {})
+            is_new = client not in members
+            if is_new:
+                members[client] = username
+                self.memberships.setdefault(client, set()).add(room)
+                self.snapshots.pop(room, None)
+            self.active[client] = room
+            return is_new
+
+    def leave(self, client, room):
+        """Leave a room; returns False if the client wasn't in it"""
+        with self.lock:
+            if client not in self.members.get(room, ()):
+                return False
+            self._drop(client, room)
+            rooms = self.memberships.get(client)
+            if not rooms:
+                self.memberships.pop(client, None)
+                self.active.pop(client, None)
+            elif self.active.get(client) == room:
+                self.active[client] = min(rooms)
+            return True
+
+    def remove_client(self, client):
+        """Drop a disconnected client from every room; returns the rooms it was in"""
+        with self.lock:
+            rooms = self.memberships.pop(client, set())
+            for room in rooms:
+                self._drop(client, room)
+            self.active.pop(client, None)
+            return rooms
+
+    def _drop(self, client, room):
+        members = self.members[room]
+        del members[client]
+        if not members:
+            del self.members[room]
+        self.memberships.get(client, set()).discard(room)
+        self.snapshots.pop(room, None)
+
+    def snapshot(self, room):
+        """Immutable (client, username) tuple for a room, rebuilt only after changes"""
+        snapshot = self.snapshots.get(room)
+        if snapshot is None:
+            with self.lock:
+                snapshot = self.snapshots.get(room)
+                if snapshot is None:
+                    snapshot = tuple(self.members.get(room, {}).items())
+                    self.snapshots[room] = snapshot
+        return snapshot
+
+    def recipients(self, rooms):
+        """Members of several rooms, each client listed once"""
+        rooms = list(rooms)
+        if len(rooms) == 1:
+            return self.snapshot(rooms[0])
+        seen = {}
+        for room in rooms:
+            for client, username in self.snapshot(room):
+                seen[client] = username
+        return tuple(seen.items())
+
+    def active_room(self, client):
+        return self.active.get(client)
+
+    def rooms_of(self, client):
+        with self.lock:
+            return sorted(self.memberships.get(client, ()))
+
+    def room_counts(self):
+        with self.lock:
+            return {room: len(members) for room, members in sorted(self.members.items())}
+
+    def clear(self):
+        with self.lock:
+            self.members.clear()
+            self.memberships.clear()
+            self.active.clear()
+            self.snapshots.clear()
@@ -1,15 +1,44 @@
 import socket
 import threading
+import asyncio
+import concurrent.futures
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
 from datetime import datetime
 from ttkthemes import ThemedTk
+from protocol import encode_frame, iter_frames, aiter_frames, FrameDecoder, TOO_LARGE
+from connections import ClientConnection, AsyncClientConnection, QueueStats, SLOW_CONSUMER_POLICIES
+from count_updates import CountUpdateScheduler
+from client_registry import ClientRegistry
+from rooms import RoomManager, DEFAULT_ROOM, normalize_room, room_prefix
+from history import MessageHistory
+from server_log import LogPipeline
+from user_list import UserListModel
+from server_registry import ServerRegistry, HEARTBEAT_INTERVAL
+from sessions import SessionStore, parse_hello, RESUME_TTL, RESUME_LIMIT
+from ratelimit import TokenBucket
+from metrics import Counter, MetricsRegistry, MetricsServer
 import json
 import os 
+import queue
+import re
+import time
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 os.makedirs(DATA_DIR, exist_ok=True) 
 
+REGISTRY_FILE = os.path.join(DATA_DIR, "server_registry.json")
+LOG_FILE = os.path.join(DATA_DIR, "server.log")
+LOG_MAX_LINES = 2000      # Lines kept in the log window; the full log goes to LOG_FILE
+LOG_FLUSH_MS = 100        # How often the GUI drains queued log records
+LOG_BATCH_SIZE = 500      # Most records inserted per drain, so the GUI stays responsive
+STATS_REFRESH_MS = 1000   # How often the stats panel re-reads the server's metrics
+
+# Broadcast timing and fan-out buckets (seconds, recipients)
+BROADCAST_SECONDS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                     0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+BROADCAST_RECIPIENTS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
 class ChatServerGUI:
     def __init__(self):
         self.root = ThemedTk(theme="arc")
@@ -39,8 +68,18 @@ class ChatServerGUI:
         
         self.server = None
         self.max_users = 10  # Default max users
+        # Listbox models, kept in sync by membership events from the server
+        self.user_list = UserListModel()
+        self.blocked_list = UserListModel()
+        self.membership_events = queue.SimpleQueue()
+        # Server threads queue log lines here; the Tk loop inserts them in batches
+        self.log_pipeline = LogPipeline(LOG_FILE)
         self.create_widgets()
         self.configure_tags()
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
+        self.root.after(LOG_FLUSH_MS, self.update_user_lists)
+        self.last_stats = None  # (time, snapshot) of the previous stats refresh
+        self.root.after(STATS_REFRESH_MS, self.update_stats)
         
     def configure_tags(self):
         """Configure text tags for different log types"""
@@ -125,6 +164,48 @@ class ChatServerGUI:
         self.max_message_size_entry.insert(0, "1024")
         self.max_message_size_entry.pack(side=tk.LEFT, padx=5)
         
+        # Minimum seconds between user count updates sent to clients
+        ttk.Label(config_frame, text="Count Update (s):").pack(side=tk.LEFT, padx=5)
+        self.count_interval_entry = ttk.Entry(config_frame, width=4)
+        self.count_interval_entry.insert(0, "1.0")
+        self.count_interval_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Messages replayed to clients when they join a room (0 turns history off)
+        ttk.Label(config_frame, text="History:").pack(side=tk.LEFT, padx=5)
+        self.history_size_entry = ttk.Entry(config_frame, width=4)
+        self.history_size_entry.insert(0, "50")
+        self.history_size_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Engine selection: classic thread-per-client or single-threaded asyncio
+        ttk.Label(config_frame, text="Engine:").pack(side=tk.LEFT, padx=5)
+        self.engine_var = tk.StringVar(value="Threaded")
+        self.engine_combo = ttk.Combobox(
+            config_frame,
+            textvariable=self.engine_var,
+            values=list(ENGINES),
+            state='readonly',
+            width=9
+        )
+        self.engine_combo.pack(side=tk.LEFT, padx=5)
+        
+        # What to do with clients whose outbound queue is full
+        ttk.Label(config_frame, text="Slow Clients:").pack(side=tk.LEFT, padx=5)
+        self.slow_policy_var = tk.StringVar(value="drop")
+        self.slow_policy_combo = ttk.Combobox(
+            config_frame,
+            textvariable=self.slow_policy_var,
+            values=SLOW_CONSUMER_POLICIES,
+            state='readonly',
+            width=10
+        )
+        self.slow_policy_combo.pack(side=tk.LEFT, padx=5)
+        
+        # HTTP port for /metrics (blank turns the endpoint off)
+        ttk.Label(config_frame, text="Metrics Port:").pack(side=tk.LEFT, padx=5)
+        self.metrics_port_entry = ttk.Entry(config_frame, width=6)
+        self.metrics_port_entry.insert(0, "9100")
+        self.metrics_port_entry.pack(side=tk.LEFT, padx=5)
+        
         # Content area with paned window
         content = ttk.PanedWindow(main_container, orient=tk.HORIZONTAL)
         content.pack(fill=tk.BOTH, expand=True)
@@ -253,6 +334,18 @@ class ChatServerGUI:
         )
         self.user_count_label.pack(anchor=tk.E, pady=(0, 5))
         
+        # Live server statistics, refreshed by update_stats
+        stats_frame = ttk.LabelFrame(user_frame, text="Server Stats", padding="5")
+        stats_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.stats_label = ttk.Label(
+            stats_frame,
+            text="Server not running",
+            font=self.fonts['status'],
+            justify=tk.LEFT
+        )
+        self.stats_label.pack(anchor=tk.W)
+        
         # Add server message controls
         message_frame = ttk.LabelFrame(user_frame, text="Server Messages", padding="5")
         message_frame.pack(fill=tk.X, pady=(0, 10))
@@ -304,7 +397,10 @@ class ChatServerGUI:
         try:
             with open(filename, "w") as f:
                 f.write(self.log_display.get(1.0, tk.END))
-            messagebox.showinfo("Success", f"Log saved to {filename}")
+            messagebox.showinfo(
+                "Success",
+                f"Last {LOG_MAX_LINES} lines saved to {filename}\nFull log: {LOG_FILE}"
+            )
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save log: {e}")
             
@@ -313,7 +409,7 @@ class ChatServerGUI:
         selection = self.user_listbox.curselection()
         if selection:
             self.username_entry.delete(0, tk.END)
-            self.username_entry.insert(0, self.user_listbox.get(selection[0]))
+            self.username_entry.insert(0, self.user_list.key_at(selection[0]))
             self.kick_user()
 
     def block_selected_user(self):
@@ -321,7 +417,7 @@ class ChatServerGUI:
         selection = self.user_listbox.curselection()
         if selection:
             self.username_entry.delete(0, tk.END)
-            self.username_entry.insert(0, self.user_listbox.get(selection[0]))
+            self.username_entry.insert(0, self.user_list.key_at(selection[0]))
             self.block_user()
 
     def show_user_menu(self, event):
@@ -331,23 +427,25 @@ class ChatServerGUI:
 
     def filter_users(self, event=None):
         """Filter users in listbox based on search text"""
-        search_text = self.user_filter.get().lower()
-        selected_user = None
-        
-        # Store currently selected user before clearing
-        if self.user_listbox.curselection():
-            selected_user = self.user_listbox.get(self.user_listbox.curselection())
-        
-        self.user_listbox.delete(0, tk.END)
-        if self.server:
-            for username in self.server.clients.values():
-                if search_text in username.lower():
-                    self.user_listbox.insert(tk.END, username)
-                    # Reselect user if it's still in filtered list
-                    if username == selected_user:
-                        self.user_listbox.selection_set(tk.END)
-                        self.username_entry.delete(0, tk.END)
-                        self.username_entry.insert(0, username)
+        self.apply_list_edits(self.user_listbox, self.user_list.set_filter(self.user_filter.get()))
+
+    def apply_list_edits(self, listbox, edits):
+        """Apply edits from a UserListModel to its listbox"""
+        for edit in edits:
+            if edit[0] == "insert":
+                listbox.insert(edit[1], edit[2])
+            elif edit[0] == "replace":
+                # Relabel in place and keep the row selected if it was
+                row, label = edit[1], edit[2]
+                selected = listbox.selection_includes(row)
+                listbox.delete(row)
+                listbox.insert(row, label)
+                if selected:
+                    listbox.selection_set(row)
+            elif edit[0] == "delete":
+                listbox.delete(edit[1])
+            else:
+                listbox.delete(0, tk.END)
 
     def kick_user(self):
         """Kick user by name or selection"""
@@ -360,25 +458,15 @@ class ChatServerGUI:
         if not username:
             selection = self.user_listbox.curselection()
             if selection:
-                username = self.user_listbox.get(selection[0])
+                username = self.user_list.key_at(selection[0])
             else:
                 messagebox.showerror("Error", "Please enter a username or select a user")
                 return
         
-        if username in self.server.clients.values():
+        if self.server.clients.has_user(username):
             if messagebox.askyesno("Confirm Kick", f"Kick user {username}?"):
-                # Find and close user's connection
-                for sock, name in list(self.server.clients.items()):
-                    if name == username:
-                        try:
-                            sock.send("[System: You have been kicked from the server]".encode())
-                            sock.close()
-                            del self.server.clients[sock]
-                            self.log_message(f"Kicked user: {username}", 'warning')
-                            self.server.broadcast(f"[System: {username} has been kicked from the server]")
-                        except:
-                            pass
-                        break
+                if self.server.kick_user(username):
+                    self.log_message(f"Kicked user: {username}", 'warning')
                 self.username_entry.delete(0, tk.END)
         else:
             messagebox.showerror("Error", f"User '{username}' not found")
@@ -394,7 +482,7 @@ class ChatServerGUI:
         if not username:
             selection = self.user_listbox.curselection()
             if selection:
-                username = self.user_listbox.get(selection[0])
+                username = self.user_list.key_at(selection[0])
             else:
                 messagebox.showerror("Error", "Please enter a username or select a user")
                 return
@@ -419,19 +507,28 @@ class ChatServerGUI:
             server_name = self.server_name_entry.get().strip()
             max_users = int(self.max_users_entry.get().strip())
             max_message_size = int(self.max_message_size_entry.get().strip())
+            count_update_interval = float(self.count_interval_entry.get().strip())
+            history_size = int(self.history_size_entry.get().strip())
+            metrics_port = self.metrics_port_entry.get().strip()
+            metrics_port = int(metrics_port) if metrics_port else None
             
             if max_users < 1:
                 raise ValueError("Maximum users must be at least 1")
             if max_message_size < 1:
                 raise ValueError("Maximum message size must be at least 1")
             
-            self.server = ChatServer(
+            server_class = ENGINES[self.engine_var.get()]
+            self.server = server_class(
                 host=host, 
                 port=port, 
                 gui=self, 
                 server_name=server_name,
                 max_users=max_users,
-                max_message_size=max_message_size
+                max_message_size=max_message_size,
+                slow_consumer_policy=self.slow_policy_var.get(),
+                count_update_interval=count_update_interval,
+                history_size=history_size,
+                metrics_port=metrics_port
             )
             self.server.start_server()
             
@@ -439,11 +536,13 @@ class ChatServerGUI:
             self.host_entry.config(state='disabled')
             self.port_entry.config(state='disabled')
             self.server_name_entry.config(state='disabled')
+            self.engine_combo.config(state='disabled')
+            self.slow_policy_combo.config(state='disabled')
+            self.metrics_port_entry.config(state='disabled')
             
             self.start_button.config(state=tk.DISABLED)
             self.stop_button.config(state=tk.NORMAL)
             self.status_label.configure(text="Server Status: Running", foreground=self.colors['success'])
-            self.update_user_lists()
         except ValueError:
             messagebox.showerror("Error", "Invalid port number")
         except Exception as e:
@@ -453,11 +552,17 @@ class ChatServerGUI:
         if self.server:
             self.server.stop_server()
             self.server = None
+            self.apply_list_edits(self.user_listbox, self.user_list.clear())
+            self.apply_list_edits(self.blocked_listbox, self.blocked_list.clear())
+            self.user_count_label.configure(text="Users: 0", foreground=self.colors['text'])
             
             # Re-enable configuration
             self.host_entry.config(state='normal')
             self.port_entry.config(state='normal')
             self.server_name_entry.config(state='normal')
+            self.engine_combo.config(state='readonly')
+            self.slow_policy_combo.config(state='readonly')
+            self.metrics_port_entry.config(state='normal')
             
             self.start_button.config(state=tk.NORMAL)
             self.stop_button.config(state=tk.DISABLED)
@@ -477,6 +582,7 @@ class ChatServerGUI:
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Do you want to close the server?"):
             self.stop_server()
+            self.log_pipeline.close()
             self.root.destroy()
 
     def send_server_message(self, level):
@@ -499,206 +605,668 @@ class ChatServerGUI:
         # Broadcast to clients
         self.server.broadcast(formatted_msg)
 
+    def membership_event(self, server, kind, username):
+        """Queue a membership change ("user" or "blocked"); called from server threads"""
+        self.membership_events.put((server, kind, username))
+
     def update_user_lists(self):
-        if self.server:
-            # Store current filter and selection
-            search_text = self.user_filter.get().lower()
-            selected_user = None
-            if self.user_listbox.curselection():
-                selected_user = self.user_listbox.get(self.user_listbox.curselection())
-            
-            # Update connected users with filter
-            self.user_listbox.delete(0, tk.END)
-            for username in self.server.clients.values():
-                if search_text in username.lower():
-                    self.user_listbox.insert(tk.END, username)
-                    # Restore selection if user still exists
-                    if username == selected_user:
-                        self.user_listbox.selection_set(tk.END)
-                        self.username_entry.delete(0, tk.END)
-                        self.username_entry.insert(0, username)
-            
-            # Update blocked users
-            self.blocked_listbox.delete(0, tk.END)
-            for username in self.server.blocked_users:
-                self.blocked_listbox.insert(tk.END, username)
-            
-            # Update user count
+        """Apply queued membership events to the user lists as incremental edits"""
+        # Events only say who changed; the current state is read here, so
+        # events arriving out of order from different threads can't leave stale rows
+        changed = {}
+        while True:
+            try:
+                server, kind, username = self.membership_events.get_nowait()
+            except queue.Empty:
+                break
+            if server is self.server:  # Skip leftovers from a stopped server
+                changed[(kind, username)] = True
+        
+        for kind, username in changed:
+            if kind == "user":
+                rooms = self.server.rooms_of_user(username)
+                if rooms is None:
+                    edits = self.user_list.remove(username)
+                else:
+                    room_list = ", ".join(f"#{room}" for room in rooms)
+                    edits = self.user_list.upsert(username, f"{username}  ({room_list})" if rooms else username)
+                self.apply_list_edits(self.user_listbox, edits)
+            else:
+                if username in self.server.blocked_users:
+                    edits = self.blocked_list.upsert(username, username)
+                else:
+                    edits = self.blocked_list.remove(username)
+                self.apply_list_edits(self.blocked_listbox, edits)
+        
+        if changed and self.server:
             current_users = len(self.server.clients)
             self.user_count_label.configure(
                 text=f"Users: {current_users}/{self.server.max_users}",
                 foreground=self.colors['error'] if current_users >= self.server.max_users else self.colors['text']
             )
+        self.root.after(LOG_FLUSH_MS, self.update_user_lists)
+
+    def update_stats(self):
+        """Refresh the stats panel from the server's metrics, with rates since the last refresh"""
+        if not self.server:
+            self.last_stats = None
+            self.stats_label.configure(text="Server not running")
+            self.root.after(STATS_REFRESH_MS, self.update_stats)
+            return
+        now = time.monotonic()
+        stats = self.server.metrics.snapshot()
+        rates = {}
+        if self.last_stats:
+            elapsed = now - self.last_stats[0]
+            for name in ("chat_messages_received_total", "chat_frames_sent_total",
+                         "chat_bytes_received_total", "chat_bytes_sent_total"):
+                try:
+                    rates[name] = max(0, stats[name] - self.last_stats[1][name]) / elapsed
+                except:
+                    rates[name] = 0
+        self.last_stats = (now, stats)
         
-        # Schedule next update
-        self.root.after(1000, self.update_user_lists)
+        broadcast = stats["chat_broadcast_seconds"]
+        fanout = stats["chat_broadcast_recipients"]
+        lines = [
+            f"Clients: {stats['chat_clients']}   Rooms: {stats['chat_rooms']}   Threads: {stats['chat_threads']}",
+            f"Messages in: {rates.get('chat_messages_received_total', 0):.1f}/s"
+            f"   Frames out: {rates.get('chat_frames_sent_total', 0):.1f}/s",
+            f"Bytes in: {rates.get('chat_bytes_received_total', 0) / 1024:.1f} KB/s"
+            f"   Bytes out: {rates.get('chat_bytes_sent_total', 0) / 1024:.1f} KB/s",
+            f"Send queues: {stats['chat_send_queue_depth']} queued, deepest {stats['chat_send_queue_max_depth']}",
+            f"Dropped: {stats['chat_frames_dropped_total']}   Slow disconnects: {stats['chat_slow_disconnects_total']}",
+            f"Rejected: {stats['chat_frames_rejected_total']}   Rate limited: {stats['chat_frames_rate_limited_total']}",
+        ]
+        if broadcast and broadcast["count"]:
+            lines.append(
+                f"Broadcast p50/p99: {broadcast['p50'] * 1000:.2f}/{broadcast['p99'] * 1000:.2f} ms"
+                f"   fan-out p99: {fanout['p99']}"
+            )
+        self.stats_label.configure(text="\n".join(lines))
+        self.root.after(STATS_REFRESH_MS, self.update_stats)
 
     def log_message(self, message, level='info'):
-        """Log message with timestamp and level-based formatting"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-        self.log_display.insert(tk.END, f"{message}\n", level)
-        self.log_display.see(tk.END)
+        """Queue a log message; safe to call from server threads"""
+        self.log_pipeline.put(message, level)
+
+    def flush_log(self):
+        """Insert queued log records in one batch and trim the window to LOG_MAX_LINES"""
+        records = self.log_pipeline.drain(LOG_BATCH_SIZE)
+        if records:
+            # One insert call for the whole batch: text, tag, text, tag, ...
+            chunks = []
+            for timestamp, message, level in records:
+                chunks += [f"[{timestamp}] ", 'timestamp', f"{message}\n", level]
+            self.log_display.insert(tk.END, *chunks)
+            
+            excess = int(self.log_display.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0:
+                self.log_display.delete('1.0', f'{excess + 1}.0')
+            self.log_display.see(tk.END)
+        # Come back sooner while there is a backlog
+        self.root.after(1 if len(records) == LOG_BATCH_SIZE else LOG_FLUSH_MS, self.flush_log)
 
 class ChatServer:
     def __init__(self, host='127.0.0.1', port=9999, gui=None, server_name="Main Server", 
-                 max_users=10, max_message_size=1024):
+                 max_users=10, max_message_size=1024, send_queue_size=256,
+                 slow_consumer_policy="drop", count_update_interval=1.0,
+                 history_size=50, history_path=None, resume_ttl=RESUME_TTL,
+                 message_rate=20.0, message_burst=40, metrics_port=None,
+                 bus=None, reuse_port=False, register=True, history_ids=None):
         self.host = host
         self.port = port
         self.server_name = server_name
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.clients = {}
+        # Cluster shard (cluster.py): several processes share the port and
+        # exchange broadcasts and block/kick events over the bus
+        self.bus = bus
+        self.reuse_port = reuse_port
+        self.register = register
+        self.clients = ClientRegistry()
+        self.rooms = RoomManager()
+        self.registry = ServerRegistry(REGISTRY_FILE)
+        self.heartbeat_stop = threading.Event()
         self.blocked_users = set()
         self.is_running = False
         self.gui = gui
         self.max_users = max_users
         self.max_message_size = max_message_size
+        # Frames per second each client may send, and how many at once (0: no limit)
+        self.message_rate = message_rate
+        self.message_burst = message_burst
+        # Outbound queue per client; what to do when a client can't keep up
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.queue_stats = QueueStats()
+        # Counters and histograms, served over HTTP if metrics_port is set
+        self.metrics = MetricsRegistry()
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.register_metrics()
+        # At most one COUNT_UPDATE per interval; 0 sends one with every broadcast
+        self.count_update_interval = count_update_interval
+        self.count_updates = CountUpdateScheduler(
+            lambda: len(self.clients),
+            self.send_count_update,
+            self.call_later,
+            count_update_interval
+        )
+        # Persistent history: last history_size messages replayed on join
+        self.history = None
+        self.history_cursors = {}  # client -> {room: oldest message id sent}
+        # Rooms of recently disconnected HELLO clients, for resuming
+        self.sessions = SessionStore(resume_ttl)
+        if history_size > 0:
+            if history_path is None:
+                safe_name = re.sub(r"[^A-Za-z0-9_-]+", "_", server_name)
+                history_path = os.path.join(DATA_DIR, f"history_{safe_name}.db")
+            try:
+                self.history = MessageHistory(history_path, history_size, id_counter=history_ids)
+            except Exception as e:
+                if self.gui:
+                    self.gui.log_message(f"History disabled: {e}", 'warning')
 
-    def broadcast(self, message, exclude_client=None, update_count=True):
-        """Send message to all clients except the sender"""
-        # Send the message
-        for client in self.clients:
-            if client != exclude_client and self.clients[client] not in self.blocked_users:
-                try:
-                    client.send(message.encode())
-                except:
-                    self.remove_client(client)
+    def register_metrics(self):
+        metrics = self.metrics
+        stats = self.queue_stats
+        self.messages_received = metrics.counter(
+            "chat_messages_received_total", "Chat messages and commands accepted from clients")
+        self.frames_rejected = metrics.counter(
+            "chat_frames_rejected_total", "Frames rejected as too large or not UTF-8")
+        self.frames_rate_limited = metrics.counter(
+            "chat_frames_rate_limited_total", "Frames dropped by the per-client rate limit")
+        # Bytes from connections that have closed; open ones are read off their decoders
+        self.bytes_received_closed = Counter("chat_closed_bytes_received", "")
+        metrics.counter("chat_bytes_received_total", "Bytes received from clients",
+                        lambda: self.bytes_received_closed.value + sum(
+                            client.decoder.received for client in self.clients if client.decoder))
+        metrics.counter("chat_frames_sent_total", "Frames queued to clients",
+                        lambda: stats.frames_queued)
+        metrics.counter("chat_bytes_sent_total", "Bytes queued to clients",
+                        lambda: stats.bytes_queued)
+        metrics.counter("chat_frames_dropped_total", "Frames dropped because a client's queue was full",
+                        lambda: stats.frames_dropped)
+        metrics.counter("chat_slow_disconnects_total", "Clients disconnected for not keeping up",
+                        lambda: stats.slow_disconnects)
+        self.connections_accepted = metrics.counter(
+            "chat_connections_accepted_total", "Connections accepted")
+        self.connections_refused = metrics.counter(
+            "chat_connections_refused_total", "Connections turned away because the server was full")
+        self.broadcast_seconds = metrics.histogram(
+            "chat_broadcast_seconds", "Time to queue one broadcast to every recipient", BROADCAST_SECONDS)
+        self.broadcast_recipients = metrics.histogram(
+            "chat_broadcast_recipients", "Recipients per broadcast", BROADCAST_RECIPIENTS)
+        metrics.gauge("chat_clients", "Connected clients", lambda: len(self.clients))
+        metrics.gauge("chat_rooms", "Rooms with members", lambda: len(self.rooms.room_counts()))
+        metrics.gauge("chat_send_queue_depth", "Frames waiting in all client send queues",
+                      lambda: self.queue_status()["total_depth"])
+        metrics.gauge("chat_send_queue_max_depth", "Deepest client send queue",
+                      lambda: self.queue_status()["max_depth"])
+        metrics.gauge("chat_threads", "Threads in the server process", threading.active_count)
+
+    def start_metrics(self):
+        if self.metrics_port is None:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, self.host, self.metrics_port)
+            port = self.metrics_server.start()
+            if self.gui:
+                self.gui.log_message(f"Metrics at http://{self.host}:{port}/metrics")
+        except OSError as e:
+            self.metrics_server = None
+            if self.gui:
+                self.gui.log_message(f"Metrics endpoint disabled: {e}", 'warning')
+
+    def stop_metrics(self):
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def queue_status(self):
+        """Snapshot of outbound queue depth and drop counters"""
+        depths = [client.queue_depth for client in self.clients]
+        return {
+            "total_depth": sum(depths),
+            "max_depth": max(depths, default=0),
+            "frames_queued": self.queue_stats.frames_queued,
+            "frames_dropped": self.queue_stats.frames_dropped,
+            "slow_disconnects": self.queue_stats.slow_disconnects
+        }
+
+    def broadcast(self, message, exclude_client=None, update_count=True, rooms=None, message_id=None):
+        """Send message to all clients (or only members of the given rooms) except the sender"""
+        self.fan_out(message, exclude_client, rooms, message_id)
+        if self.bus:
+            # Other shards deliver it to their own clients
+            self.bus.publish("broadcast", message, rooms, message_id)
         
-        # Send updated user count if requested
         if update_count:
-            count_info = {
-                "type": "user_count",
-                "current": len(self.clients),
-                "max": self.max_users
-            }
-            count_msg = f"COUNT_UPDATE:{json.dumps(count_info)}"
-            for client in self.clients:
-                try:
-                    client.send(count_msg.encode())
-                except:
-                    continue
+            if self.count_update_interval > 0:
+                self.count_updates.request_update()
+            else:
+                # Uncoalesced: a count update with every broadcast
+                self.send_count_update(len(self.clients))
 
-    def handle_client(self, client_socket):
-        try:
-            # Check if server is full before accepting new client
-            if len(self.clients) >= self.max_users:
-                client_socket.send("[System: Server is full, try again later]".encode())
-                client_socket.close()
-                return
-                
-            # Send server info with max users and message size limit
-            server_info = {
-                "name": self.server_name,
-                "host": self.host,
-                "port": self.port,
-                "max_users": self.max_users,
-                "current_users": len(self.clients),
-                "max_message_size": self.max_message_size  # Add message size limit
-            }
-            client_socket.send(f"SERVER_INFO:{json.dumps(server_info)}".encode())
+    def fan_out(self, message, exclude_client=None, rooms=None, message_id=None):
+        """Queue message to this server's own clients"""
+        # Encode once and share the same bytes with every recipient's queue.
+        # Queueing never blocks, so one slow client can't stall the others;
+        # clients whose writer fails are cleaned up by their own handler
+        started = time.perf_counter()
+        message_frame = encode_frame(message)
+        # Resumable clients get the message id with it
+        sequenced_frame = message_frame
+        if message_id is not None:
+            sequenced_frame = encode_frame(f"MSG:{json.dumps({'id': message_id, 'text': message})}")
+        recipients = self.clients.snapshot() if rooms is None else self.rooms.recipients(rooms)
+        for client, username in recipients:
+            if client != exclude_client and username not in self.blocked_users:
+                client.enqueue(sequenced_frame if client.sequenced else message_frame)
+        self.broadcast_seconds.observe(time.perf_counter() - started)
+        self.broadcast_recipients.observe(len(recipients))
+
+    def count_update_frame(self, count):
+        count_info = {
+            "type": "user_count",
+            "current": count,
+            "max": self.max_users
+        }
+        return encode_frame(f"COUNT_UPDATE:{json.dumps(count_info)}")
+
+    def send_count_update(self, count):
+        """Push a user count update to every client"""
+        count_frame = self.count_update_frame(count)
+        for client in self.clients:
+            client.enqueue(count_frame)
+
+    def call_later(self, delay, callback):
+        """Run callback after delay seconds on a timer thread"""
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def admit_client(self, client_socket):
+        """Send server info to a new connection, or turn it away if the server is full"""
+        self.connections_accepted.inc()
+        # Check if server is full before accepting new client
+        if len(self.clients) >= self.max_users:
+            self.connections_refused.inc()
+            client_socket.enqueue(encode_frame("[System: Server is full, try again later]"))
+            client_socket.close()
+            return False
             
-            # Get username
-            username = client_socket.recv(1024).decode()
+        # Send server info with max users and message size limit
+        server_info = {
+            "name": self.server_name,
+            "host": self.host,
+            "port": self.port,
+            "max_users": self.max_users,
+            "current_users": len(self.clients),
+            "max_message_size": self.max_message_size  # Add message size limit
+        }
+        client_socket.enqueue(encode_frame(f"SERVER_INFO:{json.dumps(server_info)}"))
+        return True
+
+    def register_client(self, client_socket, username, last_seen=None):
+        """Add a client once it has sent its username, unless it is blocked.
+        last_seen: a resuming client's last message id"""
+        # Check if username is blocked
+        if username in self.blocked_users:
+            client_socket.enqueue(encode_frame("[System: You are blocked from this server]"))
+            client_socket.close()
+            return False
             
-            # Check if username is blocked
-            if username in self.blocked_users:
-                client_socket.send("[System: You are blocked from this server]".encode())
-                client_socket.close()
-                return
-                
-            self.clients[client_socket] = username
+        self.clients.add(client_socket, username)
+        session = self.sessions.restore(username) if client_socket.sequenced else None
+        if session:
+            # Back in the same rooms, the active one last
+            rooms, active = session
+            for room in sorted(rooms, key=lambda room: room == active):
+                self.rooms.join(client_socket, username, room)
+        else:
+            rooms = [DEFAULT_ROOM]
+            self.rooms.join(client_socket, username, DEFAULT_ROOM)
+        if session and isinstance(last_seen, int) and self.history:
+            self.send_missed(client_socket, rooms, last_seen)
+        else:
+            for room in rooms:
+                self.replay_history(client_socket, room)
+        self.publish_user(username)
+        
+        if self.gui:
+            self.gui.log_message(f"{username} joined the chat!", 'success')
+        
+        # Tell the rooms the user is in (all of them when resuming, as on leaving) and update counts
+        self.broadcast(f"{username} joined the chat!", rooms=rooms)
+        return True
+
+    def client_decoder(self, client_socket):
+        """Frame decoder for one client: size-limited, and rate-limited if configured"""
+        if self.message_rate > 0:
+            client_socket.limiter = TokenBucket(self.message_rate, self.message_burst)
+        client_socket.decoder = FrameDecoder(
+            self.max_message_size,
+            lambda reason, length: self.reject_frame(client_socket, reason, length)
+        )
+        return client_socket.decoder
+
+    def reject_frame(self, client_socket, reason, length):
+        """Called by the decoder instead of buffering an oversized or garbled frame"""
+        self.frames_rejected.inc()
+        if not self.allow_frame(client_socket):
+            return
+        if reason == TOO_LARGE:
+            client_socket.enqueue(encode_frame("[System: Message exceeds maximum size limit]"))
+        else:
+            client_socket.enqueue(encode_frame("[System: Message is not valid UTF-8]"))
+
+    def allow_frame(self, client_socket):
+        """Charge the client's token bucket; False if the frame must be dropped"""
+        limiter = client_socket.limiter
+        if limiter is None or limiter.consume():
+            if limiter:
+                limiter.limited = False
+            return True
+        self.frames_rate_limited.inc()
+        if not limiter.limited:
+            # Say so once per burst of dropped frames
+            limiter.limited = True
+            client_socket.enqueue(encode_frame("[System: You are sending too fast, messages are being dropped]"))
+        return False
+
+    def handle_message(self, client_socket, username, message):
+        """Relay one chat message received from a registered client"""
+        if not self.allow_frame(client_socket):
+            return
+        self.messages_received.inc()
+        
+        if message.startswith("/"):
+            self.handle_command(client_socket, username, message)
+            return
             
+        if username not in self.blocked_users:
+            room = self.rooms.active_room(client_socket)
+            if room is None:
+                client_socket.enqueue(encode_frame("[System: You are not in a room, use /join <room>]"))
+                return
+            broadcast_message = f"{room_prefix(room)}{username}: {message}"
+            message_id = None
+            if self.history:
+                # Only queues the message; the history writer thread commits it
+                message_id = self.history.append(room, broadcast_message)
+            self.broadcast(broadcast_message, client_socket, rooms=[room], message_id=message_id)
+            if client_socket.sequenced and message_id is not None:
+                client_socket.enqueue(encode_frame(f"ACK:{json.dumps({'id': message_id})}"))
+            if self.gui:
+                self.gui.log_message(broadcast_message, 'info')
+
+    def handle_command(self, client_socket, username, message):
+        """Room commands: /join <room>, /leave [room], /rooms, /history"""
+        command, _, argument = message.partition(" ")
+        command = command.lower()
+        
+        def reply(text):
+            client_socket.enqueue(encode_frame(f"[System: {text}]"))
+        
+        if command == "/join":
+            room = normalize_room(argument)
+            if not room:
+                reply("Usage: /join <room> (letters, digits, - and _)")
+                return
+            if self.rooms.join(client_socket, username, room):
+                self.replay_history(client_socket, room)
+                self.publish_user(username)
+                self.broadcast(f"[System: {username} joined #{room}]", update_count=False, rooms=[room])
+                if self.gui:
+                    self.gui.log_message(f"{username} joined #{room}", 'info')
+            else:
+                reply(f"Now talking in #{room}")
+        elif command == "/leave":
+            room = normalize_room(argument) if argument.strip() else self.rooms.active_room(client_socket)
+            if not room or not self.rooms.leave(client_socket, room):
+                reply(f"You are not in #{room}" if room else "You are not in a room")
+                return
+            reply(f"You left #{room}")
+            self.publish_user(username)
+            self.broadcast(f"[System: {username} left #{room}]", update_count=False, rooms=[room])
             if self.gui:
-                self.gui.log_message(f"{username} joined the chat!", 'success')
+                self.gui.log_message(f"{username} left #{room}", 'info')
+        elif command == "/rooms":
+            counts = self.rooms.room_counts()
+            listing = ", ".join(f"#{room} ({count})" for room, count in counts.items()) or "none"
+            current = self.rooms.active_room(client_socket)
+            reply(f"Rooms: {listing}" + (f" | You are in #{current}" if current else ""))
+        elif command == "/history":
+            room = self.rooms.active_room(client_socket)
+            if not self.history:
+                reply("History is disabled on this server")
+            elif not room:
+                reply("You are not in a room")
+            else:
+                self.send_history_page(client_socket, room)
+        else:
+            reply(f"Unknown command {command}. Commands: /join <room>, /leave [room], /rooms, /history")
+
+    def history_frame(self, room, rows, more, missed=False):
+        """One HISTORY frame carrying a whole page, so replay is a single write"""
+        page = {
+            "room": room,
+            "messages": [{"id": id, "ts": ts, "text": text} for id, ts, text in rows],
+            "more": more
+        }
+        if missed:
+            page["missed"] = True
+        return encode_frame(f"HISTORY:{json.dumps(page)}")
+
+    def replay_history(self, client_socket, room):
+        """Send the last few messages of a room to a client that just joined it"""
+        if not self.history:
+            return
+        rows = self.history.recent(room)
+        cursors = self.history_cursors.setdefault(client_socket, {})
+        cursors[room] = rows[0][0] if rows else self.history.next_id
+        if rows:
+            client_socket.enqueue(self.history_frame(room, rows, len(rows) >= self.history.replay_size))
+
+    def send_history_page(self, client_socket, room):
+        """/history: the page just before the oldest message this client has seen"""
+        before_id = self.history_cursors.get(client_socket, {}).get(room)
+        rows = self.history.page(room, before_id, self.history.replay_size)
+        self.deliver_history_page(client_socket, room, rows)
+
+    def deliver_history_page(self, client_socket, room, rows):
+        if not rows:
+            client_socket.enqueue(encode_frame(f"[System: No earlier messages in #{room}]"))
+            return
+        self.history_cursors.setdefault(client_socket, {})[room] = rows[0][0]
+        client_socket.enqueue(self.history_frame(room, rows, len(rows) >= self.history.replay_size))
+
+    def send_missed(self, client_socket, rooms, last_seen):
+        """Resume: the messages of the client's rooms since last_seen"""
+        rows = self.history.since(rooms, last_seen, RESUME_LIMIT)
+        self.deliver_missed(client_socket, rooms, rows)
+
+    def deliver_missed(self, client_socket, rooms, rows):
+        cursors = self.history_cursors.setdefault(client_socket, {})
+        by_room = {room: [] for room in rooms}
+        for id, room, ts, text in rows:
+            by_room[room].append((id, ts, text))
+        for room, room_rows in by_room.items():
+            cursors[room] = room_rows[0][0] if room_rows else self.history.next_id
+            client_socket.enqueue(self.history_frame(room, room_rows, len(rows) >= RESUME_LIMIT, missed=True))
+
+    def publish_user(self, username):
+        """Tell the GUI a user connected, disconnected or changed rooms"""
+        if self.gui:
+            self.gui.membership_event(self, "user", username)
+
+    def publish_blocked(self, username):
+        if self.gui:
+            self.gui.membership_event(self, "blocked", username)
+
+    def rooms_of_user(self, username):
+        """Sorted rooms of all of a user's connections, or None if not connected"""
+        clients = self.clients.clients_for(username)
+        if not clients:
+            return None
+        return sorted(set().union(*(self.rooms.rooms_of(client) for client in clients)))
+
+    def handle_client(self, client_socket):
+        client_socket = ClientConnection(
+            client_socket,
+            self.queue_stats,
+            self.send_queue_size,
+            self.slow_consumer_policy
+        )
+        try:
+            if not self.admit_client(client_socket):
+                return
             
-            # Broadcast join message and update counts
-            self.broadcast(f"{username} joined the chat!")
+            # First frame is the username (or a HELLO), every later frame is a message
+            frames = iter_frames(client_socket, self.client_decoder(client_socket))
+            first = next(frames, None)
+            if first is None:
+                return
+            username, last_seen, client_socket.sequenced = parse_hello(first)
+            if not self.register_client(client_socket, username, last_seen):
+                return
             
-            while self.is_running:
-                try:
-                    message = client_socket.recv(self.max_message_size).decode()
-                    if not message:
-                        break
-                    
-                    if len(message.encode()) > self.max_message_size:
-                        client_socket.send("[System: Message exceeds maximum size limit]".encode())
-                        continue
-                        
-                    if username not in self.blocked_users:
-                        broadcast_message = f"{username}: {message}"
-                        self.broadcast(broadcast_message, client_socket)
-                        if self.gui:
-                            self.gui.log_message(f"{username}: {message}", 'info')
-                except:
+            for message in frames:
+                if not self.is_running:
                     break
+                self.handle_message(client_socket, username, message)
         except:
             pass
         finally:
             self.remove_client(client_socket)
 
+    def drop_user(self, username, notice):
+        """Tell every connection of a user why, then close them; False if none"""
+        clients = self.clients.remove_user(username)
+        if not clients:
+            return False
+        for client in clients:
+            self.rooms.remove_client(client)
+            client.enqueue(encode_frame(notice))
+            client.close()
+        self.publish_user(username)
+        return True
+
+    def kick_user(self, username):
+        """Disconnect a connected user; returns False if no such user is connected"""
+        if not self.drop_user(username, "[System: You have been kicked from the server]"):
+            return False
+        self.broadcast(f"[System: {username} has been kicked from the server]")
+        return True
+
     def block_user(self, username):
-        if username in [name for name in self.clients.values()]:
-            self.blocked_users.add(username)
-            # Find user's socket to send direct message
-            for sock, name in list(self.clients.items()):
-                if name == username:
-                    try:
-                        sock.send("[System: You have been blocked]".encode())
-                        sock.close()
-                        del self.clients[sock]
-                        # Update counts after removing blocked user
-                        self.broadcast(f"[System: {username} has been blocked]")
-                    except:
-                        pass
-                    break
-            return True
-        return False
+        if not self.clients.has_user(username):
+            return False
+        self.blocked_users.add(username)
+        self.publish_blocked(username)
+        if self.bus:
+            self.bus.publish("block", username)
+        # Tell the user directly, then drop their connection(s)
+        self.drop_user(username, "[System: You have been blocked]")
+        # Update counts after removing blocked user
+        self.broadcast(f"[System: {username} has been blocked]")
+        return True
 
     def unblock_user(self, username):
-        if username in self.blocked_users:
-            self.blocked_users.remove(username)
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            # Find user's socket to send direct message
-            for sock, name in self.clients.items():
-                if name == username:
-                    try:
-                        sock.send(f"[System: {username} has been unblocked]".encode())
-                    except:
-                        pass
-                    break
-            # Notify others
-            self.broadcast(f"[System: {username} has been unblocked]")
-            return True
-        return False
+        if username not in self.blocked_users:
+            return False
+        self.unblock_locally(username)
+        if self.bus:
+            self.bus.publish("unblock", username)
+        # Notify others
+        self.broadcast(f"[System: {username} has been unblocked]")
+        return True
+
+    def unblock_locally(self, username):
+        self.blocked_users.discard(username)
+        self.publish_blocked(username)
+        for client in self.clients.clients_for(username):
+            client.enqueue(encode_frame(f"[System: {username} has been unblocked]"))
+
+    def apply_bus_event(self, event):
+        """An event from another shard or the cluster console; nothing done
+        here is published again, except notices about this shard's own users"""
+        kind, args = event[0], event[1:]
+        if kind == "broadcast":
+            message, rooms, message_id = args
+            if message_id is not None and rooms and self.history:
+                self.history.remember(message_id, rooms[0], message)
+            self.fan_out(message, rooms=rooms, message_id=message_id)
+        elif kind == "kick":
+            username = args[0]
+            if self.drop_user(username, "[System: You have been kicked from the server]"):
+                self.broadcast(f"[System: {username} has been kicked from the server]")
+        elif kind == "block":
+            username = args[0]
+            self.blocked_users.add(username)
+            self.publish_blocked(username)
+            if self.drop_user(username, "[System: You have been blocked]"):
+                self.broadcast(f"[System: {username} has been blocked]")
+        elif kind == "unblock":
+            if args[0] in self.blocked_users:
+                self.unblock_locally(args[0])
+        elif kind == "session":
+            # A resuming client may reconnect to any shard
+            self.sessions.save(*args)
 
     def start_server(self):
         try:
+            if self.reuse_port:
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket.listen(socket.SOMAXCONN)
+            # Pick up the real port when bound to port 0 (benchmarks)
+            self.port = self.server_socket.getsockname()[1]
             self.is_running = True
             self.register_server()
             if self.gui:
                 self.gui.log_message(f"Server started on {self.host}:{self.port}")
-            
-            # Start accepting clients in a separate thread
-            accept_thread = threading.Thread(target=self.accept_clients)
-            accept_thread.daemon = True
-            accept_thread.start()
+            self.start_metrics()
+            self.start_engine()
+            if self.bus:
+                self.bus.start(self.apply_bus_event)
         except Exception as e:
             if self.gui:
                 self.gui.log_message(f"Error starting server: {e}")
 
+    def start_engine(self):
+        """Start accepting clients in a separate thread"""
+        accept_thread = threading.Thread(target=self.accept_clients)
+        accept_thread.daemon = True
+        accept_thread.start()
+
     def stop_server(self):
         self.is_running = False
+        self.count_updates.cancel()
         self.unregister_server()
+        if self.bus:
+            self.bus.stop()
         # Disconnect all clients
-        for client in list(self.clients.keys()):
+        for client in self.clients:
             client.close()
         self.clients.clear()
+        self.rooms.clear()
+        self.history_cursors.clear()
+        self.sessions.clear()
         self.server_socket.close()
+        self.close_history()
+        self.stop_metrics()
         if self.gui:
             self.gui.log_message("Server stopped")
 
+    def close_history(self):
+        """Commit whatever the history writer still has queued"""
+        if self.history:
+            self.history.close()
+            self.history = None
+
     def accept_clients(self):
         while self.is_running:
             try:
@@ -710,53 +1278,251 @@ class ChatServer:
                 break
 
     def remove_client(self, client_socket):
-        if client_socket in self.clients:
-            username = self.clients[client_socket]
-            del self.clients[client_socket]
+        username = self.clients.remove(client_socket)
+        active = self.rooms.active_room(client_socket)
+        rooms = self.rooms.remove_client(client_socket)
+        self.history_cursors.pop(client_socket, None)
+        if client_socket.decoder:
+            self.bytes_received_closed.inc(client_socket.decoder.received)
+            client_socket.decoder = None
+        if username is not None and client_socket.sequenced and rooms and self.is_running:
+            # Kicked and blocked clients are out of their rooms already
+            self.sessions.save(username, rooms, active)
+            if self.bus:
+                self.bus.publish("session", username, rooms, active)
+        if username is not None:
             client_socket.close()
-            # Broadcast leave message and update counts
-            self.broadcast(f"{username} left the chat!")
+            self.publish_user(username)
+            # Tell the rooms the user was in and update counts
+            self.broadcast(f"{username} left the chat!", rooms=rooms)
             if self.gui:
                 self.gui.log_message(f"{username} left the chat!")
 
     def register_server(self):
-        """Register server in the registry file"""
+        """Register server in the registry file and keep its entry alive"""
+        if not self.register:
+            return
         try:
-            registry = {}
-            try:
-                with open(os.path.join(DATA_DIR,"server_registry.json"), "r") as f:
-                    registry = json.load(f)
-            except:
-                pass
-            
-            registry[self.server_name] = {
-                "host": self.host,
-                "port": self.port,
-                "active": True
-            }
-            
-            with open(os.path.join(DATA_DIR,"server_registry.json"), "w") as f:
-                json.dump(registry, f)
-            
+            self.registry.register(self.server_name, self.host, self.port)
             if self.gui:
                 self.gui.log_message(f"Server '{self.server_name}' registered", 'info')
         except:
             if self.gui:
                 self.gui.log_message("Failed to register server", 'error')
+            return
+        heartbeat_thread = threading.Thread(target=self.heartbeat)
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+
+    def heartbeat(self):
+        """Refresh last_seen so clients can tell this server is still up"""
+        while not self.heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.registry.register(self.server_name, self.host, self.port)
+            except:
+                pass
 
     def unregister_server(self):
         """Remove server from registry"""
+        self.heartbeat_stop.set()
+        if not self.register:
+            return
+        try:
+            self.registry.unregister(self.server_name)
+        except:
+            pass
+
+class AsyncChatServer(ChatServer):
+    """ChatServer engine that serves every client from one asyncio event loop.
+
+    Speaks the same SERVER_INFO/COUNT_UPDATE protocol as the threaded engine,
+    but needs no thread per connection, so it scales to thousands of clients.
+    All client state is touched only from the loop thread; calls coming from
+    the GUI are handed over with call_soon_threadsafe.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.loop_thread = None
+        self.async_server = None
+
+    def start_engine(self):
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.loop_thread = threading.Thread(target=self.run_loop, args=(started,))
+        self.loop_thread.daemon = True
+        self.loop_thread.start()
+        started.wait()
+
+    def run_loop(self, started):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.async_server = self.loop.run_until_complete(asyncio.start_server(
+                self.handle_stream,
+                sock=self.server_socket,
+                backlog=socket.SOMAXCONN
+            ))
+        except Exception as e:
+            self.is_running = False
+            if self.gui:
+                self.gui.log_message(f"Error starting server: {e}", 'error')
+            return
+        finally:
+            started.set()
+        
+        try:
+            self.loop.run_forever()
+        finally:
+            # Client handlers see EOF once their transports are closed;
+            # give them a moment to finish before cancelling stragglers
+            tasks = asyncio.all_tasks(self.loop)
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks, timeout=1))
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    def call_later(self, delay, callback):
+        # Only called from the loop thread (via broadcast)
+        return self.loop.call_later(delay, callback)
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self.loop_thread
+
+    def call_soon(self, func, *args):
+        """Run func on the loop thread without waiting for it"""
+        if self.in_loop_thread() or not self.loop or self.loop.is_closed():
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def call_and_wait(self, func, *args):
+        """Run func on the loop thread and return its result"""
+        if self.in_loop_thread() or not self.loop or not self.loop.is_running():
+            return func(*args)
+        future = concurrent.futures.Future()
+        
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        
+        self.loop.call_soon_threadsafe(run)
+        return future.result(timeout=5)
+
+    async def handle_stream(self, reader, writer):
+        client = AsyncClientConnection(
+            writer,
+            self.queue_stats,
+            self.send_queue_size,
+            self.slow_consumer_policy
+        )
         try:
-            with open(os.path.join(DATA_DIR,"server_registry.json"), "r") as f:
-                registry = json.load(f)
+            if not self.admit_client(client):
+                return
             
-            if self.server_name in registry:
-                del registry[self.server_name]
+            frames = aiter_frames(reader, self.client_decoder(client))
+            first = await anext(frames, None)
+            if first is None:
+                return
+            username, last_seen, client.sequenced = parse_hello(first)
+            if not self.register_client(client, username, last_seen):
+                return
             
-            with open(os.path.join(DATA_DIR,"server_registry.json"), "w") as f:
-                json.dump(registry, f)
-        except:
+            async for message in frames:
+                if not self.is_running:
+                    break
+                self.handle_message(client, username, message)
+        except asyncio.CancelledError:
+            pass  # Server shutting down
+        except Exception:
             pass
+        finally:
+            self.remove_client(client)
+            client.close()
+
+    def send_history_page(self, client_socket, room):
+        # Reading a page may hit the disk; do it in the executor, not on the loop
+        before_id = self.history_cursors.get(client_socket, {}).get(room)
+        history = self.history
+        future = self.loop.run_in_executor(
+            None, history.page, room, before_id, history.replay_size
+        )
+        
+        def deliver(future):
+            if not future.cancelled() and future.exception() is None:
+                self.deliver_history_page(client_socket, room, future.result())
+        
+        future.add_done_callback(deliver)
+
+    def send_missed(self, client_socket, rooms, last_seen):
+        future = self.loop.run_in_executor(None, self.history.since, rooms, last_seen, RESUME_LIMIT)
+        
+        def deliver(future):
+            if not future.cancelled() and future.exception() is None:
+                self.deliver_missed(client_socket, rooms, future.result())
+        
+        future.add_done_callback(deliver)
+
+    def broadcast(self, message, exclude_client=None, update_count=True, rooms=None, message_id=None):
+        self.call_soon(super().broadcast, message, exclude_client, update_count, rooms, message_id)
+
+    def kick_user(self, username):
+        # Never block the GUI thread on the loop: check here, act over there
+        if not self.clients.has_user(username):
+            return False
+        self.call_soon(super().kick_user, username)
+        return True
+
+    def block_user(self, username):
+        if not self.clients.has_user(username):
+            return False
+        self.call_soon(super().block_user, username)
+        return True
+
+    def unblock_user(self, username):
+        if username not in self.blocked_users:
+            return False
+        self.call_soon(super().unblock_user, username)
+        return True
+
+    def apply_bus_event(self, event):
+        # Bus events arrive on the bus thread; client state lives on the loop
+        self.call_soon(super().apply_bus_event, event)
+
+    def shutdown_clients(self):
+        for client in self.clients:
+            client.close()
+        self.clients.clear()
+        self.rooms.clear()
+        self.history_cursors.clear()
+        self.sessions.clear()
+        if self.async_server:
+            self.async_server.close()
+        self.loop.stop()
+
+    def stop_server(self):
+        self.is_running = False
+        self.count_updates.cancel()
+        self.unregister_server()
+        if self.bus:
+            self.bus.stop()
+        if self.loop and self.loop.is_running():
+            self.call_and_wait(self.shutdown_clients)
+            self.loop_thread.join(timeout=5)
+        self.server_socket.close()
+        self.close_history()
+        self.stop_metrics()
+        if self.gui:
+            self.gui.log_message("Server stopped")
+
+# Engines selectable from the GUI
+ENGINES = {
+    "Threaded": ChatServer,
+    "Asyncio": AsyncChatServer
+}
 
 if __name__ == "__main__":
     server_gui = ChatServerGUI()
@@ -0,0 +1,70 @@
+"""Log pipeline between ChatServer handler threads and ChatServerGUI.
+
+Handler threads must not touch Tk, and inserting into the Text widget once
+per chat line freezes the GUI under load. LogPipeline.put() is safe to call
+from any thread and never blocks: it queues the record for the GUI, which
+drains the queue in batches from a Tk timer (see ChatServerGUI.flush_log),
+and hands a copy to the logging module through a QueueHandler, whose
+listener thread writes the complete log to a rotating file.
+"""
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+
+# GUI tag -> logging level for the log file
+LEVELS = {
+    'info': logging.INFO,
+    'success': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR
+}
+
+class LogPipeline:
+    def __init__(self, log_file=None, max_bytes=1024 * 1024, backup_count=5):
+        """
+        log_file: rotating log file with the full history (None for GUI only)
+        max_bytes/backup_count: rotate at this size and keep this many old files
+        """
+        self.records = queue.SimpleQueue()
+        self.logger = None
+        self.listener = None
+        if log_file:
+            self.file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            self.file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            file_queue = queue.SimpleQueue()
+            self.listener = logging.handlers.QueueListener(file_queue, self.file_handler)
+            self.listener.start()
+            self.queue_handler = logging.handlers.QueueHandler(file_queue)
+            self.logger = logging.getLogger(f"chat_server.{id(self)}")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            self.logger.addHandler(self.queue_handler)
+
+    def put(self, message, level='info'):
+        """Queue a log line; safe from any thread"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.records.put((timestamp, message, level))
+        logger = self.logger
+        if logger:
+            logger.log(LEVELS.get(level, logging.INFO), message)
+
+    def drain(self, limit):
+        """Up to limit queued records, oldest first"""
+        records = []
+        try:
+            while len(records) < limit:
+                records.append(self.records.get_nowait())
+        except queue.Empty:
+            pass
+        return records
+
+    def close(self):
+        """Stop the file writer once everything queued has been written"""
+        if self.listener:
+            self.logger = None
+            self.listener.stop()
+            self.file_handler.close()
+            self.listener = None
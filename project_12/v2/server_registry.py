@@ -0,0 +1,156 @@
+"""Shared registry of running chat servers (data/server_registry.json).
+
+Several servers and clients use the same file, so:
+- reads are served from an in-memory copy that is only re-read when the
+  file's mtime/size changes;
+- writes take an exclusive lock on a side file (fcntl on Unix, msvcrt on
+  Windows), re-read the current contents, apply the change and replace the
+  file atomically (write to a temp file, then os.replace), so concurrent
+  servers can't clobber each other's entries and readers never see a
+  half-written file;
+- servers heartbeat their entry's last_seen every HEARTBEAT_INTERVAL, and
+  an entry not seen for ENTRY_TTL counts as offline. Writers prune entries
+  that have been silent for much longer, e.g. after a crash.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+HEARTBEAT_INTERVAL = 5.0
+ENTRY_TTL = 15.0
+PRUNE_AFTER = 3600.0
+
+class FileLock:
+    """Exclusive inter-process lock held on path while in the with block"""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a+")
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10s; keep waiting
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+
+class ServerRegistry:
+    def __init__(self, path, ttl=ENTRY_TTL):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stamp = None  # (mtime_ns, size, inode) the cache was read at
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # os.replace gives the file a new inode, so this catches same-tick rewrites too
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def load(self):
+        """Registry contents, re-read only if the file changed since last time"""
+        with self.lock:
+            stamp = self.file_stamp()
+            if stamp != self.stamp:
+                self.entries = self.read_file()
+                self.stamp = stamp
+            return self.entries
+
+    def read_file(self):
+        try:
+            with open(self.path, "r") as f:
+                registry = json.load(f)
+            return registry if isinstance(registry, dict) else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def is_live(self, info, now=None):
+        """Active and heard from within the TTL (entries without last_seen are trusted)"""
+        if not info.get("active", True):
+            return False
+        last_seen = info.get("last_seen")
+        return last_seen is None or (now or time.time()) - last_seen <= self.ttl
+
+    def servers(self):
+        """name -> entry for every registered server, each with a "live" flag"""
+        now = time.time()
+        return {
+            name: dict(info, live=self.is_live(info, now))
+            for name, info in self.load().items()
+        }
+
+    def lookup(self, name):
+        """(host, port) of a live server; raises ValueError otherwise"""
+        info = self.load().get(name)
+        if info is None:
+            raise ValueError(f"Server '{name}' not found")
+        if not self.is_live(info):
+            raise ValueError(f"Server '{name}' is not active")
+        return info["host"], info["port"]
+
+    def update(self, change):
+        """Apply change(registry) to the file under the lock and replace it atomically"""
+        with FileLock(self.lock_path):
+            registry = self.read_file()
+            change(registry)
+            now = time.time()
+            for name in [name for name, info in registry.items()
+                         if now - info.get("last_seen", now) > PRUNE_AFTER]:
+                del registry[name]
+
+            directory = os.path.dirname(self.path) or "."
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".registry-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(registry, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except:
+                os.unlink(tmp_path)
+                raise
+        with self.lock:
+            self.entries = registry
+            self.stamp = self.file_stamp()
+
+    def register(self, name, host, port):
+        """Add or refresh this server's entry; also used as the heartbeat"""
+        def change(registry):
+            registry[name] = {
+                "host": host,
+                "port": port,
+                "active": True,
+                "last_seen": time.time()
+            }
+        self.update(change)
+
+    def unregister(self, name):
+        self.update(lambda registry: registry.pop(name, None))
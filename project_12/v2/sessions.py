@@ -0,0 +1,62 @@
+"""Session resume for clients that reconnect after a dropped connection.
+
+A client's first frame used to be its bare username, and that still works.
+A client that can resume sends instead
+
+    HELLO:{"username": "alice", "last_seen": 1234}
+
+where last_seen is the highest message id it has received (null on its
+first connect). Such a client gets chat messages as
+
+    MSG:{"id": 1235, "text": "alice: hi"}
+
+and an ACK:{"id": ...} for each of its own messages, so it always knows
+its last_seen. Message ids are the history ids, which grow across all rooms.
+
+When a HELLO client disconnects, the server remembers its rooms for a
+while (SessionStore). If the same user comes back with a last_seen, it is
+put back in those rooms and sent what it missed as HISTORY pages flagged
+"missed", instead of the usual replay.
+"""
+import json
+import threading
+import time
+
+RESUME_TTL = 300.0  # Seconds a disconnected user's rooms are kept
+RESUME_LIMIT = 500  # Most missed messages sent on resume
+
+def parse_hello(frame):
+    """First client frame -> (username, last_seen, resumable)"""
+    if frame.startswith("HELLO:"):
+        try:
+            hello = json.loads(frame[len("HELLO:"):])
+            return str(hello["username"]), hello.get("last_seen"), True
+        except (ValueError, KeyError, TypeError):
+            pass
+    return frame, None, False
+
+class SessionStore:
+    def __init__(self, ttl=RESUME_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.sessions = {}  # username -> (rooms, active room, expires at)
+
+    def save(self, username, rooms, active):
+        now = time.monotonic()
+        with self.lock:
+            # Forget sessions nobody came back for
+            for name in [name for name, session in self.sessions.items() if session[2] < now]:
+                del self.sessions[name]
+            self.sessions[username] = (sorted(rooms), active, now + self.ttl)
+
+    def restore(self, username):
+        """(rooms, active room) of a recent session of this user, or None"""
+        with self.lock:
+            session = self.sessions.pop(username, None)
+        if session is None or session[2] < time.monotonic():
+            return None
+        return session[0], session[1]
+
+    def clear(self):
+        with self.lock:
+            self.sessions.clear()
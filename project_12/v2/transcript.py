@@ -0,0 +1,105 @@
+"""Chat transcript model behind ChatClient's message display.
+
+The client used to insert every message straight into the Text widget,
+from the network thread, and never removed anything, so long sessions got
+slower and used more memory as the widget grew. Now:
+- Transcript.put() is safe to call from any thread; it only queues the
+  message. The GUI drains the queue from a Tk timer (ChatClient.flush_transcript)
+  into a fixed-size ring buffer of compact tuples;
+- only a window of at most `window` consecutive messages is rendered. At
+  the bottom, newer() hands out the next messages to append and how many
+  lines to drop from the top; scrolling to the top calls older(), which
+  hands out earlier messages from the ring buffer to prepend and how many
+  lines to drop from the bottom. Messages older than the ring buffer's
+  capacity are gone (the server's /history can fetch them again).
+
+Each message is rendered as "\\n[time] text\\n", i.e. text.count("\\n") + 2
+lines, which is what the line counts below keep track of.
+"""
+import queue
+from collections import deque
+
+class Transcript:
+    def __init__(self, capacity=20000, window=500):
+        self.capacity = capacity
+        self.window = window
+        self.incoming = queue.SimpleQueue()
+        self.clear()
+
+    def clear(self):
+        """Forget every message (Tk thread; the widget must be cleared too)"""
+        self.ring = [None] * self.capacity
+        self.next_seq = 0            # Sequence number of the next message
+        self.start = self.end = 0    # Rendered window [start, end)
+        self.lines = deque()         # Lines each rendered message takes, in order
+        while True:
+            try:
+                self.incoming.get_nowait()
+            except queue.Empty:
+                break
+
+    def put(self, entry):
+        """Queue a message tuple (timestamp, tag, username, text); any thread"""
+        self.incoming.put(entry)
+
+    def drain(self, limit):
+        """Move up to limit queued messages into the ring buffer; returns how many"""
+        count = 0
+        while count < limit:
+            try:
+                entry = self.incoming.get_nowait()
+            except queue.Empty:
+                break
+            self.ring[self.next_seq % self.capacity] = entry
+            self.next_seq += 1
+            count += 1
+        return count
+
+    @property
+    def oldest(self):
+        """Sequence number of the oldest message still in the ring buffer"""
+        return max(0, self.next_seq - self.capacity)
+
+    def entries(self, start, stop):
+        return [self.ring[seq % self.capacity] for seq in range(start, stop)]
+
+    def has_newer(self):
+        return self.end < self.next_seq
+
+    def has_older(self):
+        return self.start > self.oldest
+
+    @staticmethod
+    def line_count(entry):
+        return entry[3].count("\n") + (entry[2] or "").count("\n") + 2
+
+    def newer(self, limit):
+        """(messages to append, lines to delete from the top)"""
+        drop = 0
+        if self.end < self.oldest:
+            # Everything rendered fell out of the ring buffer (long scrolled-up
+            # spell): drop it all and continue from the oldest message kept
+            drop = sum(self.lines)
+            self.lines.clear()
+            self.start = self.end = self.oldest
+        stop = min(self.next_seq, self.end + limit)
+        entries = self.entries(self.end, stop)
+        self.end = stop
+        self.lines.extend(map(self.line_count, entries))
+        while self.end - self.start > self.window:
+            drop += self.lines.popleft()
+            self.start += 1
+        return entries, drop
+
+    def older(self, limit):
+        """(messages to prepend, lines to keep before deleting the rest at the bottom)"""
+        first = max(self.oldest, self.start - limit)
+        if first >= self.start:
+            return [], sum(self.lines)
+        entries = self.entries(first, self.start)
+        self.start = first
+        self.lines.extendleft(reversed([self.line_count(entry) for entry in entries]))
+        while self.end - self.start > self.window:
+            self.lines.pop()
+            self.end -= 1
+        return entries, sum(self.lines)
@@ -0,0 +1,283 @@
+"""Upstream chat servers for the monitor proxy.
+
+UpstreamPool lets the proxy front several ChatServer instances:
+- upstreams are given as "host:port" entries (a bare port means localhost);
+- each new client goes to the healthy upstream with the fewest active
+  connections, and on to the next one if connecting fails;
+- a background thread keeps a few connections to every healthy upstream
+  already open (warm), so a new client doesn't pay for the TCP handshake,
+  and re-checks unhealthy upstreams until they accept connections again;
+- every connect attempt is timed, for per-upstream latency metrics.
+
+Every connection the pool opens is checked before it is used: its first
+frame is peeked at (left in the socket buffer, so the relay still forwards
+it) and must be SERVER_INFO. A full server sends a refusal and closes
+instead; that counts as a failed connect, so the client fails over to the
+next upstream and a server that keeps refusing is taken out like one that
+is down.
+
+A warm connection's SERVER_INFO sits in the socket buffer until the
+connection is handed over. Its current_users can be up to max_idle old; the
+COUNT_UPDATE sent when the client joins corrects it. A warm connection with
+anything else buffered after SERVER_INFO, or closed by the server behind it,
+is dropped rather than handed out.
+"""
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+from protocol import HEADER
+
+GREETING = "SERVER_INFO:"
+POLLRDHUP = getattr(select, "POLLRDHUP", None)  # Linux only
+
+def parse_upstreams(text, default_host="127.0.0.1"):
+    """'9999, other:9999' -> [('127.0.0.1', 9999), ('other', 9999)]"""
+    upstreams = []
+    for entry in text.replace(";", ",").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, port = entry.rpartition(":")
+        upstreams.append((host or default_host, int(port)))
+    if not upstreams:
+        raise ValueError("No upstream servers given")
+    return upstreams
+
+class Upstream:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.healthy = True
+        self.failures = 0        # Consecutive failed connects
+        self.active = 0          # Clients currently relayed to it
+        self.warm = deque()      # (socket, opened at, SERVER_INFO frame size)
+        self.connects = 0
+        self.connect_errors = 0
+        self.latencies = deque(maxlen=256)  # Recent connect times, seconds
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+class UpstreamPool:
+    def __init__(self, addresses, warm_size=2, connect_timeout=2.0,
+                 check_interval=2.0, max_failures=2, max_idle=60.0):
+        """
+        warm_size: connections kept open per healthy upstream (0 disables pre-warming)
+        max_failures: consecutive connect failures before an upstream is taken out
+        max_idle: warm connections older than this are replaced
+        """
+        self.upstreams = [Upstream(host, port) for host, port in addresses]
+        self.warm_size = warm_size
+        self.connect_timeout = connect_timeout
+        self.check_interval = check_interval
+        self.max_failures = max_failures
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.next = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.maintain()
+        self.thread = threading.Thread(target=self.maintain_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.connect_timeout + 1)
+        with self.lock:
+            for upstream in self.upstreams:
+                while upstream.warm:
+                    upstream.warm.popleft()[0].close()
+
+    # Choosing and connecting
+    def choose(self, exclude=()):
+        """Healthy upstream with the fewest active clients (round robin on ties)"""
+        with self.lock:
+            count = len(self.upstreams)
+            candidates = [self.upstreams[(self.next + i) % count] for i in range(count)]
+            self.next = (self.next + 1) % count
+            healthy = [u for u in candidates if u.healthy and u not in exclude]
+            if not healthy:
+                # Everything looks down; try the ones not tried yet anyway
+                healthy = [u for u in candidates if u not in exclude]
+            if not healthy:
+                return None
+            upstream = min(healthy, key=lambda u: u.active)
+            upstream.active += 1
+            return upstream
+
+    def take_warm(self, upstream):
+        """A pre-connected socket to upstream, or None"""
+        with self.lock:
+            while upstream.warm:
+                sock, _, size = upstream.warm.popleft()
+                if self.is_open(sock, size):
+                    return sock
+                sock.close()
+        return None
+
+    def is_open(self, sock, size):
+        """True if a warm connection still holds just its SERVER_INFO frame (size bytes)"""
+        # The server may have closed an idle warm connection; peek without blocking
+        try:
+            sock.setblocking(False)
+            try:
+                if len(sock.recv(size + 1, socket.MSG_PEEK)) != size:
+                    return False  # Closed, or the server sent more than SERVER_INFO
+            except BlockingIOError:
+                return False
+            finally:
+                sock.setblocking(True)
+            return not self.peer_closed(sock)
+        except OSError:
+            return False
+
+    def peer_closed(self, sock):
+        """True if the server's FIN is already queued behind the buffered data"""
+        if POLLRDHUP is None:
+            return False  # Found by the relay on its first read instead
+        poller = select.poll()
+        poller.register(sock, POLLRDHUP)
+        return any(event & (POLLRDHUP | select.POLLHUP | select.POLLERR)
+                   for _, event in poller.poll(0))
+
+    def read_greeting(self, sock):
+        """Peek at the server's first frame, leaving it in the socket buffer.
+        Returns (message, frame size); message is None if the server closed first"""
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock.settimeout(max(deadline - time.monotonic(), 0.01))
+            data = sock.recv(65536, socket.MSG_PEEK)
+            if not data:
+                return None, 0
+            if len(data) >= HEADER.size:
+                size = HEADER.size + HEADER.unpack_from(data)[0]
+                if len(data) >= size:
+                    return data[HEADER.size:size].decode("utf-8", "replace"), size
+            if time.monotonic() >= deadline:
+                raise socket.timeout("Incomplete SERVER_INFO")
+            time.sleep(0.01)  # Rest of the frame still on its way
+
+    def connect(self, upstream):
+        """Blocking connect, checked and recorded; returns (socket, SERVER_INFO frame size).
+        Raises OSError on failure, including a server that refuses the client"""
+        start = time.perf_counter()
+        try:
+            sock = socket.create_connection(upstream.address, timeout=self.connect_timeout)
+        except OSError:
+            self.record_connect(upstream, None)
+            raise
+        latency = time.perf_counter() - start
+        try:
+            message, size = self.read_greeting(sock)
+            if message is None or not message.startswith(GREETING):
+                raise ConnectionRefusedError(f"{upstream} refused the connection: {message or 'closed'}")
+        except OSError:
+            sock.close()
+            self.record_connect(upstream, None)
+            raise
+        self.record_connect(upstream, latency)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, size
+
+    def acquire(self):
+        """(upstream, connected socket), failing over between upstreams; raises OSError"""
+        tried = []
+        while True:
+            upstream = self.choose(tried)
+            if upstream is None:
+                raise OSError(", ".join(map(str, tried)))
+            sock = self.take_warm(upstream)
+            if sock:
+                return upstream, sock
+            try:
+                return upstream, self.connect(upstream)[0]
+            except OSError:
+                # Unreachable, or refused (server full): try the next upstream
+                self.release(upstream)
+                tried.append(upstream)
+
+    def release(self, upstream):
+        with self.lock:
+            upstream.active -= 1
+
+    def record_connect(self, upstream, latency):
+        """Note a connect attempt: latency in seconds, or None if it failed"""
+        with self.lock:
+            if latency is None:
+                upstream.connect_errors += 1
+                upstream.failures += 1
+                # The server is likely going away; don't hand out its idle connections
+                while upstream.warm:
+                    upstream.warm.popleft()[0].close()
+                if upstream.failures >= self.max_failures:
+                    upstream.healthy = False
+            else:
+                upstream.connects += 1
+                upstream.failures = 0
+                upstream.healthy = True
+                upstream.latencies.append(latency)
+
+    # Background upkeep
+    def maintain_loop(self):
+        while not self.stop_event.wait(self.check_interval):
+            self.maintain()
+
+    def maintain(self):
+        now = time.monotonic()
+        for upstream in self.upstreams:
+            with self.lock:
+                # Replace warm connections that sat too long or were closed
+                fresh = deque()
+                while upstream.warm:
+                    sock, opened, size = upstream.warm.popleft()
+                    if now - opened < self.max_idle and self.is_open(sock, size):
+                        fresh.append((sock, opened, size))
+                    else:
+                        sock.close()
+                upstream.warm = fresh
+                missing = self.warm_size - len(upstream.warm)
+            # Unhealthy upstreams get one probe connect per round
+            if not upstream.healthy:
+                missing = max(missing, 1)
+            for _ in range(missing):
+                if self.stop_event.is_set():
+                    return
+                try:
+                    sock, size = self.connect(upstream)
+                except OSError:
+                    break
+                if self.warm_size:
+                    with self.lock:
+                        upstream.warm.append((sock, time.monotonic(), size))
+                else:
+                    sock.close()
+
+    def stats(self):
+        """Per-upstream health, load and connect latency (ms)"""
+        rows = []
+        with self.lock:
+            for upstream in self.upstreams:
+                latencies = sorted(upstream.latencies)
+                rows.append({
+                    "upstream": str(upstream),
+                    "healthy": upstream.healthy,
+                    "active": upstream.active,
+                    "warm": len(upstream.warm),
+                    "connects": upstream.connects,
+                    "errors": upstream.connect_errors,
+                    "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+                    "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None
+                })
+        return rows
@@ -1,14 +1,30 @@
+import random
 import socket
 import threading
+import time
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, ttk, font, colorchooser
 from datetime import datetime
 from ttkthemes import ThemedTk
+from protocol import encode_frame, FrameDecoder, recv_frames
+from server_registry import ServerRegistry
+from transcript import Transcript
+from collections import deque
 import json
 import os
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 os.makedirs(DATA_DIR, exist_ok=True)  # Create data directory if it doesn't exist
+REGISTRY_POLL_MS = 2000  # How often the server list checks the registry for changes
+TRANSCRIPT_CAPACITY = 20000  # Messages kept in memory for scrollback
+TRANSCRIPT_WINDOW = 500  # Messages rendered in the chat display at most
+TRANSCRIPT_FLUSH_MS = 50  # How often queued messages are rendered
+TRANSCRIPT_BATCH_SIZE = 200  # Messages rendered per flush
+SCROLLBACK_PAGE = 100  # Earlier messages loaded when scrolling to the top
+RECONNECT_MIN_DELAY = 0.5  # First retry after a dropped connection, doubled per attempt
+RECONNECT_MAX_DELAY = 30.0
+OUTBOX_LIMIT = 100  # Messages kept for sending while reconnecting
+SEEN_IDS = 1000  # Recent message ids remembered to skip duplicates after a resume
 
 class FontDialog:
     def __init__(self, parent, font_list, current_font):
@@ -92,6 +108,10 @@ class ChatClient:
         self.root.title("Chat Client")
         self.root.geometry("1000x700")
         
+        # Server registry, cached in memory and re-read only when the file changes
+        self.registry = ServerRegistry(os.path.join(DATA_DIR, "server_registry.json"))
+        self.listed_servers = []
+        
         # Configure colors and fonts
         self.colors = {
             'bg': '#f0f0f0',
@@ -120,8 +140,20 @@ class ChatClient:
         self.username = ""
         self.client_socket = None
         self.connected = False
+        self.decoder = FrameDecoder()
+        self.pending_frames = []  # Frames read during the handshake, shown once connected
         self.max_message_size = 1024  # Maximum message size in bytes
         
+        # Reconnect and resume after a dropped connection (see sessions.py)
+        self.server_address = None
+        self.reconnecting = False
+        self.last_seen = None  # Highest message id received
+        self.seen_ids = deque(maxlen=SEEN_IDS)
+        self.outbox = deque()  # Messages typed while reconnecting
+        
+        # Messages are queued here and rendered in batches by flush_transcript
+        self.transcript = Transcript(TRANSCRIPT_CAPACITY, TRANSCRIPT_WINDOW)
+        
         # Default settings
         self.default_settings = {
             'theme': 'arc',
@@ -165,8 +197,10 @@ class ChatClient:
         # Configure styles
         self.configure_styles()
         
-        # Schedule initial server list refresh
+        # Schedule initial server list refresh, then follow registry changes
         self.root.after(100, self.refresh_server_list)
+        self.root.after(REGISTRY_POLL_MS, self.watch_server_list)
+        self.root.after(TRANSCRIPT_FLUSH_MS, self.flush_transcript)
         
 
         self.create_menu()
@@ -495,73 +529,76 @@ class ChatClient:
         # Bind Enter key
         self.message_entry.bind("<Return>", lambda e: self.send_message())
         
-    def format_message(self, message, is_own=False, is_system=False):
-        """Format and display message with improved styling"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        prefix = f"[{timestamp}] " if self.show_timestamps.get() else ""
+    def format_message(self, message, is_own=False, is_system=False, timestamp=None):
+        """Queue a message for the chat display; safe to call from any thread"""
+        timestamp = timestamp or datetime.now().strftime("%H:%M:%S")
+        username = None
         
         if is_system:
             # Handle system messages
             if "[Server Info:" in message:
-                self.chat_display.insert(tk.END, "\n")
-                self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-                self.chat_display.insert(tk.END, message + "\n", 'info_msg')
+                tag = 'info_msg'
             elif "[Server Warning:" in message:
-                self.chat_display.insert(tk.END, "\n")
-                self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-                self.chat_display.insert(tk.END, message + "\n", 'warning_msg')
+                tag = 'warning_msg'
             elif "[Server Success:" in message:
-                self.chat_display.insert(tk.END, "\n")
-                self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-                self.chat_display.insert(tk.END, message + "\n", 'success_msg')
+                tag = 'success_msg'
             elif "[Server Error:" in message:
-                self.chat_display.insert(tk.END, "\n")
-                self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-                self.chat_display.insert(tk.END, message + "\n", 'error_msg')
+                tag = 'error_msg'
             else:
                 # Remove any existing timestamp from system messages
                 if message.startswith("[") and "]" in message:
                     _, message = message.split("]", 1)
                     message = message.strip()
-                
-                self.chat_display.insert(tk.END, "\n")
-                self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-                self.chat_display.insert(tk.END, message + "\n", 'system_msg')
+                tag = 'system_msg'
         else:
             # Handle chat messages
-            self.chat_display.insert(tk.END, "\n")
-            self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-            
             tag = 'own_msg' if is_own else 'other_msg'
-            
             if ":" in message:  # Split username and message content
-                username, content = message.split(":", 1)
-                self.chat_display.insert(tk.END, username + ":", 'username')
-                self.chat_display.insert(tk.END, content + "\n", tag)
-            else:
-                self.chat_display.insert(tk.END, message + "\n", tag)
+                username, message = message.split(":", 1)
         
-        self.chat_display.see(tk.END)
+        self.transcript.put((timestamp, tag, username, message))
+
+    def transcript_segments(self, entries):
+        """Text.insert arguments (text, tags, text, tags, ...) for a run of messages"""
+        segments = []
+        for timestamp, tag, username, message in entries:
+            segments += ["\n", (), f"[{timestamp}] ", 'timestamp']
+            if username is not None:
+                segments += [username + ":", 'username']
+            segments += [message + "\n", tag]
+        return segments
+
+    def flush_transcript(self):
+        """Render queued messages and slide the rendered window (Tk timer)"""
+        try:
+            self.transcript.drain(TRANSCRIPT_BATCH_SIZE)
+            top, bottom = self.chat_display.yview()
+            if bottom >= 1.0 and self.transcript.has_newer():
+                # Following the conversation: append, trim the top, stay at the end
+                entries, drop = self.transcript.newer(TRANSCRIPT_BATCH_SIZE)
+                self.chat_display.insert(tk.END, *self.transcript_segments(entries))
+                if drop:
+                    self.chat_display.delete("1.0", f"{drop + 1}.0")
+                self.chat_display.see(tk.END)
+            elif top <= 0.0 and bottom < 1.0 and self.transcript.has_older():
+                # Scrolled to the top: bring back earlier messages from memory
+                entries, keep = self.transcript.older(SCROLLBACK_PAGE)
+                segments = self.transcript_segments(entries)
+                self.chat_display.insert("1.0", *segments)
+                self.chat_display.delete(f"{keep + 1}.0", tk.END)
+                # Keep the line that was at the top in view
+                added = sum(self.transcript.line_count(entry) for entry in entries)
+                self.chat_display.yview(f"{added + 1}.0")
+        except tk.TclError:
+            pass  # Display not ready
+        self.root.after(TRANSCRIPT_FLUSH_MS, self.flush_transcript)
 
     def lookup_server(self, server_name):
-        """Look up server details from registry"""
-        registry_file = os.path.join(DATA_DIR, 'server_registry.json')
+        """Look up server details from registry (served from memory)"""
         try:
-            with open(registry_file, "r") as f:
-                registry = json.load(f)
-                
-            if server_name in registry:
-                server_info = registry[server_name]
-                if server_info.get("active", True):  # Default to True if not specified
-                    return server_info["host"], server_info["port"]
-                else:
-                    raise ValueError(f"Server '{server_name}' is not active")
-            
-            raise ValueError(f"Server '{server_name}' not found")
-        except FileNotFoundError:
-            raise ValueError("No server registry found")
-        except json.JSONDecodeError:
-            raise ValueError("Invalid server registry format")
+            return self.registry.lookup(server_name)
+        except ValueError:
+            raise
         except Exception as e:
             raise ValueError(f"Error looking up server: {str(e)}")
 
@@ -587,49 +624,23 @@ class ChatClient:
                     messagebox.showerror("Server Lookup Error", str(e))
                     return
             
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.settimeout(5)  # Add timeout
-            
+            self.last_seen = None
+            self.seen_ids.clear()
+            self.outbox.clear()
             try:
-                self.client_socket.connect((host, port))
-                self.client_socket.settimeout(None)  # Remove timeout after connection
+                session = self.open_session(host, port)
             except ConnectionRefusedError:
                 raise ValueError("Connection refused - server may be offline")
             except socket.timeout:
                 raise ValueError("Connection timed out - server not responding")
+            self.server_address = (host, port)
+            self.client_socket, self.decoder, info, self.pending_frames = session
+            self.apply_server_info(info)
             
-            # Receive server info
-            try:
-                server_info = self.client_socket.recv(1024).decode()
-                if server_info.startswith("SERVER_INFO:"):
-                    info = json.loads(server_info[len("SERVER_INFO:"):])
-                    self.server_name = info["name"]
-                    # Update server info display and message size limit
-                    max_users = info.get("max_users", "?")
-                    current_users = info.get("current_users", "?")
-                    self.max_message_size = info.get("max_message_size", 1024)  # Get limit from server
-                    self.server_info_label.configure(
-                        text=f"Users: {current_users}/{max_users} | Max Msg: {self.max_message_size}B"
-                    )
-            except:
-                self.server_name = "Unknown Server"
-                self.server_info_label.configure(text="Users: ?/? | Max Msg: ?B")
-            
-            # Send username
-            self.client_socket.send(self.username.encode())
-            
-            # Check for immediate block/kick response
-            try:
-                self.client_socket.settimeout(2.0)
-                response = self.client_socket.recv(1024).decode()
-                self.client_socket.settimeout(None)
-                
-                if "You are blocked from this server" in response:
-                    messagebox.showerror("Blocked", "You are blocked from joining this server")
-                    self.disconnect()
-                    return
-            except socket.timeout:
-                self.client_socket.settimeout(None)
+            if any("You are blocked from this server" in frame for frame in self.pending_frames):
+                messagebox.showerror("Blocked", "You are blocked from joining this server")
+                self.disconnect()
+                return
             
             # Update UI
             self.login_frame.pack_forget()
@@ -646,8 +657,123 @@ class ChatClient:
             messagebox.showerror("Error", f"Could not connect to server: {str(e)}")
             self.disconnect()
 
+    def open_session(self, host, port):
+        """Connect, read SERVER_INFO and say HELLO; returns (socket, decoder, info, frames read)"""
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.settimeout(5)  # Add timeout
+        try:
+            client_socket.connect((host, port))
+            client_socket.settimeout(None)  # Remove timeout after connection
+            
+            # Receive server info
+            decoder = FrameDecoder()
+            info = None
+            try:
+                server_info = recv_frames(client_socket, decoder)[0]
+                if server_info.startswith("SERVER_INFO:"):
+                    info = json.loads(server_info[len("SERVER_INFO:"):])
+            except:
+                pass
+            
+            # Username, plus the last message seen so a reconnect can resume
+            hello = {"username": self.username, "last_seen": self.last_seen}
+            client_socket.sendall(encode_frame(f"HELLO:{json.dumps(hello)}"))
+            
+            # Check for immediate block/kick response
+            pending_frames = []
+            try:
+                client_socket.settimeout(2.0)
+                pending_frames = recv_frames(client_socket, decoder)
+            except socket.timeout:
+                pass
+            client_socket.settimeout(None)
+            return client_socket, decoder, info, pending_frames
+        except:
+            client_socket.close()
+            raise
+
+    def apply_server_info(self, info):
+        if info:
+            self.server_name = info["name"]
+            # Update server info display and message size limit
+            max_users = info.get("max_users", "?")
+            current_users = info.get("current_users", "?")
+            self.max_message_size = info.get("max_message_size", 1024)  # Get limit from server
+            self.server_info_label.configure(
+                text=f"Users: {current_users}/{max_users} | Max Msg: {self.max_message_size}B"
+            )
+        else:
+            self.server_name = "Unknown Server"
+            self.server_info_label.configure(text="Users: ?/? | Max Msg: ?B")
+
+    def start_reconnect(self):
+        """Connection lost: keep the chat open and retry in the background"""
+        if self.reconnecting or not self.server_address:
+            return
+        self.reconnecting = True
+        if self.client_socket:
+            try:
+                self.client_socket.close()
+            except:
+                pass
+            self.client_socket = None
+        self.status_label.configure(text="• Reconnecting...", foreground=self.colors['warning'])
+        self.format_message("[System: Connection lost, reconnecting...]", is_system=True)
+        thread = threading.Thread(target=self.reconnect_loop)
+        thread.daemon = True
+        thread.start()
+
+    def reconnect_loop(self):
+        delay = RECONNECT_MIN_DELAY
+        while self.reconnecting:
+            # Exponential backoff with jitter, so clients don't all retry at once
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            if not self.reconnecting:
+                return
+            try:
+                session = self.open_session(*self.server_address)
+            except OSError:
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            if any("Server is full" in frame for frame in session[3]):
+                session[0].close()
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            self.root.after(0, self.resume_session, session)
+            return
+
+    def resume_session(self, session):
+        """Back online (Tk thread): send what was typed meanwhile and carry on"""
+        client_socket, decoder, info, pending_frames = session
+        if not self.reconnecting:
+            client_socket.close()  # Disconnected by the user meanwhile
+            return
+        self.reconnecting = False
+        if any("You are blocked from this server" in frame for frame in pending_frames):
+            client_socket.close()
+            messagebox.showerror("Blocked", "You are blocked from joining this server")
+            self.disconnect()
+            return
+        self.client_socket, self.decoder, self.pending_frames = client_socket, decoder, pending_frames
+        self.apply_server_info(info)
+        self.status_label.configure(text="• Connected", foreground=self.colors['success'])
+        self.format_message("[System: Reconnected]", is_system=True)
+        self.connected = True
+        try:
+            while self.outbox:
+                self.client_socket.sendall(encode_frame(self.outbox[0]))
+                self.outbox.popleft()
+        except OSError:
+            pass  # The receive thread notices and reconnects again
+        receive_thread = threading.Thread(target=self.receive_messages)
+        receive_thread.daemon = True
+        receive_thread.start()
+
     def disconnect(self):
         """Handle client disconnection"""
+        self.reconnecting = False
+        self.server_address = None
+        self.outbox.clear()
         if hasattr(self, 'client_socket') and self.client_socket:
             try:
                 self.connected = False
@@ -664,12 +790,13 @@ class ChatClient:
             self.login_frame.pack(fill=tk.BOTH, expand=True)
         if hasattr(self, 'chat_display'):
             self.chat_display.delete(1.0, tk.END)
+            self.transcript.clear()
         
         # Reset connection-related variables
         self.connected = False
 
     def send_message(self):
-        if not self.connected or not self.client_socket:
+        if not self.reconnecting and (not self.connected or not self.client_socket):
             messagebox.showerror("Error", "Not connected to server")
             self.disconnect()
             return
@@ -680,66 +807,143 @@ class ChatClient:
             if len(message.encode()) > self.max_message_size:
                 messagebox.showerror("Error", "Message exceeds maximum size limit")
                 return
-                
-            try:
-                self.client_socket.send(message.encode())
+            
+            if self.reconnecting:
+                # Sent in order once the connection is back
+                if len(self.outbox) >= OUTBOX_LIMIT:
+                    messagebox.showerror("Error", "Still reconnecting, too many unsent messages")
+                    return
+                self.outbox.append(message)
                 self.format_message(f"You: {message}", is_own=True, is_system=False)
+                self.format_message(f"[System: Not connected, message queued ({len(self.outbox)} waiting)]",
+                                    is_system=True)
                 self.message_entry.delete(0, tk.END)
-            except:
-                messagebox.showerror("Error", "Could not send message")
-                self.disconnect()
+                return
+                
+            try:
+                self.client_socket.sendall(encode_frame(message))
+            except OSError:
+                # Keep it for after the reconnect; the receive thread starts one
+                self.outbox.append(message)
+            self.format_message(f"You: {message}", is_own=True, is_system=False)
+            self.message_entry.delete(0, tk.END)
 
     def receive_messages(self):
+        keep_running = True
         while self.connected and self.client_socket:
             try:
-                message = self.client_socket.recv(1024).decode()
-                if not message:
+                # Start with anything already read during the handshake
+                frames = self.pending_frames or recv_frames(self.client_socket, self.decoder)
+                self.pending_frames = []
+                if not frames:
                     break
                 
-                # Handle user count updates
-                if message.startswith("COUNT_UPDATE:"):
-                    try:
-                        count_info = json.loads(message[len("COUNT_UPDATE:"):])
-                        if count_info["type"] == "user_count":
-                            self.server_info_label.configure(
-                                text=f"Users: {count_info['current']}/{count_info['max']}"
-                            )
-                        continue
-                    except:
-                        pass
-                
-                # Handle other messages
-                if "Server is full" in message:
-                    messagebox.showerror("Error", "Server is full, try again later")
-                    self.root.after(0, self.disconnect)
-                    break
-                elif "You have been kicked from the server" in message:
-                    self.format_message(message, is_system=True)
-                    messagebox.showwarning("Kicked", "You have been kicked from the server")
-                    self.root.after(0, self.disconnect)
+                keep_running = True
+                for message in frames:
+                    keep_running = self.handle_server_message(message)
+                    if not keep_running:
+                        break
+                if not keep_running:
                     break
-                elif "has been blocked" in message:
-                    self.format_message(message, is_system=True)
-                    if f"[System: {self.username} has been blocked]" in message:
-                        messagebox.showwarning("Blocked", "You have been blocked from the server")
-                        self.message_entry.config(state='disabled')
-                        self.message_entry.delete(0, tk.END)
-                        self.message_entry.insert(0, "You are blocked from sending messages")
-                        self.status_label.configure(text="• Blocked", foreground=self.colors['error'])
-                elif "has been unblocked" in message:
-                    self.format_message(message, is_system=True)
-                    if f"[System: {self.username} has been unblocked]" in message:
-                        self.message_entry.config(state='normal')
-                        self.message_entry.delete(0, tk.END)
-                        self.status_label.configure(text="• Connected", foreground=self.colors['success'])
-                else:
-                    self.format_message(message, is_own=False)
             except:
                 break
         
-        if self.connected:
-            messagebox.showwarning("Disconnected", "Lost connection to server")
+        if self.connected and keep_running:
+            # Dropped rather than ended by the server: reconnect and resume
+            self.connected = False
+            self.root.after(0, self.start_reconnect)
+
+    def handle_server_message(self, message):
+        """Handle one message from the server; returns False when the session is over"""
+        # Handle user count updates
+        if message.startswith("COUNT_UPDATE:"):
+            try:
+                count_info = json.loads(message[len("COUNT_UPDATE:"):])
+                if count_info["type"] == "user_count":
+                    self.server_info_label.configure(
+                        text=f"Users: {count_info['current']}/{count_info['max']}"
+                    )
+                return True
+            except:
+                pass
+        
+        # Chat message with its id (we said HELLO), or the id of our own message
+        if message.startswith("MSG:") or message.startswith("ACK:"):
+            try:
+                sequenced = json.loads(message[4:])
+                if not self.remember_id(sequenced["id"]) or message.startswith("ACK:"):
+                    return True
+                message = sequenced["text"]
+            except:
+                pass
+        
+        # Replayed history: one frame carries a whole page of earlier messages
+        if message.startswith("HISTORY:"):
+            try:
+                self.show_history(json.loads(message[len("HISTORY:"):]))
+                return True
+            except:
+                pass
+        
+        # Handle other messages
+        if "Server is full" in message:
+            messagebox.showerror("Error", "Server is full, try again later")
+            self.root.after(0, self.disconnect)
+            return False
+        elif "You have been kicked from the server" in message:
+            self.format_message(message, is_system=True)
+            messagebox.showwarning("Kicked", "You have been kicked from the server")
             self.root.after(0, self.disconnect)
+            return False
+        elif "You have been blocked" in message:
+            # The server drops a blocked user; don't try to reconnect
+            self.format_message(message, is_system=True)
+            messagebox.showwarning("Blocked", "You have been blocked from the server")
+            self.root.after(0, self.disconnect)
+            return False
+        elif "has been blocked" in message:
+            self.format_message(message, is_system=True)
+            if f"[System: {self.username} has been blocked]" in message:
+                messagebox.showwarning("Blocked", "You have been blocked from the server")
+                self.message_entry.config(state='disabled')
+                self.message_entry.delete(0, tk.END)
+                self.message_entry.insert(0, "You are blocked from sending messages")
+                self.status_label.configure(text="• Blocked", foreground=self.colors['error'])
+        elif "has been unblocked" in message:
+            self.format_message(message, is_system=True)
+            if f"[System: {self.username} has been unblocked]" in message:
+                self.message_entry.config(state='normal')
+                self.message_entry.delete(0, tk.END)
+                self.status_label.configure(text="• Connected", foreground=self.colors['success'])
+        else:
+            self.format_message(message, is_own=False)
+        return True
+
+    def remember_id(self, message_id):
+        """Track the last message seen; returns False for one already shown"""
+        if message_id in self.seen_ids:
+            return False
+        self.seen_ids.append(message_id)
+        self.last_seen = max(self.last_seen or 0, message_id)
+        return True
+
+    def show_history(self, page):
+        """Display a page of history sent on join, on resume or in reply to /history"""
+        messages = [entry for entry in page.get("messages", []) if self.remember_id(entry["id"])]
+        if page.get("missed"):
+            if not messages:
+                return
+            self.format_message(f"[System: {len(messages)} missed messages in #{page['room']}]")
+        else:
+            self.format_message(f"[System: {len(messages)} earlier messages in #{page['room']}]")
+        for entry in messages:
+            timestamp = datetime.fromtimestamp(entry["ts"]).strftime("%H:%M:%S")
+            text = entry["text"]
+            # "[#room] name: text" or "name: text"
+            sender = text.split(": ", 1)[0].rsplit("] ", 1)[-1]
+            self.format_message(text, is_own=sender == self.username, timestamp=timestamp)
+        if page.get("more"):
+            self.format_message("[System: Type /history for older messages]")
 
     def run(self):
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -757,28 +961,15 @@ class ChatClient:
         for item in self.server_tree.get_children():
             self.server_tree.delete(item)
         
+        # Servers heartbeat their registry entry, so no test connection is needed
         try:
-            with open(os.path.join(DATA_DIR,"server_registry.json"), "r") as f:
-                registry = json.load(f)
-            
-            for server_name, info in registry.items():
-                # Test connection to check if server is actually running
-                try:
-                    test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    test_socket.settimeout(1)
-                    test_socket.connect((info['host'], info['port']))
-                    test_socket.close()
-                    status = 'Online'
-                    tags = ('online',)
-                except:
-                    status = 'Offline'
-                    tags = ('offline',)
-                
+            self.listed_servers = self.registry_rows()
+            for server_name, host, port, status in self.listed_servers:
                 self.server_tree.insert(
                     '', 
                     'end', 
-                    values=(server_name, info['host'], info['port'], status),
-                    tags=tags
+                    values=(server_name, host, port, status),
+                    tags=(status.lower(),)
                 )
         except:
             pass
@@ -787,6 +978,21 @@ class ChatClient:
         self.server_tree.tag_configure('online', foreground=self.colors['success'])
         self.server_tree.tag_configure('offline', foreground=self.colors['error'])
 
+    def registry_rows(self):
+        return [
+            (server_name, info['host'], info['port'], 'Online' if info['live'] else 'Offline')
+            for server_name, info in sorted(self.registry.servers().items())
+        ]
+
+    def watch_server_list(self):
+        """Redraw the server list when the registry or a server's liveness changes"""
+        try:
+            if self.registry_rows() != self.listed_servers:
+                self.refresh_server_list()
+        except:
+            pass
+        self.root.after(REGISTRY_POLL_MS, self.watch_server_list)
+
     def connect_to_selected_server(self, event):
         """Connect to the selected server from tree view"""
         selection = self.server_tree.selection()
@@ -0,0 +1,81 @@
+"""Keyed, sorted model behind the server GUI's user listboxes.
+
+The GUI used to clear and refill its listboxes every second. Instead the
+server now publishes membership events, and UserListModel turns each one
+into the few listbox edits needed: ("insert", row, label),
+("replace", row, label), ("delete", row) or ("clear",). Rows are kept in
+sorted key order. Positions are found with bisect, so an event costs
+O(log n) plus the edit itself. A filter change is applied by merging the
+old and new visible lists, so rows that stay visible are never touched.
+"""
+from bisect import bisect_left, insort
+
+class UserListModel:
+    def __init__(self):
+        self.labels = {}    # key -> label shown in the listbox
+        self.index = []     # every key, sorted
+        self.visible = []   # keys shown with the current filter, sorted; one per listbox row
+        self.filter = ""
+
+    def matches(self, key):
+        return self.filter in key.lower()
+
+    def upsert(self, key, label):
+        """Add or relabel a key; returns the listbox edits"""
+        is_new = key not in self.labels
+        self.labels[key] = label
+        if is_new:
+            insort(self.index, key)
+        if not self.matches(key):
+            return []
+        row = bisect_left(self.visible, key)
+        if row < len(self.visible) and self.visible[row] == key:
+            return [("replace", row, label)]
+        self.visible.insert(row, key)
+        return [("insert", row, label)]
+
+    def remove(self, key):
+        """Drop a key; returns the listbox edits"""
+        if self.labels.pop(key, None) is None:
+            return []
+        del self.index[bisect_left(self.index, key)]
+        row = bisect_left(self.visible, key)
+        if row < len(self.visible) and self.visible[row] == key:
+            del self.visible[row]
+            return [("delete", row)]
+        return []
+
+    def set_filter(self, text):
+        """Show only keys containing text (case-insensitive); returns the listbox edits"""
+        text = text.lower()
+        if text == self.filter:
+            return []
+        # A longer filter can only hide rows, so only the visible ones need checking
+        candidates = self.visible if self.filter in text else self.index
+        self.filter = text
+        wanted = [key for key in candidates if self.matches(key)]
+
+        # Merge the two sorted lists into deletes and inserts, top to bottom
+        edits = []
+        old, row, i = self.visible, 0, 0
+        for key in wanted:
+            while i < len(old) and old[i] < key:
+                edits.append(("delete", row))
+                i += 1
+            if i < len(old) and old[i] == key:
+                i += 1
+            else:
+                edits.append(("insert", row, self.labels[key]))
+            row += 1
+        edits.extend(("delete", row) for _ in range(len(old) - i))
+        self.visible = wanted
+        return edits
+
+    def key_at(self, row):
+        return self.visible[row]
+
+    def clear(self):
+        self.labels.clear()
+        self.index.clear()
+        self.visible = []
+        return [("clear",)]
@@ -0,0 +1,161 @@
+"""Replay a large nmap transcript through a child process and compare the old
+readline loop with output_pump.
+
+The child writes the transcript to its stdout as fast as the pipe takes it
+and exits. Each reader feeds an NmapOutputParser, as the scan thread does.
+- The old loop (readline, sleep 10 ms, stop at poll()) runs for at most
+  --old-seconds. A second, short replay that fits in the pipe shows how many
+  lines it drops once the child has exited.
+- output_pump reads the whole transcript into a bounded queue. A consumer
+  thread empties the queue the way process_output does, every 100 ms up to
+  its character budget.
+
+Pass --transcript with a recorded -vv / --packet-trace run, or let the script
+make up --hosts hosts.
+
+    python bench_output_pump.py --hosts 20000
+    python bench_output_pump.py --transcript big_scan.txt
+"""
+import argparse
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from output_pump import read_blocks, put_block, MAX_BLOCKS
+from scan_results import ScanResults, NmapOutputParser
+
+REPLAY = "import shutil, sys; shutil.copyfileobj(open(sys.argv[1], 'rb'), sys.stdout.buffer, 65536)"
+
+HOST_TEMPLATE = """Nmap scan report for host{n}.example.net (10.{a}.{b}.{c})
+Host is up (0.0012s latency).
+Not shown: 995 closed tcp ports (reset)
+PORT     STATE    SERVICE       VERSION
+22/tcp   open     ssh           OpenSSH 8.2p1 Ubuntu 4ubuntu0.5 (Ubuntu Linux; protocol 2.0)
+80/tcp   open     http          Apache httpd 2.4.41 ((Ubuntu))
+|_http-title: Welcome
+443/tcp  open     ssl/http      nginx 1.18.0
+3389/tcp filtered ms-wbt-server
+8080/tcp closed   http-proxy
+
+"""
+
+def make_transcript(path, hosts):
+    with open(path, 'w') as f:
+        f.write("Starting Nmap 7.94 ( https://nmap.org ) at 2025-03-03 16:05 EST\n")
+        for n in range(hosts):
+            f.write(HOST_TEMPLATE.format(n=n, a=n >> 16 & 255, b=n >> 8 & 255, c=n & 255))
+            if n % 100 == 0:
+                f.write(f"SYN Stealth Scan Timing: About {100 * n / hosts:.2f}% done; ETC: 16:30 (0:10:00 remaining)\n")
+        f.write(f"Nmap done: {hosts} IP addresses ({hosts} hosts up) scanned in 600.00 seconds\n")
+
+def replay(path, text):
+    options = dict(universal_newlines=True, bufsize=1) if text else {}
+    return subprocess.Popen([sys.executable, '-c', REPLAY, path], stdout=subprocess.PIPE, **options)
+
+def old_loop(path, seconds):
+    """The loop _run_scan_thread used to have"""
+    process = replay(path, text=True)
+    parser = NmapOutputParser(ScanResults())
+    lines = 0
+    start = time.perf_counter()
+    while process.poll() is None and time.perf_counter() - start < seconds:
+        line = process.stdout.readline()
+        if line:
+            lines += 1
+            parser.feed(line)
+            time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    process.kill()
+    process.wait()
+    return lines, elapsed
+
+def pump(path, batch_chars=262144, interval=0.1):
+    process = replay(path, text=False)
+    parser = NmapOutputParser(ScanResults())
+    blocks = queue.Queue(maxsize=MAX_BLOCKS)
+    shown = [0, 0]  # lines, peak queue depth
+    done = threading.Event()
+
+    def consumer():
+        # Stand-in for process_output on the Tk main loop
+        while not (done.is_set() and blocks.empty()):
+            size = 0
+            while size < batch_chars:
+                try:
+                    block = blocks.get_nowait()
+                except queue.Empty:
+                    break
+                size += len(block)
+                shown[0] += block.count('\n')
+            shown[1] = max(shown[1], blocks.qsize())
+            time.sleep(0.01 if not blocks.empty() else interval)
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    start = time.perf_counter()
+    for block in read_blocks(process.stdout):
+        parser.feed_lines(block.splitlines())
+        put_block(blocks, block)
+    process.wait()
+    read = time.perf_counter() - start
+    done.set()
+    thread.join()
+    return shown[0], read, time.perf_counter() - start, shown[1], len(parser.results.hosts)
+
+def count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transcript", help="recorded nmap output to replay")
+    parser.add_argument("--hosts", type=int, default=20000, help="hosts in the made-up transcript")
+    parser.add_argument("--old-seconds", type=float, default=5.0, help="time limit for the old loop")
+    parser.add_argument("--tail-lines", type=int, default=300, help="lines in the short replay for the old loop")
+    args = parser.parse_args()
+
+    made = []
+    path = args.transcript
+    if not path:
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        make_transcript(path, args.hosts)
+        made.append(path)
+    fd, tail_path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    made.append(tail_path)
+    try:
+        with open(path) as source, open(tail_path, 'w') as tail:
+            for n, line in enumerate(source):
+                if n == args.tail_lines:
+                    break
+                tail.write(line)
+        total = count_lines(path)
+        tail_total = count_lines(tail_path)
+        size = os.path.getsize(path)
+        print(f"transcript: {total} lines, {size / 1e6:.1f} MB")
+
+        lines, elapsed = old_loop(path, args.old_seconds)
+        tail_lines, _ = old_loop(tail_path, args.old_seconds)
+        print(f"{'reader':<12} {'lines/s':>12} {'MB/s':>8} {'delivered':>20}")
+        print(f"{'readline':<12} {lines / elapsed:>12.0f} {'':>8} "
+              f"{f'{lines} in {elapsed:.1f}s':>20}")
+        print(f"{'':<12} {'':>12} {'':>8} {f'tail: {tail_lines}/{tail_total}':>20}")
+
+        shown, read, elapsed, peak, hosts = pump(path)
+        tail_shown = pump(tail_path)[0]
+        print(f"{'output_pump':<12} {total / read:>12.0f} {size / 1e6 / read:>8.1f} "
+              f"{f'{shown}/{total}':>20}")
+        print(f"{'':<12} {'':>12} {'':>8} {f'tail: {tail_shown}/{tail_total}':>20}")
+        print(f"pump: read and parsed in {read:.2f}s, shown by {elapsed:.2f}s, "
+              f"{hosts} hosts, peak queue {peak}/{MAX_BLOCKS} blocks")
+    finally:
+        for name in made:
+            os.remove(name)
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ import time
 import ipaddress
 import re
 import json
+import tempfile
 from datetime import datetime
 from ttkthemes import ThemedTk
 import matplotlib
@@ -24,6 +25,12 @@ import concurrent.futures
 import numpy as np
 from matplotlib.patches import Rectangle
 from matplotlib.lines import Line2D
+from scan_results import ScanResults, NmapOutputParser, port_risk
+from nmap_xml import load_nmap_xml
+from scan_scheduler import ScanScheduler, split_targets, read_target_file
+from output_pump import read_blocks, put_block, MAX_BLOCKS
+from output_console import OutputConsole
+from scan_db import ScanDatabase
 
 class NmapScannerApp:
     def __init__(self, root):
@@ -59,6 +66,7 @@ class NmapScannerApp:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Save Configuration", command=self.save_config)
         file_menu.add_command(label="Load Configuration", command=self.load_configs)
+        file_menu.add_command(label="Import Nmap XML Results", command=self.import_xml_results)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         
@@ -108,9 +116,29 @@ class NmapScannerApp:
         self.is_updating = False
         self.scan_running = False
         self.current_process = None
-        self.output_queue = queue.Queue()
+        # Bounded: a scan outrunning the UI waits on the queue (see output_pump)
+        self.output_queue = queue.Queue(maxsize=MAX_BLOCKS)
         self.output_buffer = []
         self.update_interval = 100
+        self.output_batch_chars = 262144  # Most output moved into the widget per update
+        
+        # Full transcript on disk; the output pane shows a window of it
+        self.console = OutputConsole()
+        
+        # Structured results, parsed line by line as the scan runs
+        self.scan_results = ScanResults()
+        self.output_parser = NmapOutputParser(self.scan_results)
+        
+        # Shards of a parallel scan, while one is running
+        self.scheduler = None
+        
+        # Every scan's results, kept across sessions for queries and diffs
+        try:
+            self.scan_db = ScanDatabase('scan_history.db')
+        except:
+            self.scan_db = None
+        self.scan_id = None
+        self.history_scan_ids = []
         
         # Initialize caches
         self._command_cache = {}
@@ -285,7 +313,7 @@ class NmapScannerApp:
         # Initialize other required variables
         self.scan_running = False
         self.current_process = None
-        self.output_queue = queue.Queue()
+        self.output_queue = queue.Queue(maxsize=MAX_BLOCKS)
         
         # Initialize history list
         self.history_list = None  # Will be created in create_history_tab
@@ -340,6 +368,9 @@ class NmapScannerApp:
         self.os_detection_var = tk.BooleanVar()
         self.aggressive_os_var = tk.BooleanVar()
         self.random_targets_var = tk.BooleanVar()
+        self.parallel_scans_var = tk.StringVar(value="1")
+        self.shard_size_var = tk.StringVar(value="256")
+        self.shard_retries_var = tk.StringVar(value="1")
 
         # Initialize results tab widgets
         self.stop_button = ttk.Button(self.root, text="Stop Scan", command=self.stop_scan, state=tk.DISABLED)
@@ -675,6 +706,24 @@ class NmapScannerApp:
         self.dns_server_entry = ttk.Entry(dns_frame, width=30)
         self.dns_server_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W+tk.E)
         
+        # Parallel scanning: large target sets run as several nmap processes
+        parallel_frame = ttk.LabelFrame(target_input_frame, text="Parallel Scanning", style='TLabelframe')
+        parallel_frame.grid(row=6, column=0, columnspan=2, padx=10, pady=10, sticky=tk.W+tk.E)
+        
+        ttk.Label(parallel_frame, text="Parallel nmap processes:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        ttk.Spinbox(parallel_frame, from_=1, to=64, width=5,
+                    textvariable=self.parallel_scans_var).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        ttk.Label(parallel_frame, text="Hosts per shard:").grid(row=0, column=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Entry(parallel_frame, width=8, textvariable=self.shard_size_var).grid(row=0, column=3, padx=5, pady=5, sticky=tk.W)
+        
+        ttk.Label(parallel_frame, text="Retries per shard:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        ttk.Spinbox(parallel_frame, from_=0, to=5, width=5,
+                    textvariable=self.shard_retries_var).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        ttk.Label(parallel_frame, text="Targets that fit in one shard are scanned by a single process.").grid(
+            row=2, column=0, columnspan=4, padx=5, pady=5, sticky=tk.W)
+        
         # Update preview on any change
         self.target_entry.bind("<KeyRelease>", lambda e: self.update_command_preview())
         self.target_file_entry.bind("<KeyRelease>", lambda e: self.update_command_preview())
@@ -868,6 +917,26 @@ class NmapScannerApp:
         output_frame = ttk.LabelFrame(frame, text="Scan Output", style='TLabelframe')
         output_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        # Search bar: searches the whole transcript, not just the lines shown
+        search_frame = ttk.Frame(output_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
+        
+        ttk.Label(search_frame, text="Find:").pack(side=tk.LEFT)
+        self.output_search_entry = ttk.Entry(search_frame, width=30)
+        self.output_search_entry.pack(side=tk.LEFT, padx=5)
+        self.output_search_entry.bind('<Return>', lambda e: self.find_in_output())
+        
+        ttk.Button(search_frame, text="Next", command=self.find_in_output).pack(side=tk.LEFT, padx=2)
+        ttk.Button(search_frame, text="Previous", command=lambda: self.find_in_output(backwards=True)).pack(side=tk.LEFT, padx=2)
+        
+        self.output_regex_var = tk.BooleanVar()
+        ttk.Checkbutton(search_frame, text="Regex", variable=self.output_regex_var).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(search_frame, text="Follow Output", command=self.follow_output).pack(side=tk.LEFT, padx=5)
+        
+        self.output_lines_label = ttk.Label(search_frame, text="")
+        self.output_lines_label.pack(side=tk.RIGHT)
+        
         # Create output text widget
         self.output_text = scrolledtext.ScrolledText(
             output_frame,
@@ -879,6 +948,7 @@ class NmapScannerApp:
             font=('Consolas', 10)
         )
         self.output_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.console.attach(self.output_text)
         
         # Create status frame
         status_frame = ttk.Frame(output_frame)
@@ -928,6 +998,15 @@ class NmapScannerApp:
             command=self.save_output
         )
         save_button.pack(side=tk.LEFT, padx=5)
+        
+        # Per-shard progress of a parallel scan, packed when one starts
+        self.shard_frame = ttk.LabelFrame(frame, text="Scan Shards", style='TLabelframe')
+        columns = ('targets', 'state', 'progress', 'hosts', 'attempts')
+        self.shard_tree = ttk.Treeview(self.shard_frame, columns=columns, show='headings', height=6)
+        for column, width in zip(columns, (300, 80, 80, 60, 70)):
+            self.shard_tree.heading(column, text=column.title())
+            self.shard_tree.column(column, width=width, anchor=tk.W)
+        self.shard_tree.pack(fill=tk.X, padx=5, pady=5)
 
     def create_timing_tab(self, frame):
         """Create the timing and performance tab"""
@@ -1331,6 +1410,7 @@ class NmapScannerApp:
 
     def _run_scan_thread(self):
         """Run the scan in a separate thread with improved error handling"""
+        xml_path, xml_temp = None, False
         try:
             if platform.system() == "Windows":
                 startupinfo = subprocess.STARTUPINFO()
@@ -1343,44 +1423,27 @@ class NmapScannerApp:
                 self._handle_scan_completion()
                 return
             
-            # Split command properly handling quotes
-            cmd_parts = []
-            current_part = []
-            in_quotes = False
-            for char in self.current_command:
-                if char == '"':
-                    in_quotes = not in_quotes
-                    current_part.append(char)
-                elif char == ' ' and not in_quotes:
-                    if current_part:
-                        cmd_parts.append(''.join(current_part))
-                        current_part = []
-                else:
-                    current_part.append(char)
-            if current_part:
-                cmd_parts.append(''.join(current_part))
+            cmd_parts = self._split_command(self.current_command)
+            
+            # Have nmap write XML too; it replaces the text-parsed results at the end
+            xml_path, xml_temp = self._xml_output_path(cmd_parts)
             
             process = subprocess.Popen(
                 cmd_parts,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1,
-                startupinfo=startupinfo,
-                text=True
+                startupinfo=startupinfo
             )
             
             self.current_process = process
+            parser = self.output_parser
+            stopped = lambda: not self.scan_running
             
-            # Read output continuously
-            while self.scan_running and process.poll() is None:
-                if process.stdout:
-                    # Read output line by line
-                    line = process.stdout.readline()
-                    if line:
-                        self.output_queue.put(line)
-                        # Small sleep to prevent CPU overuse
-                        time.sleep(0.01)
+            # Read output in chunks until EOF, so nothing written before exit is lost
+            for block in read_blocks(process.stdout, stopped):
+                parser.feed_lines(block.splitlines())
+                if not put_block(self.output_queue, block, stopped):
+                    break
             
             # Handle process termination
             if not self.scan_running:
@@ -1390,20 +1453,31 @@ class NmapScannerApp:
                 except subprocess.TimeoutExpired:
                     process.kill()  # Force kill if not terminated
                 self.output_queue.put("\nScan terminated by user.\n")
+                self._finish_scan_record("stopped")
             else:
                 return_code = process.wait()
                 if return_code == 0:
+                    self._load_xml_results(xml_path)
                     self.output_queue.put("\nScan completed successfully.\n")
+                    self._finish_scan_record("completed")
                 else:
                     self.output_queue.put(f"\nScan failed with return code {return_code}\n")
+                    self._finish_scan_record("failed")
             
             # Ensure cleanup happens
             self._handle_scan_completion()
             
         except Exception as e:
             self.output_queue.put(f"\nError during scan: {str(e)}\n")
+            self._finish_scan_record("failed")
             self._handle_scan_error(str(e))
         finally:
+            if xml_temp:
+                try:
+                    os.remove(xml_path)
+                except:
+                    pass
+            
             # Ensure process is terminated if it still exists
             if hasattr(self, 'current_process') and self.current_process:
                 try:
@@ -1422,33 +1496,226 @@ class NmapScannerApp:
                 self.stop_button.config(state=tk.DISABLED)
             if hasattr(self, 'progress_bar'):
                 self.progress_bar.stop()
+
+    def _split_command(self, command):
+        """Split command properly handling quotes"""
+        cmd_parts = []
+        current_part = []
+        in_quotes = False
+        for char in command:
+            if char == '"':
+                in_quotes = not in_quotes
+                current_part.append(char)
+            elif char == ' ' and not in_quotes:
+                if current_part:
+                    cmd_parts.append(''.join(current_part))
+                    current_part = []
+            else:
+                current_part.append(char)
+        if current_part:
+            cmd_parts.append(''.join(current_part))
+        return cmd_parts
+
+    def _plan_shards(self):
+        """Target shards for a parallel scan; None when one nmap process will do"""
+        try:
+            processes = int(self.parallel_scans_var.get())
+            hosts_per_shard = int(self.shard_size_var.get())
+        except ValueError:
+            return None
+        if processes < 2 or hosts_per_shard < 1:
+            return None
+        targets = [t for t in re.split(r'[,\s]+', self.target_entry.get()) if t]
+        target_file = self.target_file_entry.get().strip()
+        if target_file:
+            try:
+                targets.extend(read_target_file(target_file))
+            except:
+                return None  # nmap will report it
+        shards = split_targets(targets, hosts_per_shard)
+        return shards if len(shards) > 1 else None
+
+    def _run_sharded_scan(self, base_command, target_shards):
+        """Run the scan as parallel nmap processes, one per shard of the targets"""
+        scheduler = None
+        try:
+            if platform.system() == "Windows":
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            else:
+                startupinfo = None
             
-            # Clear queue
-            if hasattr(self, 'output_queue'):
-                while not self.output_queue.empty():
-                    self.output_queue.get()
+            try:
+                concurrency = int(self.parallel_scans_var.get())
+                retries = int(self.shard_retries_var.get())
+            except ValueError:
+                concurrency, retries = 2, 1
+            scheduler = ScanScheduler(
+                self._split_command(base_command),
+                target_shards,
+                self.scan_results,
+                concurrency=concurrency,
+                retries=retries,
+                on_output=lambda block: put_block(self.output_queue, block, lambda: not self.scan_running),
+                startupinfo=startupinfo
+            )
+            self.scheduler = scheduler
+            self.output_queue.put(f"Split into {len(scheduler.shards)} shards, {scheduler.concurrency} running at a time\n\n")
             
-            # Update status and output
-            self.update_scan_status("Scan stopped by user")
-            if hasattr(self, 'output_text'):
-                self.output_text.insert(tk.END, "\nScan stopped by user.\n")
-                self.output_text.see(tk.END)
+            scheduler.start()
+            scheduler.wait()
             
-        
+            if not self.scan_running:
+                self.output_queue.put("\nScan terminated by user.\n")
+                self._finish_scan_record("stopped")
+            else:
+                failed = scheduler.failed_shards()
+                if failed:
+                    numbers = ', '.join(str(shard.index + 1) for shard in failed)
+                    self.output_queue.put(f"\n{len(failed)} of {len(scheduler.shards)} shards failed: {numbers}\n")
+                    self._finish_scan_record("failed")
+                else:
+                    # Same as a single scan: the XML reports replace the parsed output
+                    try:
+                        self.scan_results = scheduler.merged_results()
+                    except Exception as e:
+                        self.output_queue.put(f"\nCould not read XML results ({str(e)}), using parsed output\n")
+                    self.output_queue.put("\nScan completed successfully.\n")
+                    self._finish_scan_record("completed")
+            
+            self._handle_scan_completion()
+            
+        except Exception as e:
+            self.output_queue.put(f"\nError during scan: {str(e)}\n")
+            self._finish_scan_record("failed")
+            self._handle_scan_error(str(e))
+        finally:
+            if scheduler:
+                scheduler.stop()
+                scheduler.cleanup()
+            self.root.after(0, self._update_shard_view)
+
+    def _update_shard_view(self):
+        """Refresh the per-shard progress table of a parallel scan"""
+        scheduler = self.scheduler
+        if not scheduler or not hasattr(self, 'shard_tree'):
+            return
+        states = defaultdict(int)
+        for shard in scheduler.shards:
+            states[shard.state] += 1
+            values = (shard.describe_targets(), shard.state, f"{shard.progress:.0f}%", shard.hosts, shard.attempts)
+            item = str(shard.index)
+            if self.shard_tree.exists(item):
+                self.shard_tree.item(item, values=values)
+            else:
+                self.shard_tree.insert('', tk.END, iid=item, values=values)
+        if self.scan_running:
+            summary = ', '.join(f"{count} {state}" for state, count in sorted(states.items()))
+            self.update_scan_status(f"Shards: {summary} - {scheduler.overall_progress():.0f}% done")
+
+    def _xml_output_path(self, cmd_parts):
+        """XML report of this scan: the -oX/-oA file asked for, or a temp file added to cmd_parts.
+        Returns (path, is_temp); path is None for -oX - (XML on stdout)"""
+        for i, part in enumerate(cmd_parts[:-1]):
+            if part == '-oX':
+                path = cmd_parts[i + 1].strip('"')
+                return (None, False) if path == '-' else (path, False)
+            if part == '-oA':
+                return cmd_parts[i + 1].strip('"') + '.xml', False
+        fd, path = tempfile.mkstemp(prefix='nmap_', suffix='.xml')
+        os.close(fd)
+        cmd_parts.extend(['-oX', path])
+        return path, True
+
+    def _load_xml_results(self, xml_path):
+        """Swap in the results from nmap's XML report; keeps the text-parsed ones if it can't be read"""
+        if not xml_path or not os.path.exists(xml_path) or os.path.getsize(xml_path) == 0:
+            return
+        try:
+            self.scan_results = load_nmap_xml(xml_path)
+        except Exception as e:
+            self.output_queue.put(f"\nCould not read XML results ({str(e)}), using parsed output\n")
+
+    def _scan_targets(self):
+        """Target field and target file, which identify scans of the same targets"""
+        return ' '.join(t for t in (self.target_entry.get().strip(), self.target_file_entry.get().strip()) if t)
+
+    def _start_scan_record(self, command):
+        """Add the scan to the database; its ports are recorded as the parser finds them"""
+        self.scan_id = None
+        if not self.scan_db:
+            return
+        self.scan_id = self.scan_db.start_scan(command, self._scan_targets())
+        self.scan_results.on_port = self.scan_db.port_recorder(self.scan_id)
+
+    def _finish_scan_record(self, status):
+        """Store the final results (the XML ones when they were loaded)"""
+        if self.scan_db and self.scan_id is not None:
+            self.scan_db.finish_scan(self.scan_id, self.scan_results, status)
+
+    def import_xml_results(self):
+        """Load results of an earlier scan from an nmap -oX file"""
+        file_path = filedialog.askopenfilename(filetypes=[("Nmap XML", "*.xml"), ("All Files", "*.*")])
+        if not file_path:
+            return
+        self.update_scan_status(f"Loading {os.path.basename(file_path)}...")
+        future = self.thread_pool.submit(load_nmap_xml, file_path)
+        self.root.after(self.update_interval, self._finish_xml_import, future, file_path)
+
+    def _finish_xml_import(self, future, file_path):
+        if not future.done():
+            self.root.after(self.update_interval, self._finish_xml_import, future, file_path)
+            return
+        try:
+            self.scan_results = future.result()
+            self.scan_id = None
+        except Exception as e:
+            self.update_scan_status("Import failed")
+            messagebox.showerror("Error", f"Failed to load XML results: {str(e)}")
+            return
+        self.update_scan_status(f"Loaded {len(self.scan_results.hosts)} hosts from {os.path.basename(file_path)}")
+        if hasattr(self, 'fig'):
+            self.update_analysis()
+
+    def write_output(self, text):
+        """Add text to the scan transcript and the output pane"""
+        self.console.write(text)
+
+    def find_in_output(self, backwards=False):
+        """Search the whole transcript, not just the lines in the output pane"""
+        pattern = self.output_search_entry.get()
+        if not pattern:
+            return
+        try:
+            line = self.console.find(pattern, backwards, regex=self.output_regex_var.get())
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid pattern: {str(e)}")
+            return
+        if line is None:
+            self.update_scan_status(f"'{pattern}' not found")
+        else:
+            self.update_scan_status(f"Found '{pattern}' on line {line + 1}")
+        self.output_lines_label.config(text=self.console.describe())
+
+    def follow_output(self):
+        """Back to the end of the output, following new lines"""
+        self.console.follow()
+        self.output_lines_label.config(text=self.console.describe())
 
     def clear_output(self):
-        """Clear the output text"""
-        self.output_text.delete(1.0, tk.END)
+        """Clear the output text and the results parsed from it"""
+        self.console.clear()
+        self.scan_results = ScanResults()
+        self.output_parser = NmapOutputParser(self.scan_results)
 
     def save_output(self):
         """Save the output text to a file"""
         file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")])
         if file_path:
-            with open(file_path, 'w') as f:
-                f.write(self.output_text.get(1.0, tk.END))
+            self.console.save(file_path)
 
-    def get_command(self):
-        """Optimized command generation with caching"""
+    def get_command(self, include_targets=True):
+        """Optimized command generation with caching; without the targets for a sharded scan"""
         # Validate targets first
         if not self.validate_targets():
             return None
@@ -1621,7 +1888,7 @@ class NmapScannerApp:
             command.append("--noninteractive")
         
         # Add targets at the end
-        if targets:
+        if targets and include_targets:
             command.extend(targets)
         
         return " ".join(command)
@@ -1911,6 +2178,9 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             'target_file': self.target_file_entry.get(),
             'exclude': self.exclude_entry.get(),
             'random_targets': self.random_targets_var.get(),
+            'parallel_scans': self.parallel_scans_var.get(),
+            'shard_size': self.shard_size_var.get(),
+            'shard_retries': self.shard_retries_var.get(),
             'random_count': self.random_count_entry.get(),
             'dns_resolution': self.dns_resolution_var.get(),
             'dns_servers': self.dns_server_entry.get(),
@@ -1965,6 +2235,9 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             self.exclude_entry.insert(0, config.get('exclude', ''))
             
             self.random_targets_var.set(config.get('random_targets', False))
+            self.parallel_scans_var.set(config.get('parallel_scans', '1'))
+            self.shard_size_var.set(config.get('shard_size', '256'))
+            self.shard_retries_var.set(config.get('shard_retries', '1'))
             
             self.random_count_entry.delete(0, tk.END)
             self.random_count_entry.insert(0, config.get('random_count', ''))
@@ -2113,7 +2386,7 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             list_frame,
             bg=self.alt_color,
             fg=self.fg_color,
-            selectmode=tk.SINGLE,
+            selectmode=tk.EXTENDED,
             yscrollcommand=scrollbar.set,
             font=('Segoe UI', 9),
             relief="flat",
@@ -2128,6 +2401,17 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
         # Bind double-click to load scan
         self.history_list.bind('<Double-Button-1>', self.load_scan_from_history)
         
+        # Earlier scans from the database, newest first
+        self.history_scan_ids = []
+        if self.scan_db:
+            try:
+                for scan_id, started, finished, command, targets, status in self.scan_db.scans(limit=1000):
+                    timestamp = datetime.fromtimestamp(started).strftime("%Y-%m-%d %H:%M:%S")
+                    self.history_list.insert(tk.END, f"[{timestamp}] {command}")
+                    self.history_scan_ids.append(scan_id)
+            except:
+                pass
+        
         # Create toolbar after history list
         toolbar = ttk.Frame(frame, style='Header.TFrame')
         toolbar.pack(fill=tk.X, padx=8, pady=4)
@@ -2143,11 +2427,144 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             text="Export History",
             command=self.export_history
         ).pack(side=tk.LEFT, padx=4)
+        
+        ttk.Button(
+            toolbar,
+            text="Load Results",
+            command=self.load_history_results
+        ).pack(side=tk.LEFT, padx=4)
+        
+        ttk.Button(
+            toolbar,
+            text="Compare Scans",
+            command=self.compare_history_scans
+        ).pack(side=tk.LEFT, padx=4)
+        
+        # Query across every stored scan
+        query_frame = ttk.Frame(frame, style='Header.TFrame')
+        query_frame.pack(fill=tk.X, padx=8, pady=4)
+        
+        ttk.Label(query_frame, text="Hosts with port").pack(side=tk.LEFT, padx=4)
+        self.history_port_entry = ttk.Entry(query_frame, width=7)
+        self.history_port_entry.insert(0, "3389")
+        self.history_port_entry.pack(side=tk.LEFT)
+        ttk.Label(query_frame, text="open in the last").pack(side=tk.LEFT, padx=4)
+        self.history_days_entry = ttk.Entry(query_frame, width=5)
+        self.history_days_entry.insert(0, "7")
+        self.history_days_entry.pack(side=tk.LEFT)
+        ttk.Label(query_frame, text="days").pack(side=tk.LEFT, padx=4)
+        ttk.Button(query_frame, text="Find Hosts", command=self.query_open_port).pack(side=tk.LEFT, padx=4)
 
     def clear_history(self):
-        """Clear the scan history"""
+        """Clear the scan history, and the stored results with it if asked to"""
         if self.history_list:
+            if self.scan_db and self.history_scan_ids:
+                # Yes: delete them too, No: only clear the list, Cancel: do nothing
+                delete = messagebox.askyesnocancel("Clear History", "Also delete the stored results of these scans?")
+                if delete is None:
+                    return
+                if delete:
+                    self.scan_db.delete_scans([scan_id for scan_id in self.history_scan_ids if scan_id is not None])
             self.history_list.delete(0, tk.END)
+            self.history_scan_ids = []
+
+    def _selected_scan_ids(self):
+        if not self.history_list:
+            return []
+        return [self.history_scan_ids[i] for i in self.history_list.curselection()
+                if i < len(self.history_scan_ids) and self.history_scan_ids[i] is not None]
+
+    def load_history_results(self):
+        """Show the stored results of the selected scan in the analysis views"""
+        scan_ids = self._selected_scan_ids()
+        if not self.scan_db or not scan_ids:
+            messagebox.showwarning("Warning", "Select a scan first")
+            return
+        self.scan_results = self.scan_db.load_results(scan_ids[0])
+        self.scan_id = scan_ids[0]
+        self.update_scan_status(f"Loaded {len(self.scan_results.hosts)} hosts from stored scan {scan_ids[0]}")
+        if hasattr(self, 'fig'):
+            self.update_analysis()
+
+    def compare_history_scans(self):
+        """Diff two selected scans, or one against the previous scan of its targets"""
+        scan_ids = self._selected_scan_ids()
+        if not self.scan_db or not scan_ids:
+            messagebox.showwarning("Warning", "Select one or two scans first")
+            return
+        if len(scan_ids) >= 2:
+            new_id, old_id = scan_ids[0], scan_ids[1]
+        else:
+            new_id, old_id = scan_ids[0], self.scan_db.previous_scan(scan_ids[0])
+            if old_id is None:
+                messagebox.showinfo("Compare Scans", "No earlier completed scan of the same targets")
+                return
+        old, new = self.scan_db.scan(old_id), self.scan_db.scan(new_id)
+        if old[1] > new[1]:
+            old_id, new_id, old, new = new_id, old_id, new, old
+        changes = self.scan_db.diff(old_id, new_id)
+        
+        def describe(key, service):
+            address, port, protocol = key
+            return f"  {address:<40} {port}/{protocol:<5} {' '.join(part for part in service if part)}"
+        
+        lines = [
+            f"From: {datetime.fromtimestamp(old[1]):%Y-%m-%d %H:%M}  {old[3]}",
+            f"To:   {datetime.fromtimestamp(new[1]):%Y-%m-%d %H:%M}  {new[3]}",
+            ""
+        ]
+        sections = [
+            ("New hosts", [f"  {address}" for address in changes['new_hosts']]),
+            ("Hosts gone", [f"  {address}" for address in changes['gone_hosts']]),
+            ("Ports opened", [describe(key, service) for key, service in changes['opened']]),
+            ("Ports closed", [describe(key, service) for key, service in changes['closed']]),
+            ("Service changes", [describe(key, old_service) + "  ->  " + ' '.join(part for part in new_service if part)
+                                 for key, old_service, new_service in changes['changed']]),
+        ]
+        for title, entries in sections:
+            lines.append(f"{title} ({len(entries)}):")
+            lines.extend(entries or ["  none"])
+            lines.append("")
+        self._show_report("Scan Comparison", lines)
+
+    def query_open_port(self):
+        """Hosts that had a port open in any scan of the last N days"""
+        if not self.scan_db:
+            messagebox.showerror("Error", "The scan database is not available")
+            return
+        try:
+            port = int(self.history_port_entry.get())
+            days = float(self.history_days_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Enter a port number and a number of days")
+            return
+        since = datetime.now().timestamp() - days * 86400
+        rows = self.scan_db.open_port_hosts(port, since)
+        lines = [f"Hosts with {port}/tcp open in the last {days:g} days: {len(rows)}", ""]
+        for address, hostname, first_seen, last_seen, scans, new in rows:
+            name = f"{address} ({hostname})" if hostname else address
+            lines.append(
+                f"  {name:<50} first {datetime.fromtimestamp(first_seen):%Y-%m-%d %H:%M}  "
+                f"last {datetime.fromtimestamp(last_seen):%Y-%m-%d %H:%M}  "
+                f"{scans} scan(s){'  NEW' if new else ''}"
+            )
+        self._show_report(f"Port {port} Report", lines)
+
+    def _show_report(self, title, lines):
+        """Read-only text window for query results"""
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("900x500")
+        text = scrolledtext.ScrolledText(
+            window,
+            wrap=tk.NONE,
+            bg=self.alt_color,
+            fg=self.fg_color,
+            font=('Consolas', 10)
+        )
+        text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        text.insert(tk.END, '\n'.join(lines) + '\n')
+        text.config(state=tk.DISABLED)
 
     def export_history(self):
         """Export scan history to file"""
@@ -2352,6 +2769,7 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
         command = self.get_command()
         if not command:
             return
+        target_shards = self._plan_shards()
     
         try:
             # Initialize scan state
@@ -2370,8 +2788,8 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             
             # Clear previous output
             self.clear_output()
-            self.output_text.insert(tk.END, f"Starting scan...\n\nCommand: {command}\n\n")
-            self.output_text.see(tk.END)
+            self.write_output(f"Starting scan...\n\nCommand: {command}\n\n")
+            self._start_scan_record(command)
             
             # Initialize animation state
             self.animation_index = 0
@@ -2403,9 +2821,23 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             if hasattr(self, 'history_list') and self.history_list is not None:
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 self.history_list.insert(0, f"[{timestamp}] {command}")
-            
-            # Start scan thread
-            self.scan_thread = threading.Thread(target=self._run_scan_thread)
+                self.history_scan_ids.insert(0, self.scan_id)
+            
+            # Start scan thread; large target sets are split over several nmap processes
+            self.scheduler = None
+            if hasattr(self, 'shard_tree'):
+                self.shard_tree.delete(*self.shard_tree.get_children())
+                if target_shards:
+                    self.shard_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+                else:
+                    self.shard_frame.pack_forget()
+            if target_shards:
+                self.scan_thread = threading.Thread(
+                    target=self._run_sharded_scan,
+                    args=(self.get_command(include_targets=False), target_shards)
+                )
+            else:
+                self.scan_thread = threading.Thread(target=self._run_scan_thread)
             self.scan_thread.daemon = True
             self.scan_thread.start()
             
@@ -2413,48 +2845,53 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             self.process_output()
             
         except Exception as e:
-            self._handle_scan_error(f"Failed to start scan: {str(e)}")
+            self._handle_scan_error(f"Failed to start scan: {str(e)}", from_scan_thread=False)
 
-    def _handle_scan_error(self, error_msg):
+    def _handle_scan_error(self, error_msg, from_scan_thread=True):
         """Handle scan errors with proper cleanup"""
         self.scan_running = False
         self.animation_running = False
         self.scan_error = True
         
-        if hasattr(self, 'stop_button'):
-            self.stop_button.config(state=tk.DISABLED)
-        if hasattr(self, 'progress_bar'):
-            self.progress_bar.stop()
-            
+        if from_scan_thread:
+            # After the output already queued; the widgets are updated on the Tk thread
+            self.output_queue.put(f"\nError: {error_msg}\n")
+            self.root.after(0, self._show_scan_error, error_msg)
+        else:
+            self.write_output(f"\nError: {error_msg}\n")
+            self._show_scan_error(error_msg)
+
+    def _show_scan_error(self, error_msg):
+        """Tk thread side of _handle_scan_error"""
+        self._stop_scan_controls()
         self.update_scan_status("Scan failed")
-        
-        if hasattr(self, 'output_text'):
-            self.output_text.insert(tk.END, f"\nError: {error_msg}\n")
-            self.output_text.see(tk.END)
-            
         messagebox.showerror("Error", error_msg)
 
     def _handle_scan_completion(self):
-        """Handle scan completion with proper cleanup"""
+        """Handle scan completion with proper cleanup; called on the scan thread"""
+        # Calculate scan duration
+        duration = time.time() - self.scan_start_time
+        duration_str = f"{int(duration)} seconds"
+        
+        if not self.scan_error:
+            # Queued behind the scan's own output, so it is shown last
+            self.output_queue.put(f"\nScan completed in {duration_str}\n")
         self.scan_running = False
         self.animation_running = False
         self.scan_completed = True
-        
+        self.root.after(0, self._show_scan_completion, duration_str)
+
+    def _show_scan_completion(self, duration_str):
+        """Tk thread side of _handle_scan_completion"""
+        self._stop_scan_controls()
+        if not self.scan_error:
+            self.update_scan_status(f"Scan completed in {duration_str}")
+
+    def _stop_scan_controls(self):
         if hasattr(self, 'stop_button'):
             self.stop_button.config(state=tk.DISABLED)
         if hasattr(self, 'progress_bar'):
             self.progress_bar.stop()
-            
-        # Calculate scan duration
-        duration = time.time() - self.scan_start_time
-        duration_str = f"{int(duration)} seconds"
-        
-        # Update status
-        if not self.scan_error:
-            self.update_scan_status(f"Scan completed in {duration_str}")
-            if hasattr(self, 'output_text'):
-                self.output_text.insert(tk.END, f"\nScan completed in {duration_str}\n")
-                self.output_text.see(tk.END)
 
     def load_preview_to_main(self):
         """Load the expert command preview into the main command preview"""
@@ -2485,40 +2922,49 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             messagebox.showerror("Error", f"Failed to copy to clipboard: {str(e)}")
 
     def process_output(self):
-        """Process scan output with batching and animation"""
+        """Move output blocks from the scan thread into the output pane"""
         if hasattr(self, 'is_updating') and self.is_updating:
             return
             
         self.is_updating = True
+        more = False
         try:
-            # Process output in batches
-            batch_size = 50
-            lines = []
-            
-            for _ in range(batch_size):
+            # Take what has arrived, up to output_batch_chars per update
+            blocks = []
+            size = 0
+            while size < self.output_batch_chars:
                 try:
-                    line = self.output_queue.get_nowait()
-                    if line:
-                        lines.append(line)
+                    block = self.output_queue.get_nowait()
                 except queue.Empty:
                     break
+                if block:
+                    blocks.append(block)
+                    size += len(block)
+            more = not self.output_queue.empty()
             
-            if lines:
+            if blocks:
+                text = ''.join(blocks)
                 # Update output text
-                if hasattr(self, 'output_text'):
-                    self.output_text.insert(tk.END, ''.join(lines))
-                    self.output_text.see(tk.END)
+                self.write_output(text)
                 
-                # Update status if progress info is found
-                for line in lines:
+                # Update status with the latest progress info
+                for line in reversed(text.splitlines()):
                     if "Progress:" in line or "Timing:" in line:
                         self.update_scan_status(line.strip())
                         break
             
+            if self.scheduler:
+                self._update_shard_view()
+            if blocks and hasattr(self, 'output_lines_label'):
+                self.output_lines_label.config(text=self.console.describe())
+            
         finally:
             self.is_updating = False
-            if self.scan_running and hasattr(self, 'root'):
-                self.root.after(100, self.process_output)
+            # Keep going until the scan thread is done and everything it queued is shown
+            scan_thread = getattr(self, 'scan_thread', None)
+            if hasattr(self, 'root') and (self.scan_running or more or (scan_thread and scan_thread.is_alive())):
+                # Come back sooner while a backlog is waiting
+                self.root.after(10 if more else self.update_interval, self.process_output)
 
     def stop_scan(self):
         """Stop the current scan with proper cleanup"""
@@ -2532,7 +2978,9 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             self.scan_error = False
             self.animation_running = False
             
-            # Stop current process
+            # Stop current process, or every shard of a parallel scan
+            if self.scheduler:
+                self.scheduler.stop()
             if hasattr(self, 'current_process') and self.current_process:
                 try:
                     self.current_process.terminate()
@@ -2550,14 +2998,10 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
                 self.progress_bar.stop()
             
             self.update_scan_status("Scan stopped")
-            if hasattr(self, 'output_text'):
-                self.output_text.insert(tk.END, "\nScan stopped by user\n")
-                self.output_text.see(tk.END)
+            self.write_output("\nScan stopped by user\n")
             
         except Exception as e:
-            if hasattr(self, 'output_text'):
-                self.output_text.insert(tk.END, f"\nError stopping scan: {str(e)}\n")
-                self.output_text.see(tk.END)
+            self.write_output(f"\nError stopping scan: {str(e)}\n")
 
     def create_analysis_tab(self, frame):
         """Create the analysis tab with enhanced security visualizations"""
@@ -2938,21 +3382,13 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _generate_detailed_findings(self):
         """Generate detailed security findings based on the analysis"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             return "<p>No scan data available</p>"
             
-        output = self.output_text.get(1.0, tk.END)
         findings = []
         
-        # Analyze open ports
-        open_ports = []
-        for line in output.split('\n'):
-            if '/tcp' in line or '/udp' in line:
-                parts = line.split()
-                if len(parts) >= 2 and parts[1] == 'open':
-                    port = parts[0]
-                    service = parts[2] if len(parts) > 2 else 'unknown'
-                    open_ports.append((port, service))
+        # Open ports and services
+        open_ports = self.scan_results.open_port_list()
         
         if open_ports:
             findings.append("<h3>Open Ports and Services</h3>")
@@ -2962,15 +3398,8 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
                 findings.append(f'<li class="{risk_class}">{port} - {service}</li>')
             findings.append("</ul>")
         
-        # Analyze vulnerabilities
-        vulns = []
-        current_vuln = None
-        for line in output.split('\n'):
-            if '|' in line and 'VULNERABLE' in line.upper():
-                current_vuln = line.strip()
-            elif current_vuln and line.strip().startswith('|'):
-                vulns.append((current_vuln, line.strip()))
-                current_vuln = None
+        # Script output reporting vulnerabilities
+        vulns = [(finding.title, finding.detail) for finding in self.scan_results.vulnerable_findings()]
         
         if vulns:
             findings.append("<h3>Identified Vulnerabilities</h3>")
@@ -2994,22 +3423,32 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_temporal_analysis(self, ax):
         """Plot temporal analysis of scan data"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No temporal data available', ha='center', va='center')
             return
             
-        # Parse timestamps and events from scan output
-        events = []
-        current_time = None
-        for line in self.output_text.get(1.0, tk.END).split('\n'):
-            if 'Initiating' in line and 'at' in line:
-                try:
-                    current_time = datetime.strptime(line.split('at')[1].strip(), '%Y-%m-%d %H:%M %Z')
-                    events.append((current_time, 'scan_start'))
-                except:
-                    pass
-            elif current_time and ('open' in line or 'filtered' in line):
-                events.append((current_time, 'port_discovery'))
+        # Stored scans of the same targets make a real time series
+        series = []
+        if self.scan_db and self.scan_id is not None:
+            try:
+                scan = self.scan_db.scan(self.scan_id)
+                if scan:
+                    series = self.scan_db.series(scan[4])
+            except:
+                series = []
+        if len(series) >= 2:
+            times = [datetime.fromtimestamp(row[0]) for row in series]
+            for column, label, color in ((1, 'Hosts up', '#2ecc71'), (2, 'Open ports', '#3498db'),
+                                         (3, 'High-risk open ports', '#e74c3c'), (4, 'Vulnerabilities', '#9b59b6')):
+                ax.plot(times, [row[column] for row in series], marker='o', label=label, color=color)
+            ax.set_ylabel('Count')
+            ax.set_title(f'Temporal Security Analysis ({len(series)} scans of {scan[4]})')
+            ax.legend(loc='upper left')
+            plt.setp(ax.get_xticklabels(), rotation=45)
+            return
+        
+        # Scan phases and port discoveries, timestamped by the parser
+        events = self.scan_results.timeline()
         
         if events:
             # Create timeline plot
@@ -3026,41 +3465,13 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_protocol_security(self, ax):
         """Plot protocol security analysis"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No protocol data available', ha='center', va='center')
             return
             
-        # Analyze protocols and their security implications
-        protocols = {}
-        for proto in ['TCP', 'UDP']:
-            protocols[proto] = {
-                'open': 0,
-                'filtered': 0,
-                'closed': 0,
-                'open|filtered': 0,  # Add combined state
-                'risk_score': 0
-            }
-        
-        for line in self.output_text.get(1.0, tk.END).split('\n'):
-            if '/tcp' in line or '/udp' in line:
-                parts = line.split()
-                if len(parts) >= 2:
-                    proto = 'TCP' if '/tcp' in parts[0] else 'UDP'
-                    state = parts[1]
-                    port = parts[0].split('/')[0]
-                    
-                    # Handle the state
-                    if state in protocols[proto]:
-                        protocols[proto][state] += 1
-                    
-                    # Calculate risk score based on port number and state
-                    if 'open' in state:  # This covers both 'open' and 'open|filtered'
-                        if port in {'21', '23', '445', '3389', '5900'}:
-                            protocols[proto]['risk_score'] += 3  # High risk
-                        elif port in {'80', '443', '22', '53'}:
-                            protocols[proto]['risk_score'] += 1  # Standard risk
-                        else:
-                            protocols[proto]['risk_score'] += 2  # Medium risk
+        # Port states per protocol, and a risk score from the open ones
+        # (3 per high-risk port, 1 per standard port, 2 for anything else)
+        protocols = self.scan_results.protocol_summary()
         
         if protocols:
             # Create protocol security matrix
@@ -3094,40 +3505,12 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_version_risk(self, ax):
         """Plot service version risk analysis"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No version data available', ha='center', va='center')
             return
             
-        # Analyze service versions and their risks
-        services = {}
-        
-        for line in self.output_text.get(1.0, tk.END).split('\n'):
-            if '/tcp' in line or '/udp' in line:
-                parts = line.split()
-                if len(parts) >= 3 and parts[1] == 'open':
-                    service = parts[2]
-                    version = 'Unknown'
-                    risk_level = 1
-                    
-                    # Extract version information
-                    if len(parts) > 3:
-                        version_info = ' '.join(parts[3:])
-                        if 'version' in version_info.lower():
-                            version = version_info
-                            # Calculate risk based on version age/known vulnerabilities
-                            if any(x in version_info.lower() for x in ['outdated', 'old', 'vulnerable']):
-                                risk_level = 3
-                            elif any(x in version_info.lower() for x in ['current', 'latest']):
-                                risk_level = 1
-                            else:
-                                risk_level = 2
-                    
-                    if service not in services:
-                        services[service] = {'versions': {}, 'risk_level': 0}
-                    if version not in services[service]['versions']:
-                        services[service]['versions'][version] = 0
-                    services[service]['versions'][version] += 1
-                    services[service]['risk_level'] = max(services[service]['risk_level'], risk_level)
+        # Versions seen per open service, and the highest risk among them
+        services = self.scan_results.version_summary()
         
         if services:
             # Create service version risk matrix
@@ -3155,7 +3538,7 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def update_analysis(self, event=None):
         """Update the analysis visualization based on selected type"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'fig'):
             return
             
         try:
@@ -3229,50 +3612,21 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             self.canvas.draw()
             
             # Log the error
-            if hasattr(self, 'output_text'):
-                self.output_text.insert(tk.END, f"\nAnalysis Error: {str(e)}\n")
-                self.output_text.see(tk.END)
+            self.write_output(f"\nAnalysis Error: {str(e)}\n")
 
     def _update_statistics(self):
         """Update the statistics panel with current scan data"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             return
             
-        output = self.output_text.get(1.0, tk.END)
+        stats = self.scan_results.statistics()
+        self.stats_labels["Total Hosts"].config(text=str(stats['hosts']))
+        self.stats_labels["Open Ports"].config(text=str(stats['open_ports']))
+        self.stats_labels["Critical Vulnerabilities"].config(text=str(stats['vulnerabilities']))
         
-        # Count total hosts
-        host_count = len([line for line in output.split('\n') if 'Nmap scan report for' in line])
-        self.stats_labels["Total Hosts"].config(text=str(host_count))
-        
-        # Count open ports
-        open_ports = len([line for line in output.split('\n') 
-                         if ('/tcp' in line or '/udp' in line) and 'open' in line])
-        self.stats_labels["Open Ports"].config(text=str(open_ports))
-        
-        # Count critical vulnerabilities
-        vuln_count = len([line for line in output.split('\n') 
-                         if '|' in line and 'VULNERABLE' in line.upper()])
-        self.stats_labels["Critical Vulnerabilities"].config(text=str(vuln_count))
-        
-        # Calculate security score (0-100)
-        max_score = 100
-        deductions = 0
-        
-        # Deduct for open high-risk ports
-        high_risk_ports = {'21', '23', '445', '3389', '5900'}
-        for line in output.split('\n'):
-            if any(f"{port}/" in line for port in high_risk_ports) and 'open' in line:
-                deductions += 10
-                
-        # Deduct for vulnerabilities
-        deductions += vuln_count * 15
-        
-        # Deduct for excessive open ports
-        if open_ports > 10:
-            deductions += (open_ports - 10) * 2
-            
-        # Calculate final score
-        security_score = max(0, max_score - deductions)
+        # Security score (0-100): deductions for open high-risk ports,
+        # vulnerabilities and more than 10 open ports
+        security_score = self.scan_results.security_score()
         self.stats_labels["Security Score"].config(
             text=f"{security_score}",
             foreground='#27ae60' if security_score >= 80 
@@ -3282,28 +3636,13 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_port_distribution(self, ax):
         """Plot port distribution analysis"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No port data available', ha='center', va='center')
             return
             
         try:
-            output = self.output_text.get(1.0, tk.END)
-            ports = {}
-            
-            # Parse port information
-            for line in output.split('\n'):
-                if '/tcp' in line or '/udp' in line:
-                    parts = line.split()
-                    if len(parts) >= 2 and 'open' in parts[1]:
-                        port_num = parts[0].split('/')[0]
-                        protocol = 'TCP' if '/tcp' in parts[0] else 'UDP'
-                        service = parts[2] if len(parts) > 2 else 'unknown'
-                        
-                        port_key = f"{port_num}/{protocol}"
-                        if port_key not in ports:
-                            ports[port_key] = {'count': 0, 'services': set()}
-                        ports[port_key]['count'] += 1
-                        ports[port_key]['services'].add(service)
+            # Open ports with how many hosts have them and their services
+            ports = self.scan_results.port_distribution()
             
             if ports:
                 # Sort ports by count
@@ -3314,15 +3653,8 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
                 counts = [p[1]['count'] for p in sorted_ports]
                 
                 # Create color map based on risk
-                colors = []
-                for port in port_names:
-                    port_num = port.split('/')[0]
-                    if port_num in {'21', '23', '445', '3389', '5900'}:
-                        colors.append('#e74c3c')  # High risk - red
-                    elif port_num in {'80', '443', '22', '53'}:
-                        colors.append('#f1c40f')  # Standard - yellow
-                    else:
-                        colors.append('#3498db')  # Low risk - blue
+                risk_colors = {'high': '#e74c3c', 'standard': '#f1c40f', 'low': '#3498db'}
+                colors = [risk_colors[port_risk(port.split('/')[0])] for port in port_names]
                 
                 # Create bar plot
                 bars = ax.bar(range(len(port_names)), counts, color=colors)
@@ -3363,27 +3695,18 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_service_map(self, ax):
         """Plot service relationship map"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No service data available', ha='center', va='center')
             return
             
         try:
             G = nx.Graph()
-            services = {}
-            
-            output = self.output_text.get(1.0, tk.END)
-            for line in output.split('\n'):
-                if '/tcp' in line or '/udp' in line:
-                    parts = line.split()
-                    if len(parts) >= 3 and parts[1] == 'open':
-                        port = parts[0].split('/')[0]
-                        service = parts[2]
-                        if service not in services:
-                            services[service] = []
-                        services[service].append(port)
-                        G.add_node(service, type='service')
-                        G.add_node(port, type='port')
-                        G.add_edge(service, port)
+            services = self.scan_results.service_map()
+            for service, ports in services.items():
+                G.add_node(service, type='service')
+                for port in ports:
+                    G.add_node(port, type='port')
+                    G.add_edge(service, port)
             
             if G.nodes():
                 pos = nx.spring_layout(G, k=1, iterations=50)
@@ -3420,21 +3743,13 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_vulnerability_overview(self, ax):
         """Plot vulnerability analysis overview"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No vulnerability data available', ha='center', va='center')
             return
             
         try:
-            output = self.output_text.get(1.0, tk.END)
-            vuln_levels = {'Critical': 0, 'Warning': 0, 'Info': 0}
-            
-            for line in output.split('\n'):
-                if 'VULNERABLE' in line.upper():
-                    vuln_levels['Critical'] += 1
-                elif 'WARNING' in line.upper():
-                    vuln_levels['Warning'] += 1
-                elif 'INFO' in line.upper():
-                    vuln_levels['Info'] += 1
+            # Lines mentioning VULNERABLE, WARNING or INFO, counted as they arrived
+            vuln_levels = self.scan_results.vulnerability_levels()
             
             if any(vuln_levels.values()):
                 # Create pie chart with better styling
@@ -3468,7 +3783,7 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_network_topology(self, ax):
         """Plot network topology visualization"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No topology data available', ha='center', va='center')
             return
             
@@ -3477,21 +3792,10 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
             import numpy as np
             
             G = nx.Graph()
-            hosts = set()
-            connections = {}
-            
-            output = self.output_text.get(1.0, tk.END)
-            current_host = None
-            
-            for line in output.split('\n'):
-                if 'Nmap scan report for' in line:
-                    current_host = line.split()[-1].strip('()')
-                    hosts.add(current_host)
-                    G.add_node(current_host, type='host')
-                    connections[current_host] = []
-                elif current_host and ('/tcp' in line or '/udp' in line) and 'open' in line:
-                    port = line.split()[0].split('/')[0]
-                    connections[current_host].append(port)
+            # Host address -> its open ports
+            connections = self.scan_results.topology()
+            for host in connections:
+                G.add_node(host, type='host')
             
             if G.nodes():
                 # Add port nodes and connections
@@ -3524,17 +3828,11 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
                     'low': '#3498db'
                 }
                 
+                risk_sizes = {'high': 1500, 'standard': 1200, 'low': 1000}
                 for node in port_nodes:
-                    port = node.split(':')[1]
-                    if port in {'21', '23', '445', '3389', '5900'}:
-                        port_colors.append(risk_colors['high'])
-                        port_sizes.append(1500)
-                    elif port in {'80', '443', '22', '53'}:
-                        port_colors.append(risk_colors['standard'])
-                        port_sizes.append(1200)
-                    else:
-                        port_colors.append(risk_colors['low'])
-                        port_sizes.append(1000)
+                    risk = port_risk(node.rsplit(':', 1)[1])
+                    port_colors.append(risk_colors[risk])
+                    port_sizes.append(risk_sizes[risk])
                 
                 port_sizes = np.array(port_sizes)
                 port_colors = np.array(port_colors)
@@ -3550,7 +3848,7 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
                 
                 # Add labels with better visibility
                 host_labels = {node: node for node in host_nodes}
-                port_labels = {node: node.split(':')[1] for node in port_nodes}
+                port_labels = {node: node.rsplit(':', 1)[1] for node in port_nodes}
                 labels = {**host_labels, **port_labels}
                 
                 nx.draw_networkx_labels(G, pos, labels=labels,
@@ -3586,39 +3884,14 @@ For security guidelines: https://nmap.org/book/legal-issues.html"""
 
     def _plot_risk_assessment(self, ax):
         """Plot security risk assessment"""
-        if not hasattr(self, 'output_text'):
+        if not hasattr(self, 'scan_results'):
             ax.text(0.5, 0.5, 'No risk assessment data available', ha='center', va='center')
             return
             
         try:
-            output = self.output_text.get(1.0, tk.END)
-            risk_factors = {
-                'Open High-Risk Ports': 0,
-                'Vulnerable Services': 0,
-                'Weak Configurations': 0,
-                'Missing Updates': 0,
-                'Authentication Issues': 0
-            }
-            
-            # Analyze high-risk ports
-            high_risk_ports = {'21', '23', '445', '3389', '5900'}
-            for line in output.split('\n'):
-                if '/tcp' in line or '/udp' in line:
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == 'open':
-                        port = parts[0].split('/')[0]
-                        if port in high_risk_ports:
-                            risk_factors['Open High-Risk Ports'] += 1
-            
-                # Check for various security issues
-                if 'VULNERABLE' in line.upper():
-                    risk_factors['Vulnerable Services'] += 1
-                elif 'WEAK' in line.upper() or 'DEFAULT' in line.upper():
-                    risk_factors['Weak Configurations'] += 1
-                elif 'OUT OF DATE' in line.upper() or 'OUTDATED' in line.upper():
-                    risk_factors['Missing Updates'] += 1
-                elif 'AUTH' in line.upper() or 'PASSWORD' in line.upper():
-                    risk_factors['Authentication Issues'] += 1
+            # Open high-risk ports, plus lines flagging vulnerable, weak,
+            # outdated or authentication problems
+            risk_factors = self.scan_results.risk_factors()
             
             if any(risk_factors.values()):
                 # Create radar chart
@@ -0,0 +1,110 @@
+"""Load nmap's XML output (-oX) into a ScanResults.
+
+The text parser has to guess at nmap's human-readable layout. The XML report
+of the same scan has every host, port, service and script output as fields.
+NmapScannerApp therefore asks nmap for -oX as well, and when the scan ends it
+replaces the text-parsed results with the ones loaded from the XML.
+
+The loader streams the file with iterparse and throws away each <host>
+element (and everything before it) once it has been read. Memory stays at
+one host's worth of XML plus the ScanResults being built, however large
+the scan was (a /16 sweep, say). Hosts that are not up are skipped, as in
+the normal output.
+"""
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from scan_results import ScanResults, Finding
+
+def load_nmap_xml(source, results=None):
+    """Parse an -oX file (path or binary file object); returns the ScanResults"""
+    if results is None:
+        results = ScanResults()
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+    if root.tag != 'nmaprun':
+        raise ValueError("not an nmap XML report")
+    start = timestamp(root.get('start'))
+    if start:
+        with results.lock:
+            results.events.append((start, 'scan_start'))
+
+    for event, elem in context:
+        if event != 'end':
+            continue
+        if elem.tag == 'host':
+            with results.lock:
+                add_host(results, elem)
+            # Drop the host and anything parsed before it
+            root.clear()
+        elif elem.tag == 'taskbegin':
+            begun = timestamp(elem.get('time'))
+            if begun:
+                with results.lock:
+                    results.events.append((begun, 'scan_start'))
+    return results
+
+def timestamp(value):
+    try:
+        return datetime.fromtimestamp(int(value))
+    except (TypeError, ValueError):
+        return None
+
+def add_host(results, elem):
+    status = elem.find('status')
+    if status is not None and status.get('state') != 'up':
+        return
+    address = None
+    for addr in elem.findall('address'):
+        if addr.get('addrtype') in ('ipv4', 'ipv6'):
+            address = addr.get('addr')
+            break
+        address = address or addr.get('addr')
+    if not address:
+        return
+    name = elem.find('hostnames/hostname')
+    host = results.host(address, name.get('name', '') if name is not None else '')
+    host.status = 'up'
+
+    found = timestamp(elem.get('endtime'))
+    for port in elem.findall('ports/port'):
+        state = port.find('state')
+        service = port.find('service')
+        name, version = 'unknown', ''
+        if service is not None:
+            name = service.get('name') or 'unknown'
+            version = describe_version(service)
+        entry = results.set_port(
+            host, port.get('portid'), port.get('protocol'),
+            state.get('state') if state is not None else 'unknown', name, version
+        )
+        if found and entry.is_open:
+            results.events.append((found, 'port_discovery'))
+        for script in port.findall('script'):
+            add_script(results, host, f"{entry.port}/{entry.protocol}", script)
+    for script in elem.findall('hostscript/script'):
+        add_script(results, host, '', script)
+
+def describe_version(service):
+    """product, version and extra info as the normal output prints them"""
+    parts = [service.get('product'), service.get('version')]
+    extra = service.get('extrainfo')
+    if extra:
+        parts.append(f"({extra})")
+    return ' '.join(part for part in parts if part)
+
+def add_script(results, host, port, script):
+    """Same findings and keyword counts as the text parser gets from the | lines"""
+    pending = None
+    for line in (script.get('output') or '').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        results.count_keywords(line)
+        if 'VULNERABLE' in line.upper():
+            results.vulnerabilities += 1
+            pending = Finding(host.address, port, script.get('id', ''), line, vulnerable=True)
+            results.findings.append(pending)
+        elif pending is not None:
+            pending.detail = line
+            pending = None
@@ -0,0 +1,282 @@
+"""Keep a scan's whole transcript on disk and only a window of it in the widget.
+
+A Tk Text widget gets slower with every line it holds, and a -vv or
+--packet-trace run prints millions of them. All of that also sat in Tk's
+memory until the output was cleared.
+
+OutputSpool is an append-only temporary file, memory-mapped for reading.
+A sparse index holds the offset of every INDEX_STEP-th line, so any line is
+one lookup and a short scan away. Search runs a regular expression over the
+map, so it never loads the transcript into Python memory.
+
+OutputConsole puts a spool behind the output ScrolledText. While it follows
+the output, new text is appended and lines past window_lines are trimmed off
+the top, a page at a time. Scrolling to either edge of the window pages
+lines in from the spool and drops as many from the other end. A search hit
+loads the window around the matching line. The widget never holds more
+than window_lines plus a page or two, however long the scan runs.
+
+The scan analysis never reads the widget; it works on the ScanResults model.
+"""
+import mmap
+import re
+import tempfile
+import threading
+import tkinter as tk
+from bisect import bisect_right
+
+INDEX_STEP = 64       # Lines between index entries
+WINDOW_LINES = 5000   # Lines kept in the widget
+PAGE_LINES = 500      # Lines paged in or trimmed at a time
+COPY_CHUNK = 1 << 20
+
+class OutputSpool:
+    """Append-only transcript file with line lookup and search"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = tempfile.TemporaryFile(prefix='nmap_output_')
+        self.map = None
+        self.reset_index()
+
+    def reset_index(self):
+        self.size = 0
+        self.newlines = 0
+        self.partial = False   # Last line not ended by a newline yet
+        self.index = [0]       # Offsets of lines 0, INDEX_STEP, 2 * INDEX_STEP, ...
+
+    def append(self, text):
+        data = text.encode('utf-8', 'replace')
+        if not data:
+            return
+        with self.lock:
+            self.file.write(data)
+            self.file.flush()
+            count = data.count(b'\n')
+            # Index the lines starting in this chunk that fall on a step
+            next_step = len(self.index) * INDEX_STEP
+            line, pos = self.newlines, -1
+            while next_step <= self.newlines + count:
+                while line < next_step:
+                    pos = data.find(b'\n', pos + 1)
+                    line += 1
+                self.index.append(self.size + pos + 1)
+                next_step += INDEX_STEP
+            self.newlines += count
+            self.size += len(data)
+            self.partial = not data.endswith(b'\n')
+
+    def line_count(self):
+        return self.newlines + (1 if self.partial else 0)
+
+    def remap(self):
+        """Map the file as it is now (caller holds the lock)"""
+        if self.map is not None and len(self.map) == self.size:
+            return self.map
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def offset(self, line):
+        """Byte offset where a line starts (the end of the file past the last line)"""
+        if line >= self.line_count():
+            return self.size
+        if line <= 0:
+            return 0
+        pos = self.index[line // INDEX_STEP]
+        for _ in range(line % INDEX_STEP):
+            pos = self.map.find(b'\n', pos) + 1
+        return pos
+
+    def line_at(self, offset):
+        """Line holding a byte offset"""
+        step = bisect_right(self.index, offset) - 1
+        return step * INDEX_STEP + self.map[self.index[step]:offset].count(b'\n')
+
+    def lines(self, start, end):
+        """Text of lines start to end-1"""
+        with self.lock:
+            if not self.remap():
+                return ''
+            return self.map[self.offset(start):self.offset(end)].decode('utf-8', 'replace')
+
+    def search(self, pattern, start_line=0, backwards=False, regex=False, ignore_case=True):
+        """Line of the next match from start_line (the previous one before it if backwards),
+        wrapping around the end; None if there is none"""
+        expression = re.compile(
+            (pattern if regex else re.escape(pattern)).encode('utf-8'),
+            re.IGNORECASE if ignore_case else 0
+        )
+        with self.lock:
+            if not self.remap():
+                return None
+            start = self.offset(start_line)
+            if backwards:
+                match = None
+                for found in expression.finditer(self.map, 0, start):
+                    match = found
+                if match is None:
+                    for found in expression.finditer(self.map, start):
+                        match = found
+            else:
+                match = expression.search(self.map, start) or expression.search(self.map, 0, start)
+            return self.line_at(match.start()) if match else None
+
+    def save(self, path):
+        """Copy the transcript to a file"""
+        with self.lock, open(path, 'wb') as f:
+            if self.remap():
+                for pos in range(0, self.size, COPY_CHUNK):
+                    f.write(self.map[pos:pos + COPY_CHUNK])
+
+    def clear(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file.seek(0)
+            self.file.truncate()
+            self.reset_index()
+
+    def close(self):
+        self.clear()
+        self.file.close()
+
+class OutputConsole:
+    """A ScrolledText showing a window of an OutputSpool"""
+    def __init__(self, window_lines=WINDOW_LINES, page_lines=PAGE_LINES):
+        self.spool = OutputSpool()
+        self.window_lines = window_lines
+        self.page_lines = page_lines
+        self.widget = None
+        self.first = 0          # Spool line on the widget's first line
+        self.shown = 0          # Spool lines in the widget
+        self.following = True   # Keep showing the newest output
+        self.last_match = None
+
+    def attach(self, widget):
+        """Show the console in a ScrolledText (again, if the tab was rebuilt)"""
+        self.widget = widget
+        widget.tag_configure('match', background='#ffd54f', foreground='black')
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>', '<Prior>', '<Next>', '<Up>', '<Down>'):
+            widget.bind(sequence, lambda e: widget.after_idle(self.check_edges), add='+')
+        if hasattr(widget, 'vbar'):
+            widget.vbar.configure(command=self.on_scrollbar)
+        self.follow()
+
+    def write(self, text):
+        self.spool.append(text)
+        if self.widget is None or not self.following:
+            return
+        self.widget.insert(tk.END, text)
+        self.shown = self.spool.line_count() - self.first
+        excess = self.shown - self.window_lines
+        if excess >= self.page_lines:
+            self.widget.delete('1.0', f'{excess + 1}.0')
+            self.first += excess
+            self.shown -= excess
+        self.widget.see(tk.END)
+
+    def render(self, first):
+        """Fill the widget with the window starting at spool line first"""
+        total = self.spool.line_count()
+        self.first = max(0, min(first, total - self.window_lines))
+        self.shown = min(self.window_lines, total - self.first)
+        self.widget.delete('1.0', tk.END)
+        self.widget.insert('1.0', self.spool.lines(self.first, self.first + self.shown))
+
+    def follow(self):
+        """Jump to the end and keep up with new output"""
+        self.following = True
+        if self.widget is not None:
+            self.render(self.spool.line_count() - self.window_lines)
+            self.widget.see(tk.END)
+
+    def on_scrollbar(self, *args):
+        self.widget.yview(*args)
+        self.check_edges()
+
+    def check_edges(self):
+        """Page in from the spool when the view reaches an edge of the window"""
+        top, bottom = self.widget.yview()
+        if top <= 0.0 and self.first > 0:
+            self.page_up()
+        elif bottom >= 1.0:
+            if self.first + self.shown < self.spool.line_count():
+                self.page_down()
+            else:
+                self.following = True
+        else:
+            self.following = False
+
+    def page_up(self):
+        self.following = False
+        count = min(self.page_lines, self.first)
+        self.widget.insert('1.0', self.spool.lines(self.first - count, self.first))
+        self.first -= count
+        self.shown += count
+        extra = self.shown - self.window_lines
+        if extra > 0:
+            self.widget.delete(f'{self.window_lines + 1}.0', tk.END)
+            self.shown -= extra
+        # Keep the line that was at the top where it was
+        self.widget.yview(f'{count + 1}.0')
+
+    def page_down(self):
+        end = self.first + self.shown
+        count = min(self.page_lines, self.spool.line_count() - end)
+        top = int(self.widget.index('@0,0').split('.')[0])
+        self.widget.insert(tk.END, self.spool.lines(end, end + count))
+        self.shown += count
+        extra = self.shown - self.window_lines
+        if extra > 0:
+            self.widget.delete('1.0', f'{extra + 1}.0')
+            self.first += extra
+            self.shown -= extra
+            top = max(1, top - extra)
+        self.widget.yview(f'{top}.0')
+
+    def show_line(self, line):
+        """Load the window around a spool line and highlight it"""
+        self.render(line - self.window_lines // 2)
+        self.following = self.first + self.shown >= self.spool.line_count()
+        row = line - self.first + 1
+        self.widget.tag_remove('match', '1.0', tk.END)
+        self.widget.tag_add('match', f'{row}.0', f'{row}.end')
+        self.widget.see(f'{row}.0')
+
+    def find(self, pattern, backwards=False, regex=False):
+        """Search the whole transcript from the last match (or the top of the view)"""
+        if self.last_match is not None:
+            start = self.last_match if backwards else self.last_match + 1
+        elif self.widget is not None:
+            start = self.first + int(self.widget.index('@0,0').split('.')[0]) - 1
+        else:
+            start = 0
+        line = self.spool.search(pattern, start, backwards, regex)
+        self.last_match = line
+        if line is not None and self.widget is not None:
+            self.show_line(line)
+        return line
+
+    def describe(self):
+        total = self.spool.line_count()
+        if not self.shown:
+            return f"{total} lines"
+        return f"Lines {self.first + 1}-{self.first + self.shown} of {total}"
+
+    def save(self, path):
+        self.spool.save(path)
+
+    def clear(self):
+        self.spool.clear()
+        self.first = self.shown = 0
+        self.following = True
+        self.last_match = None
+        if self.widget is not None:
+            self.widget.delete('1.0', tk.END)
+
+    def close(self):
+        self.spool.close()
@@ -0,0 +1,75 @@
+"""Read nmap's output in large chunks and pass it on as blocks of whole lines.
+
+The scan thread used to call readline() and then sleep 10 ms per line. That
+capped a verbose scan at about 100 lines a second. It also stopped as soon as
+poll() saw nmap exit, so whatever was still in the pipe was lost.
+
+read_blocks() instead:
+- waits on the pipe with a selector and reads up to CHUNK_SIZE bytes at a
+  time. Windows can't select on pipes, so there it does a plain blocking read,
+  which returns as soon as any data is there;
+- decodes incrementally and yields one str per read, holding only complete
+  lines. A partial last line waits for the rest, but only up to chunk_size
+  characters: output with no newline in sight (binary noise, say) is passed
+  on in pieces of that size instead of growing without bound;
+- reads until EOF, not until the process exits, so everything nmap wrote comes
+  through, including an unterminated last line.
+
+Blocks go to the UI through a bounded queue.Queue with put_block(). When the
+UI falls behind, put_block() waits. read_blocks() is then not advanced, the
+pipe fills up and nmap blocks on its own writes. Memory stays bounded, as in
+the chat server's per-client send queues.
+"""
+import codecs
+import os
+import queue
+import selectors
+
+CHUNK_SIZE = 65536
+MAX_BLOCKS = 256      # Queue bound: at most MAX_BLOCKS * CHUNK_SIZE bytes waiting for the UI
+
+def read_blocks(stream, stopped=None, chunk_size=CHUNK_SIZE, poll_interval=0.1):
+    """Yield blocks of whole lines from a binary pipe until EOF.
+    stopped() is checked while the pipe is idle; returning True ends the read early"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    fd = stream.fileno()
+    selector = None
+    if os.name != 'nt':
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
+    tail = ''
+    try:
+        while True:
+            if selector is not None and not selector.select(poll_interval):
+                if stopped and stopped():
+                    return
+                continue
+            chunk = os.read(fd, chunk_size)
+            if not chunk:
+                break
+            text = tail + decoder.decode(chunk)
+            end = text.rfind('\n') + 1
+            tail = text[end:]
+            if end:
+                yield text[:end].replace('\r\n', '\n')
+            if len(tail) >= chunk_size:
+                # No line is this long; end it here so tail stays bounded
+                yield tail.replace('\r\n', '\n') + '\n'
+                tail = ''
+        tail += decoder.decode(b'', final=True)
+        if tail:
+            yield tail.replace('\r\n', '\n') + '\n'
+    finally:
+        if selector is not None:
+            selector.close()
+
+def put_block(blocks, block, stopped=None, timeout=0.1):
+    """Put a block on a bounded queue, waiting while it is full.
+    Gives up (returns False) once stopped() is True, so a stopped scan can't hang here"""
+    while True:
+        try:
+            blocks.put(block, timeout=timeout)
+            return True
+        except queue.Full:
+            if stopped and stopped():
+                return False
@@ -0,0 +1,361 @@
+"""Every scan's results in a local SQLite database, for queries across scans.
+
+A scan's results used to live only in the output pane, and the history tab
+kept nothing but the command line. ScanDatabase records each scan NmapScannerApp
+runs:
+- start_scan() adds the scan (command, targets, start time);
+- port_recorder() is set as the ScanResults' on_port hook. Every port the
+  parser adds or updates is queued with the time it was seen;
+- finish_scan() writes the final hosts, ports and findings (the XML results,
+  when nmap's report could be read) and the scan's status.
+
+Nothing is written on the parser thread. Rows go on a queue, and a writer
+thread commits everything waiting in one transaction, as in the chat
+server's MessageHistory. Ports are indexed by host, port, service and
+time seen. Questions like "which hosts opened 3389 in the last week" are one
+indexed query, and so are the changes between two scans of the same targets.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from scan_results import ScanResults, Finding, HIGH_RISK_PORTS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL,
+    command TEXT NOT NULL,
+    targets TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_targets_started ON scans (targets, started);
+CREATE TABLE IF NOT EXISTS hosts (
+    scan_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (scan_id, address)
+);
+CREATE INDEX IF NOT EXISTS hosts_address ON hosts (address);
+CREATE TABLE IF NOT EXISTS ports (
+    scan_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    protocol TEXT NOT NULL,
+    state TEXT NOT NULL,
+    service TEXT NOT NULL,
+    version TEXT NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (scan_id, address, port, protocol)
+);
+CREATE INDEX IF NOT EXISTS ports_address ON ports (address, port);
+CREATE INDEX IF NOT EXISTS ports_port_seen ON ports (port, seen);
+CREATE INDEX IF NOT EXISTS ports_service_seen ON ports (service, seen);
+CREATE INDEX IF NOT EXISTS ports_seen ON ports (seen);
+CREATE TABLE IF NOT EXISTS findings (
+    scan_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    port TEXT NOT NULL,
+    script TEXT NOT NULL,
+    title TEXT NOT NULL,
+    detail TEXT NOT NULL,
+    vulnerable INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS findings_scan ON findings (scan_id);
+"""
+
+STATEMENTS = {
+    "scan": "INSERT INTO scans (id, started, command, targets, status) VALUES (?, ?, ?, ?, 'running')",
+    "host": "INSERT INTO hosts (scan_id, address, hostname, status) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (scan_id, address) DO UPDATE SET hostname = excluded.hostname, status = excluded.status",
+    # A port keeps the time it was first seen; state, service and version follow the latest report
+    "port": "INSERT INTO ports (scan_id, address, port, protocol, state, service, version, seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (scan_id, address, port, protocol) DO UPDATE SET "
+            "state = excluded.state, service = excluded.service, version = excluded.version",
+    "clear_findings": "DELETE FROM findings WHERE scan_id = ?",
+    "finding": "INSERT INTO findings (scan_id, address, port, script, title, detail, vulnerable) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "finish": "UPDATE scans SET finished = ?, status = ? WHERE id = ?",
+}
+
+# Columns of scans(), for callers
+SCAN_COLUMNS = ("id", "started", "finished", "command", "targets", "status")
+
+def open_state(column):
+    # Confirmed open only: open|filtered just means nmap got no answer
+    return f"{column} = 'open'"
+
+class ScanDatabase:
+    def __init__(self, path, batch_size=1000):
+        """
+        path: SQLite database file, created if missing
+        batch_size: most rows the writer commits in one transaction
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = queue.SimpleQueue()
+
+        self.db = self.connect()
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        last_id = self.db.execute("SELECT MAX(id) FROM scans").fetchone()[0]
+        self.next_id = (last_id or 0) + 1
+        # Separate connection for reads; WAL lets it run alongside the writer
+        self.reader = self.connect()
+        self.reader_lock = threading.Lock()
+
+        self.writer_thread = threading.Thread(target=self.write_loop)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # -- Recording --
+
+    def start_scan(self, command, targets, started=None):
+        """Record a new scan; never blocks on disk. Returns its id"""
+        with self.lock:
+            scan_id = self.next_id
+            self.next_id += 1
+        self.pending.put(("scan", (scan_id, started or time.time(), command, targets)))
+        return scan_id
+
+    def port_recorder(self, scan_id):
+        """ScanResults.on_port hook queueing every port the parser reports"""
+        def record(host, entry):
+            self.pending.put(("port", (
+                scan_id, host.address, int(entry.port), entry.protocol,
+                entry.state, entry.service, entry.version, time.time()
+            )))
+        return record
+
+    def finish_scan(self, scan_id, results, status="completed"):
+        """Record a scan's final results and status"""
+        now = time.time()
+        with results.lock:
+            hosts = [(scan_id, host.address, host.hostname, host.status) for host in results.hosts.values()]
+            ports = [
+                (scan_id, host.address, int(entry.port), entry.protocol,
+                 entry.state, entry.service, entry.version, now)
+                for host in results.hosts.values() for entry in host.ports.values()
+            ]
+            findings = [
+                (scan_id, finding.host, finding.port, finding.script,
+                 finding.title, finding.detail, int(finding.vulnerable))
+                for finding in results.findings
+            ]
+        for row in hosts:
+            self.pending.put(("host", row))
+        for row in ports:
+            self.pending.put(("port", row))
+        self.pending.put(("clear_findings", (scan_id,)))
+        for row in findings:
+            self.pending.put(("finding", row))
+        self.pending.put(("finish", (now, status, scan_id)))
+
+    def write_loop(self):
+        running = True
+        while running:
+            # Group commit: everything already waiting goes in one transaction
+            items = [self.pending.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            batch = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    # flush() marker: commit what came before it, then wake the caller
+                    self.write_batch(batch)
+                    batch = []
+                    item.set()
+                else:
+                    batch.append(item)
+            self.write_batch(batch)
+        self.db.close()
+
+    def write_batch(self, batch):
+        if not batch:
+            return
+        try:
+            with self.db:
+                # One executemany per run of the same statement, in queue order
+                start = 0
+                for end in range(1, len(batch) + 1):
+                    if end == len(batch) or batch[end][0] != batch[start][0]:
+                        self.db.executemany(STATEMENTS[batch[start][0]], [row for _, row in batch[start:end]])
+                        start = end
+        except sqlite3.Error:
+            pass  # Scanning keeps working without the database
+
+    def flush(self, timeout=5):
+        """Wait until everything recorded so far has been committed"""
+        if threading.current_thread() is self.writer_thread or not self.writer_thread.is_alive():
+            return
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        self.pending.put(None)
+        self.writer_thread.join(timeout=5)
+        with self.reader_lock:
+            self.reader.close()
+
+    # -- Queries --
+
+    def read(self, query, params=()):
+        self.flush()
+        with self.reader_lock:
+            return self.reader.execute(query, params).fetchall()
+
+    def scans(self, targets=None, limit=None):
+        """Scans as SCAN_COLUMNS tuples, newest first"""
+        query = f"SELECT {', '.join(SCAN_COLUMNS)} FROM scans"
+        params = []
+        if targets is not None:
+            query += " WHERE targets = ?"
+            params.append(targets)
+        query += " ORDER BY started DESC, id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.read(query, params)
+
+    def scan(self, scan_id):
+        rows = self.read(f"SELECT {', '.join(SCAN_COLUMNS)} FROM scans WHERE id = ?", (scan_id,))
+        return rows[0] if rows else None
+
+    def previous_scan(self, scan_id):
+        """The last completed scan of the same targets before this one"""
+        rows = self.read(
+            "SELECT p.id FROM scans s JOIN scans p ON p.targets = s.targets "
+            "WHERE s.id = ? AND p.status = 'completed' AND p.started < s.started "
+            "ORDER BY p.started DESC LIMIT 1",
+            (scan_id,)
+        )
+        return rows[0][0] if rows else None
+
+    def open_port_hosts(self, port, since, protocol="tcp"):
+        """Hosts with a port open in scans since a time (datetime or epoch seconds).
+        Rows are (address, hostname, first seen, last seen, scans, new); new is True
+        if no earlier scan had the port open on that host"""
+        if isinstance(since, datetime):
+            since = since.timestamp()
+        return [
+            row[:5] + (bool(row[5]),)
+            for row in self.read(
+                "SELECT p.address, COALESCE(MAX(h.hostname), ''), MIN(p.seen), MAX(p.seen), "
+                "COUNT(DISTINCT p.scan_id), "
+                "NOT EXISTS (SELECT 1 FROM ports o WHERE o.address = p.address AND o.port = p.port "
+                f"AND o.protocol = p.protocol AND {open_state('o.state')} AND o.seen < ?) "
+                "FROM ports p LEFT JOIN hosts h ON h.scan_id = p.scan_id AND h.address = p.address "
+                f"WHERE p.port = ? AND p.protocol = ? AND {open_state('p.state')} AND p.seen >= ? "
+                "GROUP BY p.address ORDER BY MIN(p.seen)",
+                (since, int(port), protocol, since)
+            )
+        ]
+
+    def open_ports(self, scan_id):
+        """(address, port, protocol) -> (service, version) for a scan's open ports"""
+        return {
+            (address, port, protocol): (service, version)
+            for address, port, protocol, service, version in self.read(
+                "SELECT address, port, protocol, service, version FROM ports "
+                f"WHERE scan_id = ? AND {open_state('state')}",
+                (scan_id,)
+            )
+        }
+
+    def diff(self, old_id, new_id):
+        """What changed from one scan to another"""
+        hosts_query = "SELECT address FROM hosts WHERE scan_id = ? AND status = 'up'"
+        old_hosts = {row[0] for row in self.read(hosts_query, (old_id,))}
+        new_hosts = {row[0] for row in self.read(hosts_query, (new_id,))}
+        old, new = self.open_ports(old_id), self.open_ports(new_id)
+        return {
+            "new_hosts": sorted(new_hosts - old_hosts),
+            "gone_hosts": sorted(old_hosts - new_hosts),
+            "opened": sorted((key, new[key]) for key in new.keys() - old.keys()),
+            "closed": sorted((key, old[key]) for key in old.keys() - new.keys()),
+            "changed": sorted((key, old[key], new[key]) for key in new.keys() & old.keys() if old[key] != new[key]),
+        }
+
+    def series(self, targets):
+        """(started, hosts up, open ports, high-risk open ports, vulnerable findings)
+        for each completed scan of the targets, oldest first"""
+        high_risk = ", ".join(sorted(HIGH_RISK_PORTS, key=int))
+        return self.read(
+            "SELECT s.started, "
+            "(SELECT COUNT(*) FROM hosts h WHERE h.scan_id = s.id AND h.status = 'up'), "
+            f"(SELECT COUNT(*) FROM ports p WHERE p.scan_id = s.id AND {open_state('p.state')}), "
+            f"(SELECT COUNT(*) FROM ports p WHERE p.scan_id = s.id AND {open_state('p.state')} "
+            f"AND p.port IN ({high_risk})), "
+            "(SELECT COUNT(*) FROM findings f WHERE f.scan_id = s.id AND f.vulnerable) "
+            "FROM scans s WHERE s.targets = ? AND s.status = 'completed' ORDER BY s.started",
+            (targets,)
+        )
+
+    def load_results(self, scan_id):
+        """A stored scan as a ScanResults. The keyword counts of the transcript are not
+        stored, so those charts only see what the findings say"""
+        results = ScanResults()
+        scan = self.scan(scan_id)
+        if scan is None:
+            return results
+        hosts = self.read("SELECT address, hostname, status FROM hosts WHERE scan_id = ?", (scan_id,))
+        ports = self.read(
+            "SELECT address, port, protocol, state, service, version, seen FROM ports "
+            "WHERE scan_id = ? ORDER BY seen",
+            (scan_id,)
+        )
+        findings = self.read(
+            "SELECT address, port, script, title, detail, vulnerable FROM findings WHERE scan_id = ?",
+            (scan_id,)
+        )
+        with results.lock:
+            results.events.append((datetime.fromtimestamp(scan[1]), 'scan_start'))
+            for address, hostname, status in hosts:
+                results.host(address, hostname).status = status
+            for address, port, protocol, state, service, version, seen in ports:
+                entry = results.set_port(results.host(address), str(port), protocol, state, service, version)
+                if entry.is_open:
+                    results.events.append((datetime.fromtimestamp(seen), 'port_discovery'))
+            for address, port, script, title, detail, vulnerable in findings:
+                finding = Finding(address, port, script, title, vulnerable=bool(vulnerable))
+                finding.detail = detail
+                results.findings.append(finding)
+                results.count_keywords(title)
+                if vulnerable:
+                    results.vulnerabilities += 1
+        return results
+
+    def delete_scans(self, scan_ids=None):
+        """Forget some scans, or all of them"""
+        self.flush()
+        with self.lock:
+            db = self.connect()
+            try:
+                with db:
+                    for table, column in (("findings", "scan_id"), ("ports", "scan_id"),
+                                          ("hosts", "scan_id"), ("scans", "id")):
+                        if scan_ids is None:
+                            db.execute(f"DELETE FROM {table}")
+                        else:
+                            db.executemany(f"DELETE FROM {table} WHERE {column} = ?",
+                                           [(scan_id,) for scan_id in scan_ids])
+            finally:
+                db.close()
@@ -0,0 +1,380 @@
+"""Structured results of an nmap scan, built incrementally from its output.
+
+The analysis views of NmapScannerApp used to re-read the whole output_text
+widget and re-split it line by line, once per statistic and once per plot.
+NmapOutputParser is instead fed every line once, as _run_scan_thread reads
+it, and keeps a ScanResults up to date:
+- hosts, each with its ports (state, service, version) and script findings;
+- the running totals and per-port/per-service tallies the statistics panel
+  and the plots draw from, so their cost depends on how many distinct ports
+  and services were found, not on how long the transcript is.
+
+The parser thread writes and the Tk thread reads, so every accessor returns
+a copy taken under the lock. on_port, if set, is called (lock held) with
+every port added or updated; ScanDatabase uses it to record ports as they
+are found.
+"""
+import re
+import threading
+from datetime import datetime
+
+HIGH_RISK_PORTS = {'21', '23', '445', '3389', '5900'}
+STANDARD_PORTS = {'80', '443', '22', '53'}
+
+# "80/tcp   open  http    Apache httpd 2.4.41 ((Ubuntu))"
+PORT_LINE = re.compile(r"^(\d+)/(tcp|udp|sctp)\s+(\S+)(?:\s+(\S+))?(?:\s+(.*\S))?\s*$")
+# "Discovered open port 443/tcp on 10.0.0.1"
+DISCOVERED_LINE = re.compile(r"^Discovered (\S+) port (\d+)/(tcp|udp|sctp) on (\S+)")
+# "Starting Nmap 7.94 ( https://nmap.org ) at 2025-03-03 16:05 EST"
+STARTING_LINE = re.compile(r"^Starting Nmap .* at (\d{4}-\d{2}-\d{2} \d{2}:\d{2})")
+# "Initiating SYN Stealth Scan at 16:05"
+INITIATING_LINE = re.compile(r"^Initiating .* at (\d{2}:\d{2})")
+SCRIPT_LINE = re.compile(r"^\|_?\s?([\w.-]+):")
+
+def port_risk(port):
+    """'high', 'standard' or 'low' for a port number given as a string"""
+    if port in HIGH_RISK_PORTS:
+        return 'high'
+    if port in STANDARD_PORTS:
+        return 'standard'
+    return 'low'
+
+def version_risk(version):
+    """1-3 from the words nmap's version string happens to contain"""
+    if not version or 'version' not in version.lower():
+        return 1
+    version = version.lower()
+    if any(word in version for word in ['outdated', 'old', 'vulnerable']):
+        return 3
+    if any(word in version for word in ['current', 'latest']):
+        return 1
+    return 2
+
+class Port:
+    __slots__ = ("port", "protocol", "state", "service", "version")
+
+    def __init__(self, port, protocol, state, service='unknown', version=''):
+        self.port = port
+        self.protocol = protocol
+        self.state = state
+        self.service = service
+        self.version = version
+
+    @property
+    def is_open(self):
+        # Counts open|filtered too, like the old text scans' port counts and score did.
+        # Check state == 'open' where only confirmed open ports count
+        return 'open' in self.state
+
+class Host:
+    __slots__ = ("address", "hostname", "status", "ports")
+
+    def __init__(self, address, hostname=''):
+        self.address = address
+        self.hostname = hostname
+        self.status = 'unknown'
+        self.ports = {}  # (port, protocol) -> Port
+
+class Finding:
+    """Output of an NSE script, flagged if it reports a vulnerability"""
+    __slots__ = ("host", "port", "script", "title", "detail", "vulnerable")
+
+    def __init__(self, host, port, script, title, vulnerable=False):
+        self.host = host
+        self.port = port
+        self.script = script
+        self.title = title
+        self.detail = ''
+        self.vulnerable = vulnerable
+
+def tally(counts, key, delta):
+    """Add delta to counts[key], dropping keys that reach zero"""
+    value = counts.get(key, 0) + delta
+    if value:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+class ScanResults:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.on_port = None  # on_port(host, port) after each set_port
+        self.clear()
+
+    def clear(self):
+        self.hosts = {}               # address -> Host, in report order
+        self.findings = []
+        self.events = []              # (datetime, 'scan_start' | 'port_discovery')
+        self.open_ports = 0
+        self.high_risk_open = 0
+        self.high_risk_confirmed = 0  # High-risk ports in state open only, not open|filtered
+        self.vulnerabilities = 0
+        # Open ports: "80/TCP" -> {'count': hosts, 'services': {service: n}}
+        self.port_stats = {}
+        # Open ports by service: service -> {port: n}
+        self.service_ports = {}
+        # Port states by protocol: 'TCP' -> {state: n}
+        self.protocol_states = {'TCP': {}, 'UDP': {}}
+        self.protocol_risk = {'TCP': 0, 'UDP': 0}
+        # Open ports by service and version: service -> {version: n}, and risk levels
+        self.service_versions = {}
+        self.service_risks = {}       # service -> {risk level: n}
+        # Keyword counts over every line, as the pie and radar charts always had
+        self.vuln_levels = {'Critical': 0, 'Warning': 0, 'Info': 0}
+        self.keywords = {'Weak Configurations': 0, 'Missing Updates': 0, 'Authentication Issues': 0}
+
+    # -- Updates (parser thread, lock held) --
+
+    def host(self, address, hostname=''):
+        host = self.hosts.get(address)
+        if host is None:
+            host = self.hosts[address] = Host(address, hostname)
+        elif hostname and not host.hostname:
+            host.hostname = hostname
+        return host
+
+    def set_port(self, host, port, protocol, state, service=None, version=None):
+        """Add or update one port of a host, keeping every tally in step"""
+        key = (port, protocol)
+        old = host.ports.get(key)
+        if old is not None:
+            self.account(old, -1)
+            service = service or old.service
+            version = version if version is not None else old.version
+        entry = host.ports[key] = Port(port, protocol, state, service or 'unknown', version or '')
+        self.account(entry, 1)
+        if self.on_port is not None:
+            self.on_port(host, entry)
+        return entry
+
+    def account(self, entry, sign):
+        proto = entry.protocol.upper()
+        if proto in self.protocol_states:
+            tally(self.protocol_states[proto], entry.state, sign)
+        if not entry.is_open:
+            return
+        risk = port_risk(entry.port)
+        self.open_ports += sign
+        if risk == 'high':
+            self.high_risk_open += sign
+            if entry.state == 'open':
+                self.high_risk_confirmed += sign
+        if proto in self.protocol_risk:
+            self.protocol_risk[proto] += sign * {'high': 3, 'standard': 1, 'low': 2}[risk]
+        port_key = f"{entry.port}/{'TCP' if proto == 'TCP' else 'UDP'}"
+        stats = self.port_stats.setdefault(port_key, {'count': 0, 'services': {}})
+        stats['count'] += sign
+        tally(stats['services'], entry.service, sign)
+        if not stats['count']:
+            del self.port_stats[port_key]
+        if entry.state == 'open':
+            ports = self.service_ports.setdefault(entry.service, {})
+            tally(ports, entry.port, sign)
+            if not ports:
+                del self.service_ports[entry.service]
+            versions = self.service_versions.setdefault(entry.service, {})
+            tally(versions, entry.version if 'version' in entry.version.lower() else 'Unknown', sign)
+            risks = self.service_risks.setdefault(entry.service, {})
+            tally(risks, version_risk(entry.version), sign)
+            if not versions:
+                del self.service_versions[entry.service]
+                del self.service_risks[entry.service]
+
+    def count_keywords(self, line):
+        upper = line.upper()
+        if 'VULNERABLE' in upper:
+            self.vuln_levels['Critical'] += 1
+            return
+        if 'WARNING' in upper:
+            self.vuln_levels['Warning'] += 1
+        elif 'INFO' in upper:
+            self.vuln_levels['Info'] += 1
+        if 'WEAK' in upper or 'DEFAULT' in upper:
+            self.keywords['Weak Configurations'] += 1
+        elif 'OUT OF DATE' in upper or 'OUTDATED' in upper:
+            self.keywords['Missing Updates'] += 1
+        elif 'AUTH' in upper or 'PASSWORD' in upper:
+            self.keywords['Authentication Issues'] += 1
+
+    # -- Reads (any thread) --
+
+    def statistics(self):
+        with self.lock:
+            return {
+                'hosts': len(self.hosts),
+                'open_ports': self.open_ports,
+                'high_risk_open': self.high_risk_open,
+                'vulnerabilities': self.vulnerabilities
+            }
+
+    def security_score(self):
+        stats = self.statistics()
+        deductions = stats['high_risk_open'] * 10 + stats['vulnerabilities'] * 15
+        if stats['open_ports'] > 10:
+            deductions += (stats['open_ports'] - 10) * 2
+        return max(0, 100 - deductions)
+
+    def port_distribution(self):
+        """{"80/TCP": {'count': n, 'services': [service, ...]}} of open ports"""
+        with self.lock:
+            return {key: {'count': stats['count'], 'services': list(stats['services'])}
+                    for key, stats in self.port_stats.items()}
+
+    def service_map(self):
+        """{service: [port, ...]} of open ports"""
+        with self.lock:
+            return {service: list(ports) for service, ports in self.service_ports.items()}
+
+    def protocol_summary(self):
+        """{'TCP': {'open': n, 'filtered': n, 'closed': n, 'open|filtered': n, 'risk_score': n}, 'UDP': ...}"""
+        with self.lock:
+            summary = {}
+            for proto, states in self.protocol_states.items():
+                summary[proto] = {state: states.get(state, 0)
+                                  for state in ('open', 'filtered', 'closed', 'open|filtered')}
+                summary[proto]['risk_score'] = self.protocol_risk[proto]
+            return summary
+
+    def version_summary(self):
+        """{service: {'versions': {version: n}, 'risk_level': 1-3}} of open ports"""
+        with self.lock:
+            return {service: {'versions': dict(versions),
+                              'risk_level': max(self.service_risks[service])}
+                    for service, versions in self.service_versions.items()}
+
+    def topology(self):
+        """{host address: [open port, ...]}"""
+        with self.lock:
+            return {address: [entry.port for entry in host.ports.values() if entry.is_open]
+                    for address, host in self.hosts.items()}
+
+    def open_port_list(self):
+        """[("80/tcp", service), ...] over all hosts, in report order"""
+        with self.lock:
+            return [(f"{entry.port}/{entry.protocol}", entry.service)
+                    for host in self.hosts.values()
+                    for entry in host.ports.values() if entry.state == 'open']
+
+    def vulnerable_findings(self):
+        with self.lock:
+            return [finding for finding in self.findings if finding.vulnerable]
+
+    def vulnerability_levels(self):
+        with self.lock:
+            return dict(self.vuln_levels)
+
+    def risk_factors(self):
+        with self.lock:
+            factors = {
+                'Open High-Risk Ports': self.high_risk_confirmed,
+                'Vulnerable Services': self.vuln_levels['Critical']
+            }
+            factors.update(self.keywords)
+            return factors
+
+    def timeline(self):
+        with self.lock:
+            return list(self.events)
+
+class NmapOutputParser:
+    """Feeds nmap's normal (-oN style) output into a ScanResults, one line at a time"""
+    def __init__(self, results):
+        self.results = results
+        self.current_host = None
+        self.current_port = None
+        self.current_script = None
+        self.pending_vuln = None      # Finding waiting for its detail line
+        self.scan_date = None         # Date from "Starting Nmap ... at"
+        self.last_time = None
+
+    def feed(self, line):
+        with self.results.lock:
+            self.parse(line.rstrip('\r\n'))
+
+    def feed_lines(self, lines):
+        with self.results.lock:
+            for line in lines:
+                self.parse(line.rstrip('\r\n'))
+
+    def parse(self, line):
+        results = self.results
+        stripped = line.strip()
+        if not stripped:
+            return
+        results.count_keywords(line)
+
+        if stripped.startswith('|'):
+            self.parse_script_line(stripped)
+            return
+        self.current_script = None
+        self.pending_vuln = None
+        if stripped == 'Host script results:':
+            self.current_port = None
+            return
+
+        if line.startswith('Nmap scan report for '):
+            target = line[len('Nmap scan report for '):].strip()
+            hostname, _, address = target.rpartition(' ')
+            if hostname:
+                address = address.strip('()')
+            self.current_host = results.host(address, hostname)
+            self.current_port = None
+            return
+        if self.current_host is not None and stripped.startswith('Host is up'):
+            self.current_host.status = 'up'
+            return
+
+        match = PORT_LINE.match(stripped)
+        if match and self.current_host is not None:
+            port, protocol, state, service, version = match.groups()
+            self.current_port = results.set_port(self.current_host, port, protocol, state,
+                                                 service or 'unknown', version or '')
+            return
+
+        match = DISCOVERED_LINE.match(stripped)
+        if match:
+            state, port, protocol, address = match.groups()
+            host = results.host(address)
+            if (port, protocol) not in host.ports:
+                results.set_port(host, port, protocol, state)
+            if self.last_time:
+                results.events.append((self.last_time, 'port_discovery'))
+            return
+
+        match = STARTING_LINE.match(stripped)
+        if match:
+            try:
+                self.last_time = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M')
+                self.scan_date = self.last_time.date()
+                results.events.append((self.last_time, 'scan_start'))
+            except ValueError:
+                pass
+            return
+
+        match = INITIATING_LINE.match(stripped)
+        if match and self.scan_date:
+            try:
+                clock = datetime.strptime(match.group(1), '%H:%M').time()
+                self.last_time = datetime.combine(self.scan_date, clock)
+                results.events.append((self.last_time, 'scan_start'))
+            except ValueError:
+                pass
+
+    def parse_script_line(self, line):
+        results = self.results
+        match = SCRIPT_LINE.match(line)
+        if match and self.current_script is None:
+            # First line of a script's output block
+            self.current_script = match.group(1)
+        if 'VULNERABLE' in line.upper():
+            results.vulnerabilities += 1
+            host = self.current_host.address if self.current_host else ''
+            port = f"{self.current_port.port}/{self.current_port.protocol}" if self.current_port else ''
+            self.pending_vuln = Finding(host, port, self.current_script or '', line, vulnerable=True)
+            results.findings.append(self.pending_vuln)
+        elif self.pending_vuln is not None:
+            # The line after a VULNERABLE line says what is vulnerable
+            self.pending_vuln.detail = line
+            self.pending_vuln = None
+        if line.startswith('|_'):
+            self.current_script = None
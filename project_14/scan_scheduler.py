@@ -0,0 +1,310 @@
+"""Split a large scan into shards and run them as parallel nmap processes.
+
+A single nmap process sweeping a /16 is limited by what one process can do.
+ScanScheduler cuts the target list into shards of about hosts_per_shard
+addresses. CIDRs bigger than that are split into equal subnets, and octet
+ranges like 10.0.*.* over their last octets (10.0.0.*, 10.0.1.*, ...).
+-iL files are read and sharded the same way. It then runs one nmap per
+shard, at most `concurrency` at a time.
+
+Every shard has its own NmapOutputParser, so its host and port state cannot
+be mixed up with another shard's interleaved output. All of the parsers feed
+the one ScanResults that the app shows. Output is read with
+output_pump.read_blocks, and each block reaches on_output with a "[n] " shard
+prefix on every line. A shard that exits non-zero is queued again until it
+has been tried 1 + retries times.
+
+Each shard also writes an -oX report. Once every shard has finished,
+merged_results() loads all the reports into one fresh ScanResults. Hosts
+that were re-parsed on a retry are then counted only once.
+"""
+import ipaddress
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from collections import deque
+from itertools import product
+
+from scan_results import ScanResults, NmapOutputParser
+from nmap_xml import load_nmap_xml
+from output_pump import read_blocks
+
+PROGRESS_PATTERN = re.compile(r'About ([\d.]+)% done')
+OUTPUT_OPTIONS = ('-oN', '-oX', '-oG', '-oS', '-oA')
+
+def read_target_file(path):
+    """Target specs from an -iL file (whitespace separated, # starts a comment)"""
+    targets = []
+    with open(path) as f:
+        for line in f:
+            targets.extend(line.split('#', 1)[0].split())
+    return targets
+
+def octet_values(octet):
+    """Sorted values of one octet of an nmap range (10, 1-5, 1,3,7-9, *); None if it isn't one"""
+    values = set()
+    for part in octet.split(','):
+        if part == '*':
+            values.update(range(256))
+            continue
+        low, dash, high = part.partition('-')
+        try:
+            if dash:
+                values.update(range(int(low or 0), int(high or 255) + 1))
+            else:
+                values.add(int(low))
+        except ValueError:
+            return None  # A hostname
+    if not values or min(values) < 0 or max(values) > 255:
+        return None
+    return sorted(values)
+
+def range_octets(spec):
+    """Values of each octet of an nmap octet range like 10.0.1-5.*; None for anything else"""
+    octets = spec.split('.')
+    if len(octets) != 4:
+        return None
+    octets = [octet_values(octet) for octet in octets]
+    return None if None in octets else octets
+
+def format_octet(values):
+    """Sorted octet values back in nmap's range syntax"""
+    if len(values) == 256:
+        return '*'
+    runs = []
+    start = values[0]
+    for previous, value in zip(values, values[1:] + [None]):
+        if value != previous + 1:
+            runs.append(str(start) if start == previous else f"{start}-{previous}")
+            start = value
+    return ','.join(runs)
+
+def range_size(spec):
+    """Addresses in an nmap octet range like 10.0.1-5.*; 1 for anything else"""
+    octets = range_octets(spec)
+    if octets is None:
+        return 1
+    size = 1
+    for values in octets:
+        size *= len(values)
+    return size
+
+def split_range(octets, hosts_per_shard):
+    """(spec, address count) pieces of an octet range too big for one shard.
+    The last octets that fit in a shard stay whole; the octet before them is cut into runs"""
+    keep, size = 4, 1
+    while size * len(octets[keep - 1]) <= hosts_per_shard:
+        keep -= 1
+        size *= len(octets[keep])
+    split = octets[keep - 1]
+    step = max(1, hosts_per_shard // size)
+    tail = [format_octet(values) for values in octets[keep:]]
+    for head in product(*octets[:keep - 1]):
+        for start in range(0, len(split), step):
+            run = split[start:start + step]
+            yield '.'.join([str(value) for value in head] + [format_octet(run)] + tail), len(run) * size
+
+def expand_target(spec, hosts_per_shard):
+    """(spec, address count) pieces of one target; big CIDRs and octet ranges become shard-sized pieces"""
+    try:
+        network = ipaddress.ip_network(spec, strict=False)
+    except ValueError:
+        size = range_size(spec)
+        if size <= hosts_per_shard:
+            return [(spec, size)]
+        return split_range(range_octets(spec), hosts_per_shard)
+    if network.num_addresses <= hosts_per_shard:
+        return [(spec, network.num_addresses)]
+    new_prefix = network.max_prefixlen - (hosts_per_shard.bit_length() - 1)
+    return ((str(subnet), subnet.num_addresses) for subnet in network.subnets(new_prefix=new_prefix))
+
+def split_targets(targets, hosts_per_shard=256):
+    """Pack target specs into shards of at most about hosts_per_shard addresses"""
+    hosts_per_shard = max(1, int(hosts_per_shard))
+    shards, current, size = [], [], 0
+    for spec in targets:
+        for piece, count in expand_target(spec, hosts_per_shard):
+            if current and size + count > hosts_per_shard:
+                shards.append(current)
+                current, size = [], 0
+            current.append(piece)
+            size += count
+    if current:
+        shards.append(current)
+    return shards
+
+class ScanShard:
+    """One nmap process's share of the targets and how it is doing"""
+    def __init__(self, index, targets):
+        self.index = index
+        self.targets = targets
+        self.state = 'queued'  # queued, running, retrying, done, failed, stopped
+        self.attempts = 0
+        self.progress = 0.0
+        self.hosts = 0
+        self.return_code = None
+        self.error = ''
+        self.xml_path = None
+        self.xml_temp = False
+
+    def describe_targets(self):
+        if len(self.targets) <= 2:
+            return ' '.join(self.targets)
+        return f"{self.targets[0]} ... {self.targets[-1]} ({len(self.targets)} targets)"
+
+class ScanScheduler:
+    def __init__(self, base_parts, target_shards, results, concurrency=4, retries=1,
+                 on_output=None, startupinfo=None):
+        self.base_parts = list(base_parts)
+        self.shards = [ScanShard(index, targets) for index, targets in enumerate(target_shards)]
+        self.results = results
+        self.concurrency = max(1, min(int(concurrency), len(self.shards)))
+        self.retries = max(0, int(retries))
+        self.on_output = on_output or (lambda block: None)
+        self.startupinfo = startupinfo
+        self.lock = threading.Lock()
+        self.pending = deque(self.shards)
+        self.processes = set()
+        self.threads = []
+        self.stopped = False
+
+    def start(self):
+        for _ in range(self.concurrency):
+            thread = threading.Thread(target=self.worker)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def wait(self):
+        for thread in self.threads:
+            thread.join()
+
+    def stop(self):
+        """Stop handing out shards and terminate the running ones"""
+        with self.lock:
+            self.stopped = True
+            processes = list(self.processes)
+        for process in processes:
+            try:
+                process.terminate()
+            except:
+                pass
+
+    def worker(self):
+        while True:
+            with self.lock:
+                if self.stopped or not self.pending:
+                    return
+                shard = self.pending.popleft()
+            try:
+                self.run_shard(shard)
+            except Exception as e:
+                shard.error = str(e)
+                self.on_output(f"[{shard.index + 1}] Error: {shard.error}\n")
+                self.finish_shard(shard, None)
+
+    def shard_command(self, shard):
+        """nmap arguments for a shard; output files get the shard number added"""
+        parts = []
+        xml_path = None
+        options = iter(self.base_parts)
+        for part in options:
+            parts.append(part)
+            if part in OUTPUT_OPTIONS:
+                path = next(options, None)
+                if path is None:
+                    break
+                if path.strip('"') != '-':
+                    root, ext = os.path.splitext(path.strip('"'))
+                    path = f"{root}.{shard.index + 1}{ext}"
+                    if part == '-oX':
+                        xml_path = path
+                    elif part == '-oA':
+                        xml_path = path + '.xml'
+                parts.append(path)
+        if xml_path:
+            shard.xml_path, shard.xml_temp = xml_path, False
+        elif shard.xml_path is None:
+            fd, shard.xml_path = tempfile.mkstemp(prefix=f'nmap_shard{shard.index + 1}_', suffix='.xml')
+            os.close(fd)
+            shard.xml_temp = True
+        if not xml_path:
+            parts.extend(['-oX', shard.xml_path])
+        return parts + shard.targets
+
+    def run_shard(self, shard):
+        shard.attempts += 1
+        shard.state = 'running'
+        shard.progress = 0.0
+        shard.hosts = 0
+        process = subprocess.Popen(
+            self.shard_command(shard),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            startupinfo=self.startupinfo
+        )
+        with self.lock:
+            self.processes.add(process)
+            if self.stopped:
+                process.terminate()
+        parser = NmapOutputParser(self.results)
+        prefix = f"[{shard.index + 1}] "
+        try:
+            for block in read_blocks(process.stdout, lambda: self.stopped):
+                lines = block.splitlines(True)
+                parser.feed_lines(lines)
+                for line in lines:
+                    if line.startswith('Nmap scan report for'):
+                        shard.hosts += 1
+                    else:
+                        match = PROGRESS_PATTERN.search(line)
+                        if match:
+                            shard.progress = float(match.group(1))
+                self.on_output(''.join(prefix + line for line in lines))
+            return_code = process.wait()
+        finally:
+            process.stdout.close()
+            with self.lock:
+                self.processes.discard(process)
+        self.finish_shard(shard, return_code)
+
+    def finish_shard(self, shard, return_code):
+        shard.return_code = return_code
+        with self.lock:
+            if self.stopped:
+                shard.state = 'stopped'
+            elif return_code == 0:
+                shard.state = 'done'
+                shard.progress = 100.0
+            elif shard.attempts <= self.retries:
+                shard.state = 'retrying'
+                self.pending.append(shard)
+            else:
+                shard.state = 'failed'
+        if shard.state == 'retrying':
+            self.on_output(f"[{shard.index + 1}] Shard failed (return code {return_code}), retrying\n")
+
+    def failed_shards(self):
+        return [shard for shard in self.shards if shard.state != 'done']
+
+    def overall_progress(self):
+        return sum(shard.progress for shard in self.shards) / len(self.shards)
+
+    def merged_results(self):
+        """All shard XML reports in one ScanResults; None unless every shard finished"""
+        if self.failed_shards():
+            return None
+        merged = ScanResults()
+        for shard in self.shards:
+            load_nmap_xml(shard.xml_path, merged)
+        return merged
+
+    def cleanup(self):
+        for shard in self.shards:
+            if shard.xml_temp:
+                try:
+                    os.remove(shard.xml_path)
+                except:
+                    pass